@@ -1,5 +1,14 @@
 from django.contrib import admin
 
-from .models import User
+from .models import OutgoingEmail, User
 
-admin.site.register(User)
\ No newline at end of file
+
+class OutgoingEmailAdmin(admin.ModelAdmin):
+    # the body holds the OTP code
+    exclude = ('body',)
+    list_display = ('id', 'to_email', 'subject', 'status', 'attempts', 'created_at', 'sent_at')
+    list_filter = ('status',)
+
+
+admin.site.register(User)
+admin.site.register(OutgoingEmail, OutgoingEmailAdmin)
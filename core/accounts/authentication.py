@@ -0,0 +1,158 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from core.caches import is_shared
+
+USER_VERSION_KEY = 'auth:version:user:{}'
+USER_KEY = 'auth:user:{}:{}'
+
+# seconds a resolved user is kept in the shared cache, and in the per-process LRU.
+# Other processes see a change after at most AUTH_USER_LOCAL_TTL seconds.
+SHARED_TTL = getattr(settings, 'AUTH_USER_CACHE_TTL', 300)
+LOCAL_TTL = getattr(settings, 'AUTH_USER_LOCAL_TTL', 5)
+LOCAL_SIZE = getattr(settings, 'AUTH_USER_LOCAL_SIZE', 1024)
+
+
+def get_cache():
+    return caches[getattr(settings, 'AUTH_USER_CACHE_ALIAS', 'default')]
+
+
+def is_enabled():
+    """
+    The shared tier is only used with a cache shared by all web processes: invalidate_users()
+    bumps the version in its own process only, the other workers of a per process memory
+    cache would keep a changed (e.g. deactivated) user for AUTH_USER_CACHE_TTL.
+    Without it users come from the local LRU, then the database.
+    """
+    return is_shared(getattr(settings, 'AUTH_USER_CACHE_ALIAS', 'default'))
+
+
+class _LocalUsers:
+    """
+    per-process LRU of user_id -> (user, expires at), thread safe
+    """
+    def __init__(self, size):
+        self.size = size
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None:
+                return None
+            if entry[1] < time.monotonic():
+                del self._users[user_id]
+                return None
+            self._users.move_to_end(user_id)
+            return entry[0]
+
+    def put(self, user_id, user, ttl):
+        with self._lock:
+            self._users[user_id] = (user, time.monotonic() + ttl)
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.size:
+                self._users.popitem(last=False)
+
+    def discard(self, user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._users.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+
+
+local_users = _LocalUsers(LOCAL_SIZE)
+
+
+def _version(cache, user_id):
+    key = USER_VERSION_KEY.format(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def invalidate_users(user_ids):
+    """
+    Drop cached users: bump their version in the shared cache (entries of the
+    old version are never read again, is_enabled()) and forget them in this process.
+    Called after commit from the User signals, and directly after queryset.update().
+    """
+    user_ids = set(user_ids)
+    if is_enabled():
+        cache = get_cache()
+        for user_id in user_ids:
+            key = USER_VERSION_KEY.format(user_id)
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.add(key, time.time_ns(), timeout=None)
+    local_users.discard(user_ids)
+
+
+def _load_user(user_id):
+    return get_user_model().objects.get(**{api_settings.USER_ID_FIELD: user_id})
+
+
+def resolve_user(user_id):
+    """
+    The user by primary key: per-process LRU, then the shared cache under the
+    user's current version (is_enabled()), then the database. Returns a private
+    copy, callers may modify it. Raises User.DoesNotExist.
+    """
+    user = local_users.get(user_id)
+    if user is None:
+        if is_enabled():
+            cache = get_cache()
+            key = USER_KEY.format(user_id, _version(cache, user_id))
+            user = cache.get(key)
+            if user is None:
+                user = _load_user(user_id)
+                cache.set(key, user, SHARED_TTL)
+        else:
+            user = _load_user(user_id)
+        local_users.put(user_id, user, LOCAL_TTL)
+    return copy.copy(user)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication without the per request SELECT on the user table.
+    The user comes from resolve_user(), the token checks are the same as
+    simplejwt's: unknown user, inactive user (CHECK_USER_IS_ACTIVE) and changed
+    password (CHECK_REVOKE_TOKEN) are rejected.
+    """
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        try:
+            user = resolve_user(user_id)
+        except self.user_model.DoesNotExist:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        return user
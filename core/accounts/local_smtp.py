@@ -0,0 +1,157 @@
+"""
+Local SMTP stand-in for development and benchmarks, never for production.
+
+Speaks enough ESMTP for Django's SMTP backend (EHLO, AUTH PLAIN, MAIL, RCPT, DATA,
+RSET, NOOP, QUIT, no STARTTLS: run with EMAIL_USE_TLS=False) and keeps the
+received messages in memory. Handshake and per message latency and failures
+are injected per SMTPBehaviour.
+"""
+import logging
+import random
+import socketserver
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+
+class SMTPBehaviour:
+    """
+    connect_latency: seconds before the greeting (stands in for TCP + TLS handshake and login)
+    message_latency: seconds to accept one message
+    failure_rate: share of recipients answered with 451 (temporary, retried)
+    reject_rate: share of recipients answered with 550 (permanent)
+    messages_per_connection: messages accepted per session before 421 and hang up, 0 = no limit
+    """
+    def __init__(self, connect_latency=0.0, message_latency=0.0, failure_rate=0.0, reject_rate=0.0,
+                 messages_per_connection=0, seed=None):
+        self.connect_latency = connect_latency
+        self.message_latency = message_latency
+        self.failure_rate = failure_rate
+        self.reject_rate = reject_rate
+        self.messages_per_connection = messages_per_connection
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def chance(self, rate):
+        with self._lock:
+            return rate > 0 and self.random.random() < rate
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def _reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        server = self.server.smtp
+        behaviour = server.behaviour
+        server.count('connections')
+        if behaviour.connect_latency:
+            time.sleep(behaviour.connect_latency)
+        self._reply('220 localhost ESMTP local stand-in')
+        mail_from, recipients, accepted = None, [], 0
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command, _, argument = line.decode('utf-8', 'replace').strip().partition(' ')
+            command = command.upper()
+            if command == 'EHLO':
+                self.wfile.write(b'250-localhost\r\n250-8BITMIME\r\n250-SIZE 10485760\r\n250 AUTH PLAIN\r\n')
+            elif command == 'HELO':
+                self._reply('250 localhost')
+            elif command == 'AUTH':
+                self._reply('235 2.7.0 Authentication successful')
+            elif command == 'MAIL':
+                if behaviour.messages_per_connection and accepted >= behaviour.messages_per_connection:
+                    server.count('sessions_closed')
+                    self._reply('421 4.7.0 Too many messages for this session')
+                    return
+                mail_from, recipients = argument, []
+                self._reply('250 2.1.0 OK')
+            elif command == 'RCPT':
+                if behaviour.chance(behaviour.reject_rate):
+                    server.count('rejected')
+                    self._reply('550 5.1.1 Mailbox unavailable (injected)')
+                elif behaviour.chance(behaviour.failure_rate):
+                    server.count('deferred')
+                    self._reply('451 4.3.0 Try again later (injected)')
+                else:
+                    recipients.append(argument)
+                    self._reply('250 2.1.5 OK')
+            elif command == 'DATA':
+                self._reply('354 End data with <CR><LF>.<CR><LF>')
+                data = []
+                while True:
+                    line = self.rfile.readline()
+                    if not line or line in (b'.\r\n', b'.\n'):
+                        break
+                    data.append(line)
+                if behaviour.message_latency:
+                    time.sleep(behaviour.message_latency)
+                server.received(mail_from, recipients, b''.join(data))
+                accepted += 1
+                self._reply('250 2.0.0 Queued')
+            elif command == 'RSET':
+                mail_from, recipients = None, []
+                self._reply('250 2.0.0 OK')
+            elif command == 'NOOP':
+                self._reply('250 2.0.0 OK')
+            elif command == 'QUIT':
+                self._reply('221 2.0.0 Bye')
+                return
+            else:
+                self._reply('502 5.5.2 Command not implemented')
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+
+class LocalSMTPServer:
+    """
+    The stand-in server, run in a background thread:
+
+        smtp = LocalSMTPServer(behaviour=SMTPBehaviour(connect_latency=0.2)).start()
+        settings.EMAIL_HOST, settings.EMAIL_PORT = smtp.host, smtp.port
+        ...
+        smtp.stop()
+    """
+    def __init__(self, host='127.0.0.1', port=0, behaviour=None):
+        self.behaviour = behaviour or SMTPBehaviour()
+        self.counters = Counter()
+        self.messages = []
+        self._lock = threading.Lock()
+        self._server = _Server((host, port), _Handler)
+        self._server.smtp = self
+        self._thread = None
+
+    @property
+    def host(self):
+        return self._server.server_address[0]
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='local-smtp', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def received(self, mail_from, recipients, data):
+        with self._lock:
+            self.counters['messages'] += 1
+            self.messages.append((mail_from, recipients, data))
+        logger.debug("local smtp: message from %s to %s", mail_from, recipients)
@@ -0,0 +1,81 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts.authentication import CachedJWTAuthentication, local_users
+from accounts.models import User
+from accounts.views import ProfileView
+from core.benchmarks import temporary_database, timed
+from core.latency import format_summary, summarize
+from device.models import Device
+from device.views import DeviceDetailAPIView, DeviceListCreateView
+from payments.models import Payment
+from payments.views import PaymentsListView
+
+
+class Command(BaseCommand):
+    help = ("Queries per request of polling style authenticated GETs (device detail / list, payments, "
+            "profile) with simplejwt's JWTAuthentication and with CachedJWTAuthentication, "
+            "on a throwaway database.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--rounds', type=int, default=20, help="polls of every endpoint per user")
+
+    def handle(self, *args, **options):
+        with temporary_database(), override_settings(DEBUG=True, ALLOWED_HOSTS=['testserver']):
+            users = User.objects.bulk_create(
+                User(email=f'bench{i}@example.com', password='!', is_email_verified=True)
+                for i in range(options['users']))
+            devices = Device.objects.bulk_create(
+                Device(owner=user, name=f'device {i}', imei=str(10**14 + i), price=Decimal('100.00'))
+                for i, user in enumerate(users))
+            Payment.objects.bulk_create(
+                Payment(user=user, device=device, amount=Decimal('15.00')) for user, device in zip(users, devices))
+            clients = [(user, device, f'Bearer {AccessToken.for_user(user)}') for user, device in zip(users, devices)]
+
+            for authentication in (JWTAuthentication, CachedJWTAuthentication):
+                caches['default'].clear()
+                local_users.clear()
+                self._run(authentication, clients, options['rounds'])
+
+    def _run(self, authentication, clients, rounds):
+        views = {
+            'device detail': DeviceDetailAPIView,
+            'device list': DeviceListCreateView,
+            'payments list': PaymentsListView,
+            'profile': ProfileView,
+        }
+        views = {name: view.as_view(authentication_classes=[authentication], throttle_classes=[])
+                 for name, view in views.items()}
+        factory = RequestFactory()
+        queries, user_queries, latency = defaultdict(list), defaultdict(int), defaultdict(list)
+        for _ in range(rounds):
+            for user, device, header in clients:
+                for name, view in views.items():
+                    path, kwargs = ('/api/v1/device/', {})
+                    if name == 'device detail':
+                        path, kwargs = f'/api/v1/device/{device.pk}/', {'pk': device.pk}
+                    request = factory.get(path, HTTP_AUTHORIZATION=header)
+                    with CaptureQueriesContext(connection) as captured:
+                        response, elapsed = timed(view, request, **kwargs)
+                    assert response.status_code == 200, (name, response.status_code)
+                    queries[name].append(len(captured))
+                    user_queries[name] += sum('FROM "accounts_user"' in q['sql'] for q in captured.captured_queries)
+                    latency[name].append(elapsed)
+
+        self.stdout.write(f"{authentication.__name__}:")
+        total = sum(len(counts) for counts in queries.values())
+        for name, counts in queries.items():
+            self.stdout.write(f"  {name + ':':<15} {sum(counts) / len(counts):5.2f} queries/request "
+                              f"({user_queries[name] / len(counts):.2f} on the user table)  "
+                              f"{format_summary(summarize(latency[name]))}")
+        self.stdout.write(f"  {'all:':<15} {sum(map(sum, queries.values())) / total:5.2f} queries/request "
+                          f"over {total:,} requests")
@@ -0,0 +1,100 @@
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.db.models import Count
+from django.test import RequestFactory, override_settings
+
+from accounts import outbox
+from accounts.local_smtp import LocalSMTPServer, SMTPBehaviour
+from accounts.models import OutgoingEmail
+from accounts.views import RegisterView
+from core.benchmarks import temporary_database
+from core.latency import format_summary, summarize
+from .run_local_smtp import add_behaviour_arguments
+
+
+class Command(BaseCommand):
+    help = ("Compare registration with the OTP mail sent inside the request (inline) and queued in the "
+            "outbox, against the local SMTP stand-in, on a throwaway database. Password hashing is "
+            "swapped for a fast hasher so the mail path dominates.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--registrations', type=int, default=200, help="registrations per mode")
+        parser.add_argument('--concurrency', type=int, default=8, help="requests in flight at once")
+        parser.add_argument('--pool-size', type=int, default=2, help="pooled SMTP connections (queued mode)")
+        add_behaviour_arguments(parser)
+        parser.set_defaults(connect_latency=0.1, message_latency=0.01)
+
+    def handle(self, *args, **options):
+        behaviour = SMTPBehaviour(
+            connect_latency=options['connect_latency'], message_latency=options['message_latency'],
+            failure_rate=options['failure_rate'], reject_rate=options['reject_rate'],
+            messages_per_connection=options['messages_per_connection'])
+        smtp = LocalSMTPServer(behaviour=behaviour).start()
+        try:
+            with temporary_database(file_backed=True), override_settings(
+                    EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+                    EMAIL_HOST=smtp.host, EMAIL_PORT=smtp.port, EMAIL_USE_TLS=False, EMAIL_USE_SSL=False,
+                    EMAIL_HOST_USER='', EMAIL_HOST_PASSWORD='', DEFAULT_FROM_EMAIL='noreply@example.com',
+                    EMAIL_POOL_SIZE=options['pool_size'], EMAIL_OUTBOX_INLINE=True,
+                    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher']):
+                for mode in ('inline', 'queued'):
+                    self._run(mode, smtp, options)
+        finally:
+            outbox.reset_pool()
+            smtp.stop()
+
+    def _run(self, mode, smtp, options):
+        smtp.counters.clear()
+        outbox.reset_pool()
+        view = RegisterView.as_view(throttle_classes=[])
+        factory = RequestFactory()
+        results = []
+        lock = threading.Lock()
+
+        def register(i):
+            request = factory.post('/api/v1/accounts/register/',
+                                   {'email': f'{mode}{i}@example.com', 'password': 'secret123'},
+                                   content_type='application/json')
+            started = time.perf_counter()
+            try:
+                code = view(request).status_code
+            except Exception:
+                # inline: the SMTP error escapes the view, a 500 for the client
+                code = 500
+            finally:
+                close_old_connections()
+            with lock:
+                results.append((code, time.perf_counter() - started))
+
+        with override_settings(EMAIL_OUTBOX_ENABLED=mode == 'queued'):
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+                list(pool.map(register, range(options['registrations'])))
+            elapsed = time.perf_counter() - started
+
+            ok = [seconds for code, seconds in results if code == 201]
+            self.stdout.write(f"{mode}:")
+            self.stdout.write(f"  register:  {len(ok):,}/{len(results):,} ok in {elapsed:.2f}s = "
+                              f"{len(results) / elapsed:,.1f}/s  {format_summary(summarize(ok))}")
+            if len(ok) < len(results):
+                self.stdout.write(f"  errors:    {Counter(code for code, _ in results if code != 201)}")
+            if mode == 'queued':
+                # the background drain delivers after the responses went out
+                unsent = OutgoingEmail.objects.filter(
+                    status__in=[OutgoingEmail.STATUS_PENDING, OutgoingEmail.STATUS_SENDING])
+                deadline = time.monotonic() + 120
+                while unsent.exists() and time.monotonic() < deadline:
+                    time.sleep(0.02)
+                # drains queued by the last commits, before the database goes away
+                outbox.background_drain.wait()
+                delivered = time.perf_counter() - started
+                self.stdout.write(f"  delivered: {smtp.counters['messages']:,} mails {delivered:.2f}s after the "
+                                  f"first request = {smtp.counters['messages'] / delivered:,.1f}/s")
+                by_status = dict(OutgoingEmail.objects.order_by().values_list('status').annotate(Count('id')))
+                self.stdout.write(f"  outbox:    {by_status}  pool: {dict(outbox.get_pool().counters)}")
+            self.stdout.write(f"  smtp:      {dict(smtp.counters)}")
@@ -0,0 +1,100 @@
+import time
+import uuid
+from datetime import timedelta
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.db import connection, reset_queries
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework_simplejwt import tokens
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.views import TokenRefreshView
+
+from accounts.authentication import local_users
+from accounts.models import User
+from accounts.token_blacklist import PRUNE_BATCH_SIZE, prune_expired_tokens
+from accounts.tokens import RefreshToken
+from core.benchmarks import temporary_database, timed
+from core.latency import format_summary, summarize
+from core.local_redis import LocalRedisServer
+
+MODES = {
+    # simplejwt's blacklist app: a row per issued token, two more per rotation
+    'database': (tokens.RefreshToken, 'rest_framework_simplejwt.serializers.TokenRefreshSerializer'),
+    'cache': (RefreshToken, 'accounts.serializers.TokenRefreshSerializer'),
+}
+
+
+class Command(BaseCommand):
+    help = ("Token refresh latency and queries with simplejwt's database blacklist and with the cache "
+            "blacklist, against token tables pre-filled to each --sizes row count (a third expired, "
+            "most blacklisted), then the time prune_expired_tokens needs. Runs on a throwaway database, "
+            "the cache blacklist on the local Redis stand-in (it needs a shared cache).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='0,50000,200000',
+                            help="comma separated OutstandingToken row counts to pre-fill")
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--refreshes', type=int, default=300, help="refresh requests per mode and size")
+        parser.add_argument('--batch-size', type=int, default=PRUNE_BATCH_SIZE, help="prune chunk size")
+
+    def handle(self, *args, **options):
+        redis = LocalRedisServer().start()
+        try:
+            with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+                                                       'LOCATION': redis.url}}):
+                self._sizes(options)
+        finally:
+            redis.stop()
+
+    def _sizes(self, options):
+        for size in (int(size) for size in options['sizes'].split(',')):
+            with temporary_database(file_backed=True):
+                users = User.objects.bulk_create(
+                    User(email=f'bench{i}@example.com', password='!', is_email_verified=True)
+                    for i in range(options['users']))
+                self._fill(users, size)
+                self.stdout.write(f"{size:,} outstanding tokens:")
+                for mode in MODES:
+                    self._run(mode, users, options['refreshes'])
+                started = time.perf_counter()
+                outstanding, blacklisted = prune_expired_tokens(options['batch_size'])
+                self.stdout.write(f"  prune:    {outstanding:,} outstanding and {blacklisted:,} blacklisted rows "
+                                  f"in {time.perf_counter() - started:.2f}s, "
+                                  f"{OutstandingToken.objects.count():,} left")
+
+    def _fill(self, users, size, chunk=10000):
+        now = timezone.now()
+        body = 'x' * 300  # about the length of an encoded refresh token
+        for start in range(0, size, chunk):
+            rows = OutstandingToken.objects.bulk_create(
+                OutstandingToken(
+                    user=users[i % len(users)], jti=uuid.uuid4().hex, token=body, created_at=now,
+                    expires_at=now + (timedelta(days=-1) if i % 3 == 0 else timedelta(days=1)))
+                for i in range(start, min(start + chunk, size)))
+            BlacklistedToken.objects.bulk_create(
+                BlacklistedToken(token=row) for i, row in enumerate(rows, start) if i % 10)
+
+    def _run(self, mode, users, refreshes):
+        token_class, serializer = MODES[mode]
+        caches['default'].clear()
+        local_users.clear()
+        view = TokenRefreshView.as_view(throttle_classes=[], _serializer_class=serializer)
+        factory = RequestFactory()
+        chains = [str(token_class.for_user(user)) for user in users]
+        before = OutstandingToken.objects.count()
+        latency, queries = [], 0
+        for i in range(refreshes):
+            request = factory.post('/api/v1/accounts/token/refresh/', {'refresh': chains[i % len(chains)]},
+                                   content_type='application/json')
+            reset_queries()
+            with CaptureQueriesContext(connection) as captured:
+                response, elapsed = timed(view, request)
+            assert response.status_code == 200, (mode, response.status_code, response.data)
+            chains[i % len(chains)] = response.data['refresh']
+            latency.append(elapsed)
+            queries += len(captured)
+        self.stdout.write(f"  {mode + ':':<9} {queries / refreshes:5.2f} queries/refresh, "
+                          f"{OutstandingToken.objects.count() - before:+,} rows  {format_summary(summarize(latency))}")
@@ -0,0 +1,73 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from accounts.outbox import OUTBOX_BATCH_SIZE, drain_outbox, get_pool, purge_emails
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = ("Worker pool sending the queued emails (OutgoingEmail outbox) over pooled SMTP connections. "
+            "Runs until interrupted, or until nothing is due with --once.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=getattr(settings, 'EMAIL_POOL_SIZE', 2),
+                            help="concurrent SMTP connections")
+        parser.add_argument('--batch-size', type=int, default=OUTBOX_BATCH_SIZE,
+                            help="emails sent over one connection per claim")
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help="seconds an idle worker waits before checking the outbox again")
+        parser.add_argument('--once', action='store_true', help="exit when nothing is due")
+        parser.add_argument('--purge-days', type=int, default=None,
+                            help="first delete sent / failed emails older than this many days")
+
+    def handle(self, *args, **options):
+        if options['purge_days'] is not None:
+            self.stdout.write(f"purged {purge_emails(options['purge_days']):,} emails")
+
+        stop = threading.Event()
+        handled = []
+
+        def work():
+            count = 0
+            try:
+                while not stop.is_set():
+                    try:
+                        done = drain_outbox(options['batch_size'])
+                    except Exception:
+                        # database gone / locked: the claim rolled back, try again after a pause
+                        logger.exception("Email outbox drain failed")
+                        close_old_connections()
+                        stop.wait(options['poll_interval'])
+                        continue
+                    count += done
+                    if not done:
+                        if options['once']:
+                            break
+                        stop.wait(options['poll_interval'])
+            finally:
+                handled.append(count)
+                close_old_connections()
+
+        threads = [threading.Thread(target=work, name=f'email-worker-{i}', daemon=True)
+                   for i in range(options['workers'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        try:
+            while any(thread.is_alive() for thread in threads):
+                for thread in threads:
+                    thread.join(timeout=0.5)
+        except KeyboardInterrupt:
+            stop.set()
+            for thread in threads:
+                thread.join()
+        finally:
+            get_pool().close_all()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f"handled {sum(handled):,} emails in {elapsed:.2f}s with {options['workers']} workers")
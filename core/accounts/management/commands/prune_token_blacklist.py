@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from accounts.token_blacklist import PRUNE_BATCH_SIZE, prune_expired_tokens
+
+
+class Command(BaseCommand):
+    help = ("Delete expired rows from simplejwt's OutstandingToken / BlacklistedToken tables in chunks, "
+            "instead of flushexpiredtokens' single delete. Run it from cron, or keep it running with --interval.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=PRUNE_BATCH_SIZE, help="rows deleted per transaction")
+        parser.add_argument('--interval', type=float, default=None,
+                            help="repeat every this many seconds instead of a single run")
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            outstanding, blacklisted = prune_expired_tokens(options['batch_size'])
+            self.stdout.write(f"deleted {outstanding:,} expired outstanding tokens and {blacklisted:,} "
+                              f"blacklist entries in {time.perf_counter() - started:.2f}s")
+            if options['interval'] is None:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from accounts.local_smtp import LocalSMTPServer, SMTPBehaviour
+
+
+def add_behaviour_arguments(parser):
+    parser.add_argument('--connect-latency', type=float, default=0.0,
+                        help="seconds before the greeting (handshake and login cost)")
+    parser.add_argument('--message-latency', type=float, default=0.0, help="seconds to accept one message")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="share of recipients answered with 451")
+    parser.add_argument('--reject-rate', type=float, default=0.0, help="share of recipients answered with 550")
+    parser.add_argument('--messages-per-connection', type=int, default=0,
+                        help="messages per session before the server hangs up, 0 = no limit")
+
+
+def behaviour_from_options(options):
+    return SMTPBehaviour(
+        connect_latency=options['connect_latency'], message_latency=options['message_latency'],
+        failure_rate=options['failure_rate'], reject_rate=options['reject_rate'],
+        messages_per_connection=options['messages_per_connection'])
+
+
+class Command(BaseCommand):
+    help = ("Run the local SMTP stand-in (accounts/local_smtp.py) for development. "
+            "Set EMAIL_HOST / EMAIL_PORT to the printed address and EMAIL_USE_TLS=False.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8025)
+        add_behaviour_arguments(parser)
+
+    def handle(self, *args, **options):
+        smtp = LocalSMTPServer(host=options['host'], port=options['port'],
+                               behaviour=behaviour_from_options(options)).start()
+        self.stdout.write(f"EMAIL_HOST={smtp.host}")
+        self.stdout.write(f"EMAIL_PORT={smtp.port}")
+        try:
+            while True:
+                time.sleep(60)
+                self.stdout.write(str(dict(smtp.counters)))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            smtp.stop()
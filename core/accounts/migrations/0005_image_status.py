@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 09:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_alter_user_is_email_verified'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='image_status',
+            field=models.CharField(blank=True, choices=[('pending', 'Pending'), ('ready', 'Ready'), ('failed', 'Failed')], max_length=10, null=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.4 on 2026-10-18 10:36
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_outgoing_email'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='user',
+            name='otp',
+        ),
+    ]
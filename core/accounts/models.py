@@ -1,6 +1,8 @@
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseUserManager
 from django.db import models
+from django.utils import timezone
 from cloudinary.models import CloudinaryField
+from core.uploads import IMAGE_STATUS_CHOICES
 
 class CustomUserManager(BaseUserManager):
     def create_user(self, email, password=None, **extra_fields):
@@ -34,7 +36,7 @@ class User(AbstractBaseUser, PermissionsMixin):
     phone = models.CharField(max_length=15, blank=True, null=True)
     address = models.TextField(blank=True, null=True)
     image = CloudinaryField('profile_image', blank=True, null=True)
-    otp = models.CharField(max_length=6, blank=True, null=True) # otp expire feature will be implemented later
+    image_status = models.CharField(max_length=10, choices=IMAGE_STATUS_CHOICES, blank=True, null=True) # set while an upload is staged/processed
     is_email_verified = models.BooleanField(default=False, db_index=True)
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
@@ -46,3 +48,58 @@ class User(AbstractBaseUser, PermissionsMixin):
     REQUIRED_FIELDS = []  
     def __str__(self):
         return self.email
+
+
+class OutgoingEmail(models.Model):
+    """
+    Outbox of emails (OTP codes) the request only queues, accounts/outbox.py sends them
+    in the background over pooled SMTP connections.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_SENDING = 'sending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_SENDING, 'Sending'),
+        (STATUS_SENT, 'Sent'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    to_email = models.EmailField()
+    subject = models.CharField(max_length=255)
+    body = models.TextField(blank=True, default='')  # holds the OTP: cleared once sent or given up, not in the admin
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # next retry while pending, end of the worker's lease while sending
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            # the queue: only unsent rows, by due time
+            models.Index(fields=['next_attempt_at', 'id'], condition=models.Q(status__in=['pending', 'sending']),
+                         name='outgoing_email_due_idx'),
+            models.Index(fields=['status', 'created_at'], name='outgoing_email_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"OutgoingEmail#{self.id} to={self.to_email} - {self.status}"
+
+
+class OTPCode(models.Model):
+    """
+    OTP codes of DatabaseOTPStore (accounts/otp_store.py), used when the cache is not
+    shared by all web processes. Only an HMAC of the code is stored.
+    """
+    email = models.EmailField(unique=True)
+    code_hash = models.CharField(max_length=64)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"OTPCode for {self.email}"
@@ -2,6 +2,8 @@ from abc import ABC, abstractmethod
 from django.core.mail import send_mail
 from django.conf import settings
 
+from .outbox import enqueue_email
+
 class OTPAdapter(ABC):
     @abstractmethod
     def send_otp(self, user, otp):
@@ -9,9 +11,17 @@ class OTPAdapter(ABC):
         pass
 
 class EmailOTPAdapter(OTPAdapter):
+    """
+    The mail is queued in the OutgoingEmail outbox and sent in the background (accounts/outbox.py),
+    a slow or failing SMTP server no longer holds up the request.
+    EMAIL_OUTBOX_ENABLED=False sends it inside the request instead.
+    """
     def send_otp(self, user, otp):
         subject = "Your OTP Code"
         message = f"Hello {user.first_name or user.email},\n\nYour OTP code is: {otp}"
+        if getattr(settings, 'EMAIL_OUTBOX_ENABLED', True):
+            enqueue_email(user.email, subject, message)
+            return
         send_mail(
             subject,
             message,
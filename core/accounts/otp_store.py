@@ -0,0 +1,147 @@
+import hashlib
+import hmac
+from abc import ABC, abstractmethod
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db.models import F
+from django.dispatch import receiver
+from django.utils import timezone
+
+from core.caches import is_shared
+from .models import OTPCode
+from .utils import generate_otp
+
+# seconds an OTP stays valid, and wrong guesses allowed before it is discarded
+OTP_TTL = getattr(settings, 'OTP_TTL', 10 * 60)
+OTP_MAX_ATTEMPTS = getattr(settings, 'OTP_MAX_ATTEMPTS', 5)
+
+VALID = 'valid'
+INVALID = 'invalid'
+EXPIRED = 'expired'  # never issued, timed out or already used
+LOCKED = 'locked'  # too many wrong guesses
+
+
+def _digest(email, code):
+    message = f'{email}:{code}'.encode()
+    return hmac.new(settings.SECRET_KEY.encode(), message, hashlib.sha256).hexdigest()
+
+
+class OTPStore(ABC):
+    @abstractmethod
+    def issue(self, email):
+        """Create a new OTP for the email, replacing any previous one. Returns the code"""
+
+    @abstractmethod
+    def verify(self, email, code):
+        """VALID (the code is used up), INVALID, EXPIRED or LOCKED"""
+
+
+class CacheOTPStore(OTPStore):
+    """
+    OTPs in the Django cache (Redis in production), never in the database.
+    Only an HMAC of the code is stored, with a TTL. Every verify increments an
+    attempt counter, the code is discarded after OTP_MAX_ATTEMPTS wrong guesses.
+    A correct code is deleted, a second verify with it fails.
+    The cache must be shared by all web processes (REDIS_URL), see get_otp_store().
+    """
+    def __init__(self, alias=None, ttl=None, max_attempts=None):
+        self.cache = caches[alias or getattr(settings, 'OTP_CACHE_ALIAS', 'default')]
+        self.ttl = ttl or OTP_TTL
+        self.max_attempts = max_attempts or OTP_MAX_ATTEMPTS
+
+    @staticmethod
+    def _keys(email):
+        digest = hashlib.sha256(email.encode()).hexdigest()
+        return f'otp:code:{digest}', f'otp:attempts:{digest}'
+
+    def issue(self, email):
+        code = generate_otp()
+        code_key, attempts_key = self._keys(email)
+        self.cache.set_many({code_key: _digest(email, code), attempts_key: 0}, timeout=self.ttl)
+        return code
+
+    def verify(self, email, code):
+        code_key, attempts_key = self._keys(email)
+        try:
+            # atomic on Redis: concurrent guesses each use up an attempt
+            attempts = self.cache.incr(attempts_key)
+        except ValueError:
+            return EXPIRED
+        expected = self.cache.get(code_key)
+        if expected is None:
+            return EXPIRED
+        if attempts > self.max_attempts:
+            self.cache.delete_many([code_key, attempts_key])
+            return LOCKED
+        if not hmac.compare_digest(expected, _digest(email, str(code))):
+            return INVALID
+        # single use: of two concurrent correct guesses only the one deleting the key wins
+        if not self.cache.delete(code_key):
+            return EXPIRED
+        self.cache.delete(attempts_key)
+        return VALID
+
+
+class DatabaseOTPStore(OTPStore):
+    """
+    The same rules on the OTPCode table, one row per email: the attempt counter
+    is an UPDATE ... SET attempts = attempts + 1 and single use is the DELETE
+    that removes the row. Expired rows are deleted when the next code is issued.
+    """
+    def __init__(self, ttl=None, max_attempts=None):
+        self.ttl = ttl or OTP_TTL
+        self.max_attempts = max_attempts or OTP_MAX_ATTEMPTS
+
+    def issue(self, email):
+        code = generate_otp()
+        now = timezone.now()
+        OTPCode.objects.filter(expires_at__lte=now).delete()
+        OTPCode.objects.update_or_create(email=email, defaults={
+            'code_hash': _digest(email, code), 'attempts': 0, 'expires_at': now + timedelta(seconds=self.ttl)})
+        return code
+
+    def verify(self, email, code):
+        current = OTPCode.objects.filter(email=email, expires_at__gt=timezone.now())
+        # concurrent guesses each use up an attempt
+        if not current.update(attempts=F('attempts') + 1):
+            return EXPIRED
+        row = current.values('code_hash', 'attempts').first()
+        if row is None:
+            return EXPIRED
+        if row['attempts'] > self.max_attempts:
+            OTPCode.objects.filter(email=email).delete()
+            return LOCKED
+        if not hmac.compare_digest(row['code_hash'], _digest(email, str(code))):
+            return INVALID
+        # single use: of two concurrent correct guesses only the one deleting the row wins
+        if not OTPCode.objects.filter(email=email, code_hash=row['code_hash']).delete()[0]:
+            return EXPIRED
+        return VALID
+
+
+_store = None
+
+
+def get_otp_store():
+    """
+    The cache store when the cache is shared by all web processes, the database
+    one otherwise: with a per process memory cache a code issued by one worker
+    would be unknown (EXPIRED) to the others.
+    """
+    global _store
+    if _store is None:
+        if is_shared(getattr(settings, 'OTP_CACHE_ALIAS', 'default')):
+            _store = CacheOTPStore()
+        else:
+            _store = DatabaseOTPStore()
+    return _store
+
+
+@receiver(setting_changed)
+def _reset_store(setting, **kwargs):
+    global _store
+    if setting in ('CACHES', 'OTP_CACHE_ALIAS'):
+        _store = None
@@ -0,0 +1,278 @@
+import logging
+import queue
+import random
+import smtplib
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from core.background import BackgroundDrain
+from .models import OutgoingEmail
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_BATCH_SIZE = getattr(settings, 'EMAIL_OUTBOX_BATCH_SIZE', 20)
+OUTBOX_MAX_ATTEMPTS = getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 6)
+# retry n waits RETRY_BACKOFF * 2**(n-1) seconds (+-25%), at most RETRY_BACKOFF_MAX
+RETRY_BACKOFF = getattr(settings, 'EMAIL_OUTBOX_RETRY_BACKOFF', 5)
+RETRY_BACKOFF_MAX = getattr(settings, 'EMAIL_OUTBOX_RETRY_BACKOFF_MAX', 600)
+# seconds a worker may spend on a claimed batch before another worker takes it over
+SEND_LEASE = getattr(settings, 'EMAIL_OUTBOX_LEASE', 300)
+
+
+def enqueue_email(to_email, subject, body):
+    """
+    Queue one email, a single INSERT. It is sent after the surrounding transaction commits.
+    """
+    email = OutgoingEmail.objects.create(to_email=to_email, subject=subject, body=body)
+    transaction.on_commit(schedule_drain)
+    return email
+
+
+class SMTPConnectionPool:
+    """
+    SMTP connections kept open between batches, at most `size` in use at once.
+    Every batch is sent over one connection: one TCP / TLS handshake and login for
+    many messages instead of one per message. A connection idle for longer than
+    idle_timeout is closed instead of reused, servers drop idle sessions.
+    """
+    def __init__(self, size=None, idle_timeout=None):
+        self.size = size or getattr(settings, 'EMAIL_POOL_SIZE', 2)
+        self.idle_timeout = idle_timeout or getattr(settings, 'EMAIL_POOL_IDLE_TIMEOUT', 60)
+        self.counters = Counter()
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.size)
+
+    @contextmanager
+    def connection(self):
+        self._slots.acquire()
+        connection = None
+        try:
+            connection = self._take()
+            yield connection
+        except Exception:
+            if connection is not None:
+                self._close(connection)
+                connection = None
+            raise
+        finally:
+            if connection is not None:
+                self._idle.put((connection, time.monotonic()))
+            self._slots.release()
+
+    def _take(self):
+        while True:
+            try:
+                connection, last_used = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if time.monotonic() - last_used < self.idle_timeout:
+                self.counters['reused'] += 1
+                return connection
+            self._close(connection)
+        connection = get_connection(fail_silently=False)
+        connection.open()
+        self.counters['opened'] += 1
+        return connection
+
+    def reopen(self, connection):
+        """
+        the server dropped a pooled connection
+        """
+        self._close(connection)
+        connection.open()
+        self.counters['opened'] += 1
+
+    def _close(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+        self.counters['closed'] += 1
+
+    def close_all(self):
+        while True:
+            try:
+                connection, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._close(connection)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = SMTPConnectionPool()
+    return _pool
+
+
+def reset_pool():
+    """
+    close the pooled connections, the next batch connects with the current settings
+    """
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.close_all()
+
+
+def _is_permanent(error):
+    """
+    5xx answers (unknown mailbox, rejected sender, ...) are not retried
+    """
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500
+
+
+def _dropped(error):
+    # 421: the server closes the session (idle too long, too many messages per connection)
+    return isinstance(error, smtplib.SMTPServerDisconnected) or getattr(error, 'smtp_code', None) == 421
+
+
+def _send(pool, connection, message):
+    try:
+        connection.send_messages([message])
+    except smtplib.SMTPException as e:
+        if not _dropped(e):
+            raise
+        pool.reopen(connection)
+        connection.send_messages([message])
+
+
+def retry_delay(attempts):
+    delay = min(RETRY_BACKOFF * 2 ** (attempts - 1), RETRY_BACKOFF_MAX)
+    return delay * random.uniform(0.75, 1.25)
+
+
+def _claim(batch_size):
+    """
+    Lease up to batch_size due emails to this worker and commit, so no lock is
+    held while talking to the SMTP server. An email whose lease ran out (the
+    worker died) is due again.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(OutgoingEmail.objects.select_for_update(skip_locked=True)
+                   .filter(status__in=[OutgoingEmail.STATUS_PENDING, OutgoingEmail.STATUS_SENDING],
+                           next_attempt_at__lte=now)
+                   .order_by('next_attempt_at', 'id').values_list('id', flat=True)[:batch_size])
+        if ids:
+            OutgoingEmail.objects.filter(pk__in=ids).update(
+                status=OutgoingEmail.STATUS_SENDING, attempts=F('attempts') + 1,
+                next_attempt_at=now + timedelta(seconds=SEND_LEASE))
+    return list(OutgoingEmail.objects.filter(pk__in=ids).order_by('id')) if ids else []
+
+
+def drain_outbox(batch_size=None, pool=None):
+    """
+    Send one batch of due emails over a pooled connection.
+
+    Sent emails are marked in one UPDATE (body cleared). A failed email goes back
+    to pending with an exponential backoff, until OUTBOX_MAX_ATTEMPTS or a
+    permanent (5xx) SMTP error marks it failed (body cleared as well).
+    Delivery is at least once: a worker dying between sending and marking
+    leaves the email to be sent again after its lease.
+    Returns the number of emails handled.
+    """
+    emails = _claim(batch_size or OUTBOX_BATCH_SIZE)
+    if not emails:
+        return 0
+    pool = pool or get_pool()
+    sent, failed = [], []
+    try:
+        with pool.connection() as connection:
+            for email in emails:
+                message = EmailMessage(email.subject, email.body, settings.DEFAULT_FROM_EMAIL, [email.to_email],
+                                       connection=connection)
+                try:
+                    _send(pool, connection, message)
+                    sent.append(email.pk)
+                except smtplib.SMTPException as e:
+                    if _dropped(e):
+                        # the connection is gone, even after a reconnect
+                        raise
+                    failed.append((email, e, _is_permanent(e)))
+    except Exception as e:
+        # no connection (server down, login refused): the rest of the batch is retried
+        logger.warning("SMTP connection failed: %r", e)
+        done = set(sent) | {email.pk for email, _, _ in failed}
+        failed += [(email, e, False) for email in emails if email.pk not in done]
+
+    now = timezone.now()
+    OutgoingEmail.objects.filter(pk__in=sent).update(
+        status=OutgoingEmail.STATUS_SENT, body='', last_error='', sent_at=now)
+    for email, error, permanent in failed:
+        email.last_error = repr(error)
+        if permanent or email.attempts >= OUTBOX_MAX_ATTEMPTS:
+            # never sent again, the OTP in the body is not kept around
+            email.status, email.body = OutgoingEmail.STATUS_FAILED, ''
+            logger.error("Email %s to %s given up: %r", email.pk, email.to_email, error)
+        else:
+            email.status = OutgoingEmail.STATUS_PENDING
+            email.next_attempt_at = now + timedelta(seconds=retry_delay(email.attempts))
+        email.save(update_fields=['status', 'body', 'next_attempt_at', 'last_error'])
+    return len(emails)
+
+
+def purge_emails(older_than_days, chunk_size=5000):
+    """
+    delete sent / failed emails older than the given age, in chunks
+    """
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    handled = OutgoingEmail.objects.filter(
+        status__in=[OutgoingEmail.STATUS_SENT, OutgoingEmail.STATUS_FAILED], created_at__lt=cutoff)
+    deleted = 0
+    while True:
+        ids = list(handled.values_list('pk', flat=True)[:chunk_size])
+        if not ids:
+            return deleted
+        deleted += OutgoingEmail.objects.filter(pk__in=ids).delete()[0]
+
+
+# in process drain, so OTP mails go out right away even without process_email_outbox workers
+
+_retry_timer = None
+_retry_lock = threading.Lock()
+
+
+def _schedule_retry():
+    """
+    wake up for the earliest email waiting for a retry, nothing else would trigger a drain
+    """
+    global _retry_timer
+    due = (OutgoingEmail.objects.filter(status__in=[OutgoingEmail.STATUS_PENDING, OutgoingEmail.STATUS_SENDING])
+           .order_by('next_attempt_at').values_list('next_attempt_at', flat=True).first())
+    if due is None:
+        return
+    with _retry_lock:
+        if _retry_timer is not None:
+            _retry_timer.cancel()
+        _retry_timer = threading.Timer(max((due - timezone.now()).total_seconds(), 0.1), schedule_drain)
+        _retry_timer.daemon = True
+        _retry_timer.start()
+
+
+background_drain = BackgroundDrain(drain_outbox, 'email-outbox', 'EMAIL_OUTBOX_INLINE', after=_schedule_retry)
+
+
+def schedule_drain():
+    """
+    Start a background drain unless one is already queued (see core.background).
+    """
+    background_drain.schedule()
@@ -1,11 +1,16 @@
 from rest_framework import serializers
 from .models import User
 from django.contrib.auth import authenticate
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt import serializers as jwt_serializers
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, TokenError
+from rest_framework_simplejwt.settings import api_settings
+from .authentication import resolve_user
+from .tokens import RefreshToken
+from core.serializers import DeferredImageMixin
 
 
 
-class RegisterSerializer(serializers.ModelSerializer):
+class RegisterSerializer(DeferredImageMixin, serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, min_length=6)
     image = serializers.ImageField(required=False)
 
@@ -22,19 +27,18 @@ class RegisterSerializer(serializers.ModelSerializer):
             last_name=validated_data.get('last_name', ''),
             phone=validated_data.get('phone', ''),
             address=validated_data.get('address', ''),
-            image=validated_data.get('image', None),
         )
         return user
 
 
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(DeferredImageMixin, serializers.ModelSerializer):
     image = serializers.ImageField(required=False)
     class Meta:
         model = User
-        fields = ['id', 'email', 'first_name', 'last_name', 'phone', 'address', 'image']
-        read_only_fields = ['id', 'email']
+        fields = ['id', 'email', 'first_name', 'last_name', 'phone', 'address', 'image', 'image_status']
+        read_only_fields = ['id', 'email', 'image_status']
 
 class LoginSerializer(serializers.Serializer):
     email = serializers.EmailField()
@@ -62,4 +66,37 @@ class LoginSerializer(serializers.Serializer):
         return {
             'refresh': str(refresh),
             'access': str(refresh.access_token),
-        }
\ No newline at end of file
+        }
+
+
+class TokenRefreshSerializer(jwt_serializers.TokenRefreshSerializer):
+    """
+    simplejwt's refresh with the cache blacklist (accounts/tokens.py) and the cached
+    user (accounts/authentication.py). The old refresh token is revoked before the
+    new pair is issued, a token already used by a concurrent refresh is rejected.
+    """
+    token_class = RefreshToken
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+
+        try:
+            user = resolve_user(refresh[api_settings.USER_ID_CLAIM])
+        except (KeyError, User.DoesNotExist):
+            user = None
+        if user is None or not api_settings.USER_AUTHENTICATION_RULE(user):
+            raise AuthenticationFailed(self.error_messages['no_active_account'], 'no_active_account')
+
+        data = {'access': str(refresh.access_token)}
+
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if api_settings.BLACKLIST_AFTER_ROTATION and not refresh.blacklist():
+                raise TokenError("Token is blacklisted")
+
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+
+            data['refresh'] = str(refresh)
+
+        return data
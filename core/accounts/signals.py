@@ -0,0 +1,13 @@
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from core.transactions import defer_until_commit
+from .authentication import invalidate_users
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def user_changed(sender, instance, **kwargs):
+    # cached JWT users (accounts/authentication.py): profile edits, deactivation, password changes
+    defer_until_commit('auth_user_cache', instance.pk, invalidate_users)
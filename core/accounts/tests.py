@@ -1,3 +1,433 @@
-from django.test import TestCase
+import io
+import smtplib
+import tempfile
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.core import mail
+from django.core.cache import caches
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+from . import otp_store
+from .authentication import LOCAL_TTL, is_enabled, local_users, resolve_user
+from .models import OTPCode, OutgoingEmail, User
+from .otp_store import CacheOTPStore, DatabaseOTPStore, get_otp_store
+from .token_blacklist import CacheTokenBlacklist, DatabaseTokenBlacklist, get_token_blacklist, prune_expired_tokens
+from .tokens import RefreshToken
+from .outbox import OUTBOX_MAX_ATTEMPTS, SMTPConnectionPool, drain_outbox, enqueue_email, retry_delay
+
+
+def shared_cache(directory):
+    # a cache every process sees, without a Redis server
+    return override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory}})
+
+
+class FakeSMTP:
+    """
+    an SMTP backend whose send_messages raises the queued errors first
+    """
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.sent = []
+        self.opened = 0
+
+    def open(self):
+        self.opened += 1
+
+    def close(self):
+        pass
+
+    def send_messages(self, messages):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.sent += messages
+        return len(messages)
+
+
+@override_settings(EMAIL_OUTBOX_INLINE=False)
+class OutboxTests(TestCase):
+    def setUp(self):
+        self.smtp = FakeSMTP()
+        self.enterContext(mock.patch('accounts.outbox.get_connection', return_value=self.smtp))
+        self.pool = SMTPConnectionPool(size=1)
+
+    def queue(self, count=1):
+        with self.captureOnCommitCallbacks(execute=True):
+            return [enqueue_email(f'user{i}@example.com', 'Your OTP Code', f'code {i}') for i in range(count)]
+
+    def drain(self):
+        return drain_outbox(pool=self.pool)
+
+    def test_register_queues_the_otp(self):
+        response = self.client.post('/api/v1/accounts/register/', {'email': 'user@example.com', 'password': 'secret123'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(mail.outbox), 0)
+        email = OutgoingEmail.objects.get()
+        self.assertEqual((email.to_email, email.status), ('user@example.com', OutgoingEmail.STATUS_PENDING))
+        self.assertIn('Your OTP code is:', email.body)
+
+    def test_batch_is_sent_over_one_connection(self):
+        self.queue(3)
+        self.assertEqual(self.drain(), 3)
+        self.assertEqual([message.to for message in self.smtp.sent], [[f'user{i}@example.com'] for i in range(3)])
+        self.assertEqual(set(OutgoingEmail.objects.values_list('status', 'body')), {(OutgoingEmail.STATUS_SENT, '')})
+        self.queue(2)
+        self.drain()
+        self.assertEqual(self.drain(), 0)
+        self.assertEqual((self.pool.counters['opened'], self.pool.counters['reused']), (1, 1))
+
+    def test_transient_error_is_retried_after_a_backoff(self):
+        self.smtp.errors = [smtplib.SMTPResponseException(451, b'try again later')]
+        email, = self.queue()
+        self.drain()
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (OutgoingEmail.STATUS_PENDING, 1))
+        self.assertGreater(email.next_attempt_at, timezone.now())
+        self.assertEqual(self.drain(), 0)
+        OutgoingEmail.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(self.drain(), 1)
+        self.assertEqual(OutgoingEmail.objects.get().status, OutgoingEmail.STATUS_SENT)
+
+    def test_permanent_error_and_last_attempt_give_up(self):
+        self.smtp.errors = [smtplib.SMTPRecipientsRefused({'user0@example.com': (550, b'no such user')}),
+                            smtplib.SMTPResponseException(451, b'try again later')]
+        self.queue(2)
+        OutgoingEmail.objects.filter(to_email='user1@example.com').update(attempts=OUTBOX_MAX_ATTEMPTS - 1)
+        with self.assertLogs('accounts.outbox', 'ERROR'):
+            self.drain()
+        # the OTP is not kept once the email is given up
+        self.assertEqual(set(OutgoingEmail.objects.values_list('status', 'body')), {(OutgoingEmail.STATUS_FAILED, '')})
+
+    def test_dropped_connection_is_reopened(self):
+        self.smtp.errors = [smtplib.SMTPServerDisconnected('idle timeout')]
+        self.queue()
+        self.drain()
+        self.assertEqual(OutgoingEmail.objects.get().status, OutgoingEmail.STATUS_SENT)
+        self.assertEqual((self.smtp.opened, self.pool.counters['opened']), (2, 2))
+
+    def test_connection_failure_retries_the_batch(self):
+        self.queue(2)
+        with mock.patch.object(self.smtp, 'open', side_effect=ConnectionRefusedError), \
+                self.assertLogs('accounts.outbox', 'WARNING'):
+            self.assertEqual(self.drain(), 2)
+        self.assertEqual(set(OutgoingEmail.objects.values_list('status', 'attempts')),
+                         {(OutgoingEmail.STATUS_PENDING, 1)})
+        self.assertEqual(self.smtp.sent, [])
+
+    def test_expired_lease_is_claimed_again(self):
+        self.queue()
+        # a worker died while sending
+        OutgoingEmail.objects.update(status=OutgoingEmail.STATUS_SENDING, attempts=1,
+                                     next_attempt_at=timezone.now() + timedelta(minutes=5))
+        self.assertEqual(self.drain(), 0)
+        OutgoingEmail.objects.update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.drain(), 1)
+        self.assertEqual(OutgoingEmail.objects.values_list('attempts', flat=True).get(), 2)
+
+    def test_retry_delay(self):
+        self.assertTrue(3.75 <= retry_delay(1) <= 6.25)
+        self.assertTrue(30 <= retry_delay(4) <= 50)
+        self.assertTrue(retry_delay(20) <= 750)
+
+
+class OTPStoreTests:
+    email = 'user@example.com'
+
+    def make_store(self):
+        raise NotImplementedError
+
+    def expire(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.store = self.make_store()
+
+    def test_valid_code_is_single_use(self):
+        code = self.store.issue(self.email)
+        self.assertEqual(self.store.verify(self.email, code), otp_store.VALID)
+        self.assertEqual(self.store.verify(self.email, code), otp_store.EXPIRED)
+
+    def test_wrong_code_is_invalid(self):
+        code = self.store.issue(self.email)
+        self.assertEqual(self.store.verify(self.email, 'wrong'), otp_store.INVALID)
+        self.assertEqual(self.store.verify(self.email, code), otp_store.VALID)
+
+    def test_code_is_tied_to_its_email(self):
+        code = self.store.issue(self.email)
+        self.assertEqual(self.store.verify('other@example.com', code), otp_store.EXPIRED)
+
+    def test_locked_after_max_attempts(self):
+        code = self.store.issue(self.email)
+        for _ in range(3):
+            self.assertEqual(self.store.verify(self.email, 'wrong'), otp_store.INVALID)
+        self.assertEqual(self.store.verify(self.email, code), otp_store.LOCKED)
+        # discarded, even the right code needs a new one now
+        self.assertEqual(self.store.verify(self.email, code), otp_store.EXPIRED)
+
+    def test_expired_code(self):
+        code = self.store.issue(self.email)
+        self.expire()
+        self.assertEqual(self.store.verify(self.email, code), otp_store.EXPIRED)
+
+    def test_new_code_resets_the_attempts(self):
+        self.store.issue(self.email)
+        for _ in range(3):
+            self.store.verify(self.email, 'wrong')
+        code = self.store.issue(self.email)
+        for _ in range(3):
+            self.assertEqual(self.store.verify(self.email, 'wrong'), otp_store.INVALID)
+        self.assertEqual(self.store.verify(self.email, code), otp_store.LOCKED)
+        code = self.store.issue(self.email)
+        self.assertEqual(self.store.verify(self.email, code), otp_store.VALID)
+
+    def test_unknown_email_is_expired(self):
+        self.assertEqual(self.store.verify(self.email, '123456'), otp_store.EXPIRED)
+
+
+class DatabaseOTPStoreTests(OTPStoreTests, TestCase):
+    def make_store(self):
+        return DatabaseOTPStore(max_attempts=3)
+
+    def expire(self):
+        OTPCode.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+    def test_only_a_hash_is_stored(self):
+        code = self.store.issue(self.email)
+        self.assertNotIn(code, OTPCode.objects.get(email=self.email).code_hash)
+
+    def test_issue_deletes_expired_codes(self):
+        self.store.issue('old@example.com')
+        self.expire()
+        self.store.issue(self.email)
+        self.assertEqual(list(OTPCode.objects.values_list('email', flat=True)), [self.email])
+
+
+class CacheOTPStoreTests(OTPStoreTests, TestCase):
+    def make_store(self):
+        caches['default'].clear()
+        return CacheOTPStore(max_attempts=3, ttl=60)
+
+    def expire(self):
+        # LocMemCache compares its expiry times with time.time()
+        later = timezone.now().timestamp() + 61
+        self.enterContext(mock.patch('django.core.cache.backends.locmem.time.time', return_value=later))
+
+
+class GetOTPStoreTests(TestCase):
+    def test_database_store_without_a_shared_cache(self):
+        self.assertIsInstance(get_otp_store(), DatabaseOTPStore)
+
+    def test_cache_store_with_a_shared_cache(self):
+        with tempfile.TemporaryDirectory() as directory, shared_cache(directory):
+            self.assertIsInstance(get_otp_store(), CacheOTPStore)
+        self.assertIsInstance(get_otp_store(), DatabaseOTPStore)
+
+
+class VerifyOTPViewTests(APITestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.user = User.objects.create_user('user@example.com', 'secret123')
+
+    def verify(self, otp):
+        return self.client.post('/api/v1/accounts/verify-otp/', {'email': self.user.email, 'otp': otp})
+
+    def test_valid_code_verifies_the_email_and_issues_tokens(self):
+        code = get_otp_store().issue(self.user.email)
+        response = self.verify(code)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data['tokens']), {'refresh', 'access'})
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.is_email_verified)
+
+    def test_errors(self):
+        self.assertEqual(self.verify('123456').data['detail'], "OTP expired or not requested, request a new one.")
+        get_otp_store().issue(self.user.email)
+        self.assertEqual(self.verify('wrong').data['detail'], "Invalid OTP.")
+
+    def test_resend_and_failed_verify_write_nothing(self):
+        with tempfile.TemporaryDirectory() as directory, shared_cache(directory), \
+                self.settings(EMAIL_OUTBOX_ENABLED=False):
+            with self.assertNumQueries(1):  # the user
+                self.assertEqual(self.client.post('/api/v1/accounts/resend-otp/', {'email': self.user.email}).status_code, 200)
+            self.assertEqual(len(mail.outbox), 1)
+            with self.assertNumQueries(0):
+                self.assertEqual(self.verify('wrong').status_code, 400)
+
+
+class CachedAuthenticationTests(APITestCase):
+    url = '/api/v1/accounts/profile/'
+
+    def setUp(self):
+        self.enterContext(shared_cache(self.enterContext(tempfile.TemporaryDirectory())))
+        local_users.clear()
+        self.addCleanup(local_users.clear)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user = User.objects.create_user('user@example.com', 'secret123', first_name='Ada')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+
+    def other_process(self):
+        # another worker: same shared cache, its own LRU
+        local_users.clear()
+
+    def test_user_is_not_selected_per_request(self):
+        self.assertTrue(is_enabled())
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.url).data['first_name'], 'Ada')
+        self.other_process()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_save_invalidates_every_process(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+        self.other_process()
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_update_needs_an_explicit_invalidation(self):
+        self.client.get(self.url)
+        User.objects.filter(pk=self.user.pk).update(first_name='Grace')
+        self.other_process()
+        self.assertEqual(self.client.get(self.url).data['first_name'], 'Ada')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.first_name = 'Grace'
+            self.user.save(update_fields=['first_name'])
+        self.other_process()
+        self.assertEqual(self.client.get(self.url).data['first_name'], 'Grace')
+
+    def test_password_change_is_seen(self):
+        resolve_user(self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.set_password('secret456')
+            self.user.save()
+        self.other_process()
+        self.assertTrue(resolve_user(self.user.pk).check_password('secret456'))
+
+    def test_copies_are_private(self):
+        resolve_user(self.user.pk).first_name = 'changed'
+        self.assertEqual(resolve_user(self.user.pk).first_name, 'Ada')
+
+
+class UnsharedAuthenticationCacheTests(TestCase):
+    def setUp(self):
+        local_users.clear()
+        self.addCleanup(local_users.clear)
+        self.user = User.objects.create_user('user@example.com', 'secret123')
+
+    def test_local_lru_then_the_database(self):
+        # the per process memory cache of settings.CACHES: another worker's bump would not arrive
+        self.assertFalse(is_enabled())
+        with self.assertNumQueries(1):
+            resolve_user(self.user.pk)
+        with self.assertNumQueries(0):
+            resolve_user(self.user.pk)
+        self.assertFalse(any(key.startswith(':1:auth:') for key in caches['default']._cache))
+
+    def test_other_processes_see_a_change_once_their_entry_expires(self):
+        resolve_user(self.user.pk)
+        # deactivated by another worker, its invalidation only reaches its own process
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertTrue(resolve_user(self.user.pk).is_active)
+        with mock.patch('accounts.authentication.time.monotonic', return_value=time.monotonic() + LOCAL_TTL + 1):
+            self.assertFalse(resolve_user(self.user.pk).is_active)
+
+
+class TokenRefreshTests(APITestCase):
+    refresh_url = '/api/v1/accounts/token/refresh/'
+    blacklist_class = DatabaseTokenBlacklist
+
+    def setUp(self):
+        caches['default'].clear()
+        local_users.clear()
+        self.user = User.objects.create_user('user@example.com', 'secret123', is_email_verified=True)
+
+    def refresh(self, token):
+        return self.client.post(self.refresh_url, {'refresh': str(token)})
+
+    def test_blacklist_backend(self):
+        self.assertIsInstance(get_token_blacklist(), self.blacklist_class)
+
+    def test_rotated_token_cannot_be_reused(self):
+        token = RefreshToken.for_user(self.user)
+        response = self.refresh(token)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.data['refresh'], str(token))
+
+        reused = self.refresh(token)
+        self.assertEqual(reused.status_code, 401)
+        self.assertEqual(reused.data['detail'], "Token is blacklisted")
+        # the new token still works
+        self.assertEqual(self.refresh(response.data['refresh']).status_code, 200)
+
+    def test_logged_out_token_cannot_refresh(self):
+        token = RefreshToken.for_user(self.user)
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.post('/api/v1/accounts/logout/', {'refresh': str(token)}).status_code, 205)
+        self.client.force_authenticate(None)
+        self.assertEqual(self.refresh(token).status_code, 401)
+
+    def test_revoke_reports_a_second_revoke(self):
+        token = RefreshToken.for_user(self.user)
+        self.assertTrue(token.blacklist())
+        self.assertFalse(token.blacklist())
+
+
+class CacheTokenRefreshTests(TokenRefreshTests):
+    blacklist_class = CacheTokenBlacklist
+
+    def setUp(self):
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(shared_cache(directory))
+        super().setUp()
+
+    def test_rotation_writes_no_rows(self):
+        self.refresh(RefreshToken.for_user(self.user))
+        self.assertFalse(BlacklistedToken.objects.exists())
+
+    def test_tokens_revoked_in_the_database_stay_revoked(self):
+        token = RefreshToken.for_user(self.user)
+        DatabaseTokenBlacklist().revoke(token)
+        self.assertEqual(self.refresh(token).status_code, 401)
+
+    def test_cache_failure_falls_back_to_the_database(self):
+        token = RefreshToken.for_user(self.user)
+        blacklist = CacheTokenBlacklist()
+        with mock.patch.object(blacklist.cache, 'add', side_effect=ConnectionError), \
+                self.assertLogs('accounts.token_blacklist', 'WARNING'):
+            self.assertTrue(blacklist.revoke(token))
+        self.assertTrue(BlacklistedToken.objects.filter(token__jti=token['jti']).exists())
+        with mock.patch.object(blacklist.cache, 'get', side_effect=ConnectionError), \
+                self.assertLogs('accounts.token_blacklist', 'WARNING'):
+            self.assertTrue(blacklist.is_revoked(token))
+
+
+class PruneExpiredTokensTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('user@example.com', 'secret123')
+        now = timezone.now()
+        for i, (expires_in, revoked) in enumerate([(-60, True), (-60, False), (-1, True), (60, True), (60, False)]):
+            outstanding = OutstandingToken.objects.create(
+                user=self.user, jti=f'jti-{i}', token='token', expires_at=now + timedelta(seconds=expires_in))
+            if revoked:
+                BlacklistedToken.objects.create(token=outstanding)
+
+    def test_only_expired_rows_are_deleted(self):
+        self.assertEqual(prune_expired_tokens(batch_size=2), (3, 2))
+        self.assertEqual(set(OutstandingToken.objects.values_list('jti', flat=True)), {'jti-3', 'jti-4'})
+        self.assertEqual(BlacklistedToken.objects.count(), 1)
+        self.assertEqual(prune_expired_tokens(), (0, 0))
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command('prune_token_blacklist', '--batch-size', '1', stdout=out)
+        self.assertIn('deleted 3 expired outstanding tokens and 2 blacklist entries', out.getvalue())
 
-# Create your tests here.
@@ -0,0 +1,137 @@
+import logging
+import time
+from abc import ABC, abstractmethod
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+from core.caches import is_shared
+
+logger = logging.getLogger(__name__)
+
+REVOKED_KEY = 'jwt:revoked:{}'
+
+# also look revoked tokens up in simplejwt's tables on a cache miss: tokens revoked
+# there (admin, before the cache blacklist, while the cache was down) stay revoked
+CHECK_DATABASE = getattr(settings, 'TOKEN_BLACKLIST_CHECK_DATABASE', True)
+PRUNE_BATCH_SIZE = getattr(settings, 'TOKEN_BLACKLIST_PRUNE_BATCH_SIZE', 1000)
+
+
+class TokenBlacklist(ABC):
+    @abstractmethod
+    def revoke(self, token):
+        """Blacklist the token. False if it already was"""
+
+    @abstractmethod
+    def is_revoked(self, token):
+        """True if the token is blacklisted"""
+
+
+class DatabaseTokenBlacklist(TokenBlacklist):
+    """
+    simplejwt's OutstandingToken / BlacklistedToken tables, rows stay until prune_expired_tokens()
+    """
+    def revoke(self, token):
+        jti = token[api_settings.JTI_CLAIM]
+        user = get_user_model().objects.filter(
+            **{api_settings.USER_ID_FIELD: token.get(api_settings.USER_ID_CLAIM)}).first()
+        with transaction.atomic():
+            outstanding, _ = OutstandingToken.objects.get_or_create(jti=jti, defaults={
+                'user': user,
+                'created_at': token.current_time,
+                'token': str(token),
+                'expires_at': datetime_from_epoch(token['exp']),
+            })
+            _, created = BlacklistedToken.objects.get_or_create(token=outstanding)
+        return created
+
+    def is_revoked(self, token):
+        return BlacklistedToken.objects.filter(token__jti=token[api_settings.JTI_CLAIM]).exists()
+
+
+class CacheTokenBlacklist(TokenBlacklist):
+    """
+    Revoked JTIs in the Django cache (Redis in production), each kept for the
+    token's remaining lifetime, so nothing needs pruning and a refresh writes no rows.
+    Revoking is a cache add(): of two concurrent refreshes with the same token only
+    one gets a new pair. Falls back to the database when the cache is unavailable.
+    The cache must be shared by all web processes (REDIS_URL), see get_token_blacklist().
+    """
+    def __init__(self, alias=None, fallback=None, check_database=None):
+        self.cache = caches[alias or getattr(settings, 'TOKEN_BLACKLIST_CACHE_ALIAS', 'default')]
+        self.fallback = fallback or DatabaseTokenBlacklist()
+        self.check_database = CHECK_DATABASE if check_database is None else check_database
+
+    def revoke(self, token):
+        remaining = int(token['exp'] - time.time()) + 1
+        if remaining <= 0:
+            # expired, nothing will accept it again
+            return True
+        try:
+            return self.cache.add(REVOKED_KEY.format(token[api_settings.JTI_CLAIM]), 1, timeout=remaining)
+        except Exception:
+            logger.warning("Token blacklist cache unavailable, revoking in the database", exc_info=True)
+            return self.fallback.revoke(token)
+
+    def is_revoked(self, token):
+        try:
+            if self.cache.get(REVOKED_KEY.format(token[api_settings.JTI_CLAIM])) is not None:
+                return True
+        except Exception:
+            logger.warning("Token blacklist cache unavailable, checking the database", exc_info=True)
+            return self.fallback.is_revoked(token)
+        return self.check_database and self.fallback.is_revoked(token)
+
+
+_blacklist = None
+
+
+def get_token_blacklist():
+    """
+    The cache blacklist when the cache is shared by all web processes, the database
+    one otherwise: with a per process memory cache a token revoked by one worker
+    would still be accepted by the others.
+    """
+    global _blacklist
+    if _blacklist is None:
+        if is_shared(getattr(settings, 'TOKEN_BLACKLIST_CACHE_ALIAS', 'default')):
+            _blacklist = CacheTokenBlacklist()
+        else:
+            _blacklist = DatabaseTokenBlacklist()
+    return _blacklist
+
+
+@receiver(setting_changed)
+def _reset_blacklist(setting, **kwargs):
+    global _blacklist
+    if setting in ('CACHES', 'TOKEN_BLACKLIST_CACHE_ALIAS'):
+        _blacklist = None
+
+
+def prune_expired_tokens(batch_size=None, now=None):
+    """
+    Delete expired rows from simplejwt's token tables in chunks of batch_size,
+    one short transaction each. Walks the primary key, expired tokens are the oldest.
+    Returns the number of (outstanding, blacklisted) rows deleted.
+    """
+    batch_size = batch_size or PRUNE_BATCH_SIZE
+    now = now or timezone.now()
+    outstanding = blacklisted = 0
+    last_id = 0
+    while True:
+        ids = list(OutstandingToken.objects.filter(id__gt=last_id, expires_at__lte=now)
+                   .order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return outstanding, blacklisted
+        with transaction.atomic():
+            blacklisted += BlacklistedToken.objects.filter(token_id__in=ids).delete()[0]
+            outstanding += OutstandingToken.objects.filter(id__in=ids).delete()[0]
+        last_id = ids[-1]
@@ -0,0 +1,28 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt import tokens
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+
+from .token_blacklist import get_token_blacklist
+
+
+class RefreshToken(tokens.RefreshToken):
+    """
+    simplejwt's RefreshToken, revoked through get_token_blacklist() (the cache when it
+    is shared) instead of a row per token: issuing writes nothing to the token tables.
+    blacklist() returns False if the token was already revoked.
+    """
+    @classmethod
+    def for_user(cls, user):
+        # skips BlacklistMixin.for_user, which inserts an OutstandingToken row per login
+        return super(tokens.BlacklistMixin, cls).for_user(user)
+
+    def check_blacklist(self):
+        if get_token_blacklist().is_revoked(self):
+            raise TokenError(_("Token is blacklisted"))
+
+    def blacklist(self):
+        return get_token_blacklist().revoke(self)
+
+    def outstand(self):
+        return None
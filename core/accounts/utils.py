@@ -1,4 +1,4 @@
-import random
+import secrets
 
 def generate_otp(length=6):
     """
@@ -9,7 +9,7 @@ def generate_otp(length=6):
         length = 4  # minimum OTP length
     if length > 10:
         length = 10  # max OTP length to avoid huge numbers
-    return str(random.randint(10**(length-1), 10**length - 1))
+    return str(10**(length-1) + secrets.randbelow(9 * 10**(length-1)))
 
 
 def send_otp_debug(user_email, otp):
@@ -1,13 +1,22 @@
 from rest_framework import generics, permissions, status, serializers
 from rest_framework.response import Response
-from rest_framework_simplejwt.tokens import RefreshToken
+from .tokens import RefreshToken
 from .models import User
 from .serializers import RegisterSerializer, UserSerializer, LoginSerializer
 from rest_framework.views import APIView
 from .otp_adapter import EmailOTPAdapter
-from .utils import generate_otp
+from . import otp_store
+from .otp_store import get_otp_store
+from .authentication import invalidate_users
+from core.transactions import defer_until_commit
 from core.throttles import AuthRateThrottle, OTPRateThrottle
 
+OTP_ERRORS = {
+    otp_store.INVALID: "Invalid OTP.",
+    otp_store.EXPIRED: "OTP expired or not requested, request a new one.",
+    otp_store.LOCKED: "Too many wrong attempts, request a new OTP.",
+}
+
 class RegisterView(generics.CreateAPIView):
     """
     Register a normal user and send OTP via email.
@@ -23,10 +32,8 @@ class RegisterView(generics.CreateAPIView):
         serializer.is_valid(raise_exception=True)
         user = serializer.save()
 
-        # Generate and save OTP
-        otp_code = generate_otp()
-        user.otp = otp_code
-        user.save()
+        # Generate the OTP, kept hashed in the cache (accounts/otp_store.py), not on the user row
+        otp_code = get_otp_store().issue(user.email)
 
         # Send OTP via email adapter
         otp_sender = EmailOTPAdapter()
@@ -51,7 +58,10 @@ class ProfileView(generics.RetrieveUpdateAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_object(self):
-        return self.request.user
+        if self.request.method in ('GET', 'HEAD'):
+            return self.request.user
+        # request.user may come from the auth cache (accounts/authentication.py), edit the current row
+        return User.objects.get(pk=self.request.user.pk)
 
 
 
@@ -123,18 +133,20 @@ class VerifyOTPView(APIView):
         if not email or not otp:
             return Response({"detail": "Email and OTP are required."}, status=status.HTTP_400_BAD_REQUEST)
 
-        try:
-            user = User.objects.get(email=email)
-        except User.DoesNotExist:
-            return Response({"detail": "User not found."}, status=status.HTTP_404_NOT_FOUND)
+        result = get_otp_store().verify(email, otp)
+        if result != otp_store.VALID:
+            return Response({"detail": OTP_ERRORS[result]}, status=status.HTTP_400_BAD_REQUEST)
 
-        if user.otp != otp:
-            return Response({"detail": "Invalid OTP."}, status=status.HTTP_400_BAD_REQUEST)
+        # only the columns the tokens need
+        user = User.objects.only('id', 'email', 'password', 'is_active').filter(email=email).first()
+        if user is None:
+            return Response({"detail": "User not found."}, status=status.HTTP_404_NOT_FOUND)
 
-        # OTP verified
-        user.otp = None
-        user.is_email_verified = True  # mark email as verified
-        user.save()
+        # OTP verified, the one write: a single UPDATE instead of a full row save.
+        # No post_save needed, device responses do not show the flag.
+        User.objects.filter(pk=user.pk).update(is_email_verified=True)
+        # update() sends no post_save, drop the cached user by hand
+        defer_until_commit('auth_user_cache', user.pk, invalidate_users)
 
         # Issue JWT tokens now
         refresh = RefreshToken.for_user(user)
@@ -160,14 +172,12 @@ class ResendOTPView(APIView):
         if not email:
             return Response({"detail": "Email is required."}, status=status.HTTP_400_BAD_REQUEST)
 
-        try:
-            user = User.objects.get(email=email)
-        except User.DoesNotExist:
+        # read only: the new code goes to the cache, nothing is written to the user
+        user = User.objects.only('id', 'email', 'first_name').filter(email=email).first()
+        if user is None:
             return Response({"detail": "User not found."}, status=status.HTTP_404_NOT_FOUND)
 
-        otp_code = generate_otp()
-        user.otp = otp_code
-        user.save()
+        otp_code = get_otp_store().issue(user.email)
 
         otp_sender = EmailOTPAdapter()
         otp_sender.send_otp(user, otp_code)
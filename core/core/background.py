@@ -0,0 +1,74 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundDrain:
+    """
+    In process drain of a database queue (webhook inbox, email outbox, ...), so queued
+    work is handled right away even without dedicated worker processes.
+
+    `drain` handles one batch and returns how many items it took, a run repeats it
+    until it returns 0 and then calls `after` (if given). At most one run is queued:
+    a burst of schedule() calls is handled by a single run.
+    `setting` names a boolean setting (default True) that turns it off, e.g. when
+    the queue is served by management command workers.
+
+        inbox = BackgroundDrain(drain_inbox, 'webhook-drain', 'PAYMENT_WEBHOOK_INLINE')
+        transaction.on_commit(inbox.schedule)
+    """
+    def __init__(self, drain, name, setting, after=None):
+        self.drain = drain
+        self.name = name
+        self.setting = setting
+        self.after = after
+        self._executor = None
+        self._lock = threading.Lock()
+        self._scheduled = False
+
+    def executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=self.name)
+        return self._executor
+
+    def schedule(self):
+        """
+        start a background run unless one is already queued
+        """
+        if not getattr(settings, self.setting, True):
+            return
+        with self._lock:
+            if self._scheduled:
+                return
+            self._scheduled = True
+        self.executor().submit(self._run)
+
+    def wait(self):
+        """
+        block until the queued runs are over (benchmarks, tests)
+        """
+        self.executor().submit(lambda: None).result()
+
+    def _run(self):
+        close_old_connections()
+        try:
+            while True:
+                # reset first: an item committed from now on schedules another run
+                with self._lock:
+                    self._scheduled = False
+                if not self.drain():
+                    break
+            if self.after is not None:
+                self.after()
+        except Exception:
+            # the items stay queued for the next run / the workers
+            logger.exception("Background %s failed", self.name)
+        finally:
+            close_old_connections()
@@ -0,0 +1,72 @@
+"""
+helpers for the bench_* / loadtest management commands
+"""
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+
+
+@contextmanager
+def temporary_database(file_backed=False):
+    """
+    Run against a throwaway test database created from the migrations, never the configured one.
+    file_backed=True keeps SQLite on disk instead of in memory, for multi threaded runs.
+    """
+    old_name = connection.settings_dict['NAME']
+    test_settings = connection.settings_dict.setdefault('TEST', {})
+    old_test_name = test_settings.get('NAME')
+    path = None
+    if file_backed and connection.vendor == 'sqlite':
+        handle, path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(handle)
+        test_settings['NAME'] = path
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        test_settings['NAME'] = old_test_name
+        if path and os.path.exists(path):
+            os.remove(path)
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class _LoadTestServer(ThreadedWSGIServer):
+    request_queue_size = 256
+
+
+@contextmanager
+def live_app_server(host='127.0.0.1', port=0):
+    """
+    Serve the project's WSGI application from a background thread, yields its base url.
+    Every request runs in its own thread with its own database connection,
+    use a file backed temporary_database with SQLite.
+    """
+    server = _LoadTestServer((host, port), _QuietHandler, allow_reuse_address=False)
+    server.set_app(get_wsgi_application())
+    thread = threading.Thread(target=server.serve_forever, name='live-app-server', daemon=True)
+    thread.start()
+    try:
+        yield f'http://{host}:{server.server_address[1]}'
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def timed(function, *args, **kwargs):
+    """
+    (result, elapsed seconds)
+    """
+    started = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - started
@@ -0,0 +1,96 @@
+import codecs
+import csv
+import json
+from itertools import islice
+
+CSV = 'csv'
+NDJSON = 'ndjson'
+FORMATS = (CSV, NDJSON)
+
+CONTENT_TYPES = {
+    CSV: 'text/csv; charset=utf-8',
+    NDJSON: 'application/x-ndjson',
+}
+
+_EXTENSIONS = {
+    '.csv': CSV,
+    '.ndjson': NDJSON,
+    '.jsonl': NDJSON,
+}
+
+
+def detect_format(upload, requested=None):
+    """
+    explicit ?file_format= wins, otherwise guess from the file name
+    """
+    if requested:
+        requested = requested.lower()
+        return requested if requested in FORMATS else None
+    name = (getattr(upload, 'name', '') or '').lower()
+    for extension, file_format in _EXTENSIONS.items():
+        if name.endswith(extension):
+            return file_format
+    return None
+
+
+def check_encoding(upload):
+    """
+    ValueError unless the whole upload is UTF-8. Reads the file once in chunks and
+    rewinds it, so a Latin-1 file is rejected before any row is written instead of
+    failing half way through the import.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    try:
+        for chunk in upload.chunks():
+            decoder.decode(chunk)
+        decoder.decode(b'', final=True)
+    except UnicodeDecodeError:
+        raise ValueError("The file is not UTF-8 encoded, save it as UTF-8 and upload it again.") from None
+    finally:
+        upload.seek(0)
+
+
+def iter_records(upload, file_format):
+    """
+    Stream (row_number, record, error) tuples out of an uploaded CSV/NDJSON file.
+    The file is read line by line so memory does not grow with the upload size.
+    record is a dict, error is a message for rows that could not be parsed.
+    Raises ValueError (check_encoding) before the first row when the file is not UTF-8.
+    """
+    check_encoding(upload)
+    lines = codecs.iterdecode(iter(upload), 'utf-8-sig')
+    if file_format == CSV:
+        for number, row in enumerate(csv.DictReader(lines), start=1):
+            if None in row:
+                yield number, None, "Too many columns."
+            else:
+                yield number, row, None
+        return
+
+    number = 0
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        number += 1
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield number, None, "Invalid JSON."
+            continue
+        if not isinstance(record, dict):
+            yield number, None, "Expected a JSON object."
+            continue
+        yield number, record, None
+
+
+def chunked(iterable, size):
+    """
+    yield lists of at most `size` items
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
@@ -0,0 +1,12 @@
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+
+def is_shared(alias):
+    """
+    True when every web process sees the same entries (Redis, Memcached, database, ...),
+    False for the per process memory cache and the dummy cache. State that must hold
+    across workers (revoked tokens, OTP codes) only goes to a shared cache.
+    """
+    return not isinstance(caches[alias], (LocMemCache, DummyCache))
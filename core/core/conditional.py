@@ -0,0 +1,50 @@
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+
+def make_etag(*parts):
+    """
+    strong validator from the values a representation depends on
+    (a versioned cache key, url incl. query string, serialized data, ...)
+    """
+    digest = hashlib.sha1('|'.join(str(part) for part in parts).encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def queryset_etag(queryset, *parts, related=()):
+    """
+    ETag of a list without loading it: one aggregate query for the row count and the
+    newest updated_at of the rows (and of the `related` rows they embed), hashed with
+    `parts` (url, user, ...). Saves and inserts move the newest updated_at, deletes and
+    rows leaving a filter the count. No Last-Modified for lists, a delete does not
+    move the newest updated_at and If-Modified-Since would miss it.
+    """
+    fields = ['updated_at', *(f'{name}__updated_at' for name in related)]
+    values = queryset.order_by().aggregate(
+        count=Count('pk'), **{f'latest_{i}': Max(field) for i, field in enumerate(fields)})
+    return make_etag(*parts, values['count'], *(values[f'latest_{i}'] for i in range(len(fields))))
+
+
+def _timestamp(last_modified):
+    return int(last_modified.timestamp()) if last_modified else None
+
+
+def not_modified(request, etag, last_modified=None):
+    """
+    304 (or 412) response when the client's If-None-Match / If-Modified-Since
+    still match, None when the full response has to be sent.
+    """
+    response = get_conditional_response(request, etag=etag, last_modified=_timestamp(last_modified))
+    if response is not None:
+        with_validators(response, etag, last_modified)
+    return response
+
+
+def with_validators(response, etag, last_modified=None):
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(_timestamp(last_modified))
+    return response
@@ -0,0 +1,10 @@
+from django.db.models import Q
+
+
+def startswith_range(field, prefix):
+    """
+    `field` starts with `prefix` as a range condition (prefix <= field < next prefix),
+    which a plain b-tree index serves on every backend, unlike LIKE 'prefix%' ESCAPE.
+    """
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return Q(**{f'{field}__gte': prefix, f'{field}__lt': upper})
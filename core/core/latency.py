@@ -0,0 +1,32 @@
+"""
+latency summaries, for gateway / sweep reports and the bench_* commands
+"""
+import statistics
+
+
+def summarize(samples):
+    """
+    latency summary in milliseconds for a list of seconds
+    """
+    if not samples:
+        return {'count': 0}
+    ordered = sorted(samples)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000
+
+    return {
+        'count': len(ordered),
+        'mean_ms': statistics.fmean(ordered) * 1000,
+        'p50_ms': percentile(50),
+        'p95_ms': percentile(95),
+        'p99_ms': percentile(99),
+        'max_ms': ordered[-1] * 1000,
+    }
+
+
+def format_summary(summary):
+    if not summary.get('count'):
+        return 'no samples'
+    return ('n={count} mean={mean_ms:.2f}ms p50={p50_ms:.2f}ms p95={p95_ms:.2f}ms '
+            'p99={p99_ms:.2f}ms max={max_ms:.2f}ms').format(**summary)
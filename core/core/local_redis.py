@@ -0,0 +1,231 @@
+"""
+Local Redis stand-in for development and benchmarks, never for production.
+
+Speaks enough RESP2 for Django's RedisCache (redis-py): PING, SELECT, CLIENT, GET, SET
+(EX/PX/NX/XX/KEEPTTL), MGET, MSET, DEL, EXISTS, INCR/DECR/INCRBY/DECRBY, EXPIRE,
+PEXPIRE, PERSIST, TTL, PTTL, DBSIZE, FLUSHDB/FLUSHALL, MULTI/EXEC/DISCARD.
+One in-memory keyspace shared by all connections, every command (and every
+MULTI/EXEC block) runs under one lock, so INCR is atomic as in Redis.
+`latency` seconds are added per command, standing in for the network round trip.
+"""
+import socketserver
+import threading
+import time
+from collections import Counter
+
+
+class _Error(Exception):
+    pass
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b'*'):
+            # inline command, e.g. from telnet
+            return line.split()
+        arguments = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            arguments.append(self.rfile.read(length + 2)[:-2])
+        return arguments
+
+    def _encode(self, value):
+        if value is None:
+            return b'$-1\r\n'
+        if isinstance(value, _Error):
+            return b'-' + str(value).encode() + b'\r\n'
+        if isinstance(value, int):
+            return b':%d\r\n' % value
+        if isinstance(value, str):
+            return b'+' + value.encode() + b'\r\n'
+        if isinstance(value, list):
+            return b'*%d\r\n' % len(value) + b''.join(self._encode(item) for item in value)
+        return b'$%d\r\n' % len(value) + value + b'\r\n'
+
+    def handle(self):
+        server = self.server.redis
+        server.count('connections')
+        queued = None
+        while True:
+            arguments = self._read_command()
+            if not arguments:
+                return
+            command = arguments[0].decode().upper()
+            if server.latency:
+                time.sleep(server.latency)
+            if command == 'MULTI':
+                queued, reply = [], 'OK'
+            elif command == 'DISCARD':
+                queued, reply = None, 'OK'
+            elif command == 'EXEC':
+                reply = server.execute_all(queued or [])
+                queued = None
+            elif queued is not None:
+                queued.append(arguments)
+                reply = 'QUEUED'
+            elif command == 'QUIT':
+                self.wfile.write(b'+OK\r\n')
+                return
+            else:
+                reply = server.execute_all([arguments])[0]
+            self.wfile.write(self._encode(reply))
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+
+class LocalRedisServer:
+    """
+    The stand-in server, run in a background thread:
+
+        redis = LocalRedisServer().start()
+        CACHES['default'] = {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': redis.url}
+        ...
+        redis.stop()
+    """
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0):
+        self.latency = latency
+        self.counters = Counter()
+        self._data = {}  # key -> (value, expires at or None)
+        self._lock = threading.Lock()
+        self._server = _Server((host, port), _Handler)
+        self._server.redis = self
+        self._thread = None
+
+    @property
+    def host(self):
+        return self._server.server_address[0]
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    @property
+    def url(self):
+        return f'redis://{self.host}:{self.port}/0'
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='local-redis', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def used_memory(self):
+        """
+        bytes held in keys and values
+        """
+        with self._lock:
+            return sum(len(key) + len(value) for key, (value, _) in self._data.items())
+
+    def execute_all(self, commands):
+        with self._lock:
+            replies = []
+            for arguments in commands:
+                self.counters['commands'] += 1
+                try:
+                    replies.append(self._execute(arguments[0].decode().upper(), arguments[1:]))
+                except _Error as e:
+                    replies.append(e)
+                except (ValueError, IndexError):
+                    replies.append(_Error(f"ERR syntax error in '{arguments[0].decode()}'"))
+            return replies
+
+    # commands, called with the lock held
+
+    def _get(self, key):
+        entry = self._data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+            del self._data[key]
+            return None
+        return entry
+
+    def _expires(self, seconds):
+        return time.monotonic() + seconds
+
+    def _incr(self, key, delta):
+        entry = self._get(key)
+        try:
+            value = int(entry[0]) + delta if entry else delta
+        except ValueError:
+            raise _Error('ERR value is not an integer or out of range')
+        self._data[key] = (str(value).encode(), entry[1] if entry else None)
+        return value
+
+    def _execute(self, command, args):
+        if command == 'PING':
+            return args[0] if args else 'PONG'
+        if command in ('SELECT', 'CLIENT'):
+            return 'OK'
+        if command == 'GET':
+            entry = self._get(args[0])
+            return entry[0] if entry else None
+        if command == 'MGET':
+            return [entry[0] if entry else None for entry in map(self._get, args)]
+        if command == 'SET':
+            key, value, options = args[0], args[1], [arg.decode().upper() for arg in args[2:]]
+            entry = self._get(key)
+            if ('NX' in options and entry) or ('XX' in options and not entry):
+                return None
+            expires = None
+            if 'EX' in options:
+                expires = self._expires(int(options[options.index('EX') + 1]))
+            elif 'PX' in options:
+                expires = self._expires(int(options[options.index('PX') + 1]) / 1000)
+            elif 'KEEPTTL' in options and entry:
+                expires = entry[1]
+            self._data[key] = (value, expires)
+            return 'OK'
+        if command == 'MSET':
+            for key, value in zip(args[::2], args[1::2]):
+                self._data[key] = (value, None)
+            return 'OK'
+        if command in ('DEL', 'UNLINK'):
+            return sum(self._get(key) is not None and self._data.pop(key) is not None for key in args)
+        if command == 'EXISTS':
+            return sum(self._get(key) is not None for key in args)
+        if command in ('INCR', 'DECR', 'INCRBY', 'DECRBY'):
+            delta = int(args[1]) if command.endswith('BY') else 1
+            return self._incr(args[0], -delta if command.startswith('DECR') else delta)
+        if command in ('EXPIRE', 'PEXPIRE'):
+            entry = self._get(args[0])
+            if entry is None:
+                return 0
+            seconds = int(args[1]) / (1000 if command == 'PEXPIRE' else 1)
+            if seconds <= 0:
+                del self._data[args[0]]
+            else:
+                self._data[args[0]] = (entry[0], self._expires(seconds))
+            return 1
+        if command == 'PERSIST':
+            entry = self._get(args[0])
+            if entry is None or entry[1] is None:
+                return 0
+            self._data[args[0]] = (entry[0], None)
+            return 1
+        if command in ('TTL', 'PTTL'):
+            entry = self._get(args[0])
+            if entry is None:
+                return -2
+            if entry[1] is None:
+                return -1
+            remaining = entry[1] - time.monotonic()
+            return round(remaining * 1000) if command == 'PTTL' else round(remaining)
+        if command == 'DBSIZE':
+            return len(self._data)
+        if command in ('FLUSHDB', 'FLUSHALL'):
+            self._data.clear()
+            return 'OK'
+        raise _Error(f"ERR unknown command '{command}'")
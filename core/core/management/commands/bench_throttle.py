@@ -0,0 +1,91 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.redis import RedisCache
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from rest_framework import throttling
+from rest_framework.request import Request
+
+from core.benchmarks import timed
+from core.latency import format_summary, summarize
+from core.local_redis import LocalRedisServer
+from core.throttles import AnonRateThrottle
+
+THROTTLES = {
+    'history list': throttling.AnonRateThrottle,  # DRF's
+    'sliding window': AnonRateThrottle,
+}
+
+
+class Command(BaseCommand):
+    help = ("Compare DRF's history list throttle with the sliding window counter (core/throttles.py): "
+            "requests let through for one client spread over --workers simulated worker processes, each "
+            "with its own memory cache or all sharing the local Redis stand-in, then the cost of a check "
+            "as the limit fills up.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help="simulated worker processes")
+        parser.add_argument('--rate', default='100/min', help="limit of the shared limit run")
+        parser.add_argument('--requests', type=int, default=1000, help="requests from one client")
+        parser.add_argument('--cost-rate', default='1000/day', help="limit of the cost run")
+        parser.add_argument('--latency', type=float, default=0.0, help="seconds added per Redis command")
+
+    def handle(self, *args, **options):
+        redis = LocalRedisServer(latency=options['latency']).start()
+        try:
+            self.stdout.write(f"{options['requests']:,} requests from one client over {options['workers']} "
+                              f"workers, limit {options['rate']}:")
+            for name, base in THROTTLES.items():
+                for shared in (False, True):
+                    self._limit(name, base, shared, redis, options)
+            self.stdout.write(f"cost per check up to the limit of {options['cost_rate']}, shared Redis:")
+            for name, base in THROTTLES.items():
+                self._cost(name, base, redis, options)
+        finally:
+            redis.stop()
+
+    def _throttle_class(self, base, cache, rate):
+        return type('BenchThrottle', (base,), {'cache': cache, 'rate': rate})
+
+    def _request(self, ip='203.0.113.7'):
+        return Request(RequestFactory().get('/', REMOTE_ADDR=ip))
+
+    def _limit(self, name, base, shared, redis, options):
+        RedisCache(redis.url, {}).clear()
+        workers = options['workers']
+        classes = [
+            self._throttle_class(base, RedisCache(redis.url, {}) if shared else LocMemCache(f'bench-{i}', {}),
+                                 options['rate'])
+            for i in range(workers)]
+        for throttle_class in classes:
+            if not shared:
+                throttle_class.cache.clear()
+        allowed = []
+        lock = threading.Lock()
+
+        def client(worker):
+            count = 0
+            for _ in range(options['requests'] // workers):
+                count += classes[worker]().allow_request(self._request(), None)
+            with lock:
+                allowed.append(count)
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(client, range(workers)))
+        limit = classes[0]().num_requests
+        cache = 'shared Redis' if shared else 'memory per worker'
+        self.stdout.write(f"  {name + ', ' + cache + ':':<34} {sum(allowed):,} let through "
+                          f"({sum(allowed) / limit:.2f}x the limit of {limit})")
+
+    def _cost(self, name, base, redis, options):
+        cache = RedisCache(redis.url, {})
+        cache.clear()
+        throttle_class = self._throttle_class(base, cache, options['cost_rate'])
+        limit = throttle_class().num_requests
+        latency = [timed(throttle_class().allow_request, self._request(), None)[1] for _ in range(limit)]
+        tenth = max(1, limit // 10)
+        self.stdout.write(f"  {name + ':':<15} first {tenth}: {format_summary(summarize(latency[:tenth]))}")
+        self.stdout.write(f"  {'':<15} last {tenth}:  {format_summary(summarize(latency[-tenth:]))}")
+        self.stdout.write(f"  {'':<15} {redis.used_memory():,} bytes stored for the client")
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from core.uploads import IMAGE_READY, get_uploader, process_staged_image, staging_dir
+
+
+class Command(BaseCommand):
+    help = "Upload images left in the staging dir (worker restarts, failed uploads) and patch their objects."
+
+    def handle(self, *args, **options):
+        uploader = get_uploader()
+        counts = {'ready': 0, 'failed': 0, 'gone': 0}
+        for path in sorted(staging_dir().iterdir()):
+            if not path.is_file():
+                continue
+            status = process_staged_image(path, uploader)
+            if status is None:
+                counts['gone'] += 1
+            elif status == IMAGE_READY:
+                counts['ready'] += 1
+            else:
+                counts['failed'] += 1
+        self.stdout.write(f"uploaded {counts['ready']}, failed {counts['failed']}, object deleted {counts['gone']}")
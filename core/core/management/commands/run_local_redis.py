@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.local_redis import LocalRedisServer
+
+
+class Command(BaseCommand):
+    help = ("Run the local Redis stand-in (core/local_redis.py) for development. "
+            "Set REDIS_URL to the printed url.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=6379)
+        parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every command")
+
+    def handle(self, *args, **options):
+        redis = LocalRedisServer(host=options['host'], port=options['port'], latency=options['latency']).start()
+        self.stdout.write(f"REDIS_URL={redis.url}")
+        try:
+            while True:
+                time.sleep(60)
+                self.stdout.write(f"{dict(redis.counters)}, {redis.used_memory():,} bytes")
+        except KeyboardInterrupt:
+            pass
+        finally:
+            redis.stop()
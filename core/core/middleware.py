@@ -0,0 +1,18 @@
+class RateLimitHeadersMiddleware:
+    """
+    RateLimit-Limit / -Remaining / -Reset on responses of throttled views, from
+    the tightest throttle of the request (core/throttles.py). 429 responses also
+    carry DRF's Retry-After.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        rate_limit = getattr(request, 'rate_limit', None)
+        if rate_limit is not None:
+            limit, remaining, reset = rate_limit
+            response['RateLimit-Limit'] = str(limit)
+            response['RateLimit-Remaining'] = str(remaining)
+            response['RateLimit-Reset'] = str(reset)
+        return response
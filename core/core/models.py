@@ -0,0 +1,26 @@
+from django.db import models
+
+
+class JobCheckpoint(models.Model):
+    """
+    last processed position of a resumable background job (keyed by job name),
+    written after every chunk so a restarted job continues where it stopped
+    """
+    name = models.CharField(max_length=100, unique=True)
+    position = models.JSONField(default=dict, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.position}"
+
+
+def load_checkpoint(name):
+    return JobCheckpoint.objects.filter(name=name).values_list('position', flat=True).first()
+
+
+def save_checkpoint(name, position):
+    JobCheckpoint.objects.update_or_create(name=name, defaults={'position': position})
+
+
+def clear_checkpoint(name):
+    JobCheckpoint.objects.filter(name=name).delete()
@@ -0,0 +1,97 @@
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+
+from .uploads import schedule_image_upload
+
+
+def sparse_options(request):
+    """
+    serializer kwargs from ?fields=a,b,c and ?expand=x,y (GET only)
+    """
+    if request is None or request.method not in ('GET', 'HEAD'):
+        return {}
+    params = request.query_params
+    fields = [name for name in params.get('fields', '').split(',') if name]
+    expand = [name for name in params.get('expand', '').split(',') if name]
+    return {'fields': fields or None, 'expand': expand}
+
+
+class SparseFieldsetMixin:
+    """
+    Sparse fieldsets for ModelSerializers.
+    fields=[...] keeps only the named fields.
+    expand=[...] swaps a relation listed in expandable_fields (rendered as its id
+    by default) for the nested serializer.
+    """
+    expandable_fields = {}
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        expand = kwargs.pop('expand', None) or ()
+        super().__init__(*args, **kwargs)
+
+        for name in expand:
+            serializer_class = self.expandable_fields.get(name)
+            if serializer_class is not None and name in self.fields:
+                self.fields[name] = serializer_class(read_only=True)
+        if fields:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class DeferredImageMixin:
+    """
+    The image is not written through the storage backend inside the request.
+    It is staged on local disk, the object is marked image_status='pending' and
+    the background pool uploads it and patches the object (core/uploads.py).
+    """
+    deferred_image_field = 'image'
+
+    def save(self, **kwargs):
+        image = self.validated_data.pop(self.deferred_image_field, None)
+        instance = super().save(**kwargs)
+        if image is not None:
+            schedule_image_upload(instance, self.deferred_image_field, image)
+        return instance
+
+
+def _column(model, source):
+    try:
+        field = model._meta.get_field(source)
+    except FieldDoesNotExist:
+        return None
+    return field if field.concrete else None
+
+
+def sparse_only(queryset, serializer):
+    """
+    Restrict the queryset to the columns the serializer reads:
+    only() for plain fields, select_related() + only() for expanded relations,
+    and no join at all for relations rendered as ids.
+    Falls back to the unchanged queryset when a field is not a plain model column.
+    """
+    serializer = getattr(serializer, 'child', serializer)
+    model = queryset.model
+    columns, related = [], []
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        model_field = _column(model, field.source)
+        if model_field is None:
+            return queryset
+        columns.append(field.source)
+        if isinstance(field, serializers.BaseSerializer):
+            nested = getattr(field, 'child', field)
+            related_model = model_field.related_model
+            related.append(field.source)
+            for nested_field in nested.fields.values():
+                if nested_field.write_only:
+                    continue
+                if _column(related_model, nested_field.source) is None:
+                    return queryset
+                columns.append(f'{field.source}__{nested_field.source}')
+
+    queryset = queryset.select_related(None)
+    if related:
+        queryset = queryset.select_related(*related)
+    return queryset.only(*columns)
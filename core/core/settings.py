@@ -56,10 +56,12 @@ INSTALLED_APPS = [
     'cloudinary',
     'cloudinary_storage',
 
+    'core',
     'accounts',
     'device',
     'imei_authorization',
     'payments',
+    'stats',
 ]
 
 MIDDLEWARE = [
@@ -71,6 +73,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.RateLimitHeadersMiddleware',
 ]
 
 ROOT_URLCONF = 'core.urls'
@@ -102,6 +105,12 @@ if DEBUG:
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': BASE_DIR / 'db.sqlite3',
+            # background threads (image uploads, webhook drain) write next to the requests:
+            # take the write lock at BEGIN and wait for it, instead of failing with "database is locked"
+            'OPTIONS': {
+                'transaction_mode': 'IMMEDIATE',
+                'timeout': 20,
+            },
         }
     }
 
@@ -122,6 +131,60 @@ else:
 
 
 
+# Cache
+# Redis when REDIS_URL is set (shared by all workers), per process LocMem otherwise (dev/tests).
+
+REDIS_URL = os.getenv('REDIS_URL')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# users resolved for JWT requests (accounts/authentication.py): a per-process LRU for AUTH_USER_LOCAL_TTL
+# seconds, then entries in AUTH_USER_CACHE_ALIAS when that cache is shared by all workers (REDIS_URL), the
+# database otherwise. Another process keeps using a changed (e.g. deactivated) user until its LRU entry expires.
+AUTH_USER_CACHE_ALIAS = 'default'
+AUTH_USER_CACHE_TTL = 300
+AUTH_USER_LOCAL_TTL = int(os.getenv('AUTH_USER_LOCAL_TTL', '5'))
+AUTH_USER_LOCAL_SIZE = 1024
+
+# throttle counters (core/throttles.py), shared by all workers only with REDIS_URL
+THROTTLE_CACHE_ALIAS = 'default'
+
+# OTP codes live hashed in this cache (accounts/otp_store.py) when it is shared by all web processes,
+# in the OTPCode table otherwise
+OTP_CACHE_ALIAS = 'default'
+OTP_TTL = int(os.getenv('OTP_TTL', '600'))
+OTP_MAX_ATTEMPTS = 5
+
+# device list/detail response cache (device/cache.py), only used when this cache is shared by all web processes
+DEVICE_CACHE_ALIAS = 'default'
+DEVICE_CACHE_TIMEOUT = int(os.getenv('DEVICE_CACHE_TIMEOUT', '300'))
+
+# rows fetched per round trip by the streaming exports (core/export.py)
+EXPORT_CHUNK_SIZE = 2000
+
+# seconds between the two drift reads of `manage.py reconcile_stats` (stats/services.py),
+# run it periodically: deltas are applied after the commit and lost with a process killed in between
+STATS_RECONCILE_SETTLE = 5
+
+# IMEIs per lookup + bulk insert in whitelist ingestion (imei_authorization/services.py, non PostgreSQL)
+IMEI_INGEST_CHUNK_SIZE = 5000
+
+# devices per UPDATE when IMEIs are whitelisted / removed (device/authorization.py)
+DEVICE_AUTHORIZATION_CHUNK_SIZE = 1000
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -168,16 +231,18 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # simplejwt's JWTAuthentication with the user cached instead of selected per request
+        'accounts.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
+    # sliding window counters in the shared cache instead of per process history lists
     'DEFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.AnonRateThrottle',
-        'rest_framework.throttling.UserRateThrottle'
+        'core.throttles.AnonRateThrottle',
+        'core.throttles.UserRateThrottle'
     ],
     'DEFAULT_THROTTLE_RATES': {
         'anon': '100/hour',
@@ -197,8 +262,15 @@ SIMPLE_JWT = {
     'BLACKLIST_AFTER_ROTATION': True,
     'ALGORITHM': 'HS256',
     'SIGNING_KEY': SECRET_KEY,
+    # rotation revokes through accounts/token_blacklist.py (the cache with REDIS_URL), not a row per refresh
+    'TOKEN_REFRESH_SERIALIZER': 'accounts.serializers.TokenRefreshSerializer',
 }
 
+# revoked refresh tokens (accounts/token_blacklist.py), simplejwt's tables when this cache is not shared
+TOKEN_BLACKLIST_CACHE_ALIAS = 'default'
+TOKEN_BLACKLIST_CHECK_DATABASE = os.getenv('TOKEN_BLACKLIST_CHECK_DATABASE', 'True') == 'True'
+TOKEN_BLACKLIST_PRUNE_BATCH_SIZE = 1000
+
 
 
 if DEBUG:
@@ -208,6 +280,9 @@ else:
         
     ]
 
+# let browser clients read the throttle headers
+CORS_EXPOSE_HEADERS = ['Retry-After', 'RateLimit-Limit', 'RateLimit-Remaining', 'RateLimit-Reset']
+
 
 
 # Cloudinary setup
@@ -221,6 +296,13 @@ cloudinary.config(
 
 DEFAULT_FILE_STORAGE = 'cloudinary_storage.storage.MediaCloudinaryStorage'
 MEDIA_URL = '/media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
+# Image uploads run in a background pool (core/uploads.py), requests only stage the file locally.
+# core.uploads.LocalImageUploader replaces Cloudinary for offline development / load tests.
+IMAGE_UPLOADER = os.getenv('IMAGE_UPLOADER', 'core.uploads.CloudinaryImageUploader')
+IMAGE_STAGING_DIR = BASE_DIR / 'media' / 'staging'
+IMAGE_UPLOAD_WORKERS = int(os.getenv('IMAGE_UPLOAD_WORKERS', '4'))
 
 
 AUTH_USER_MODEL = 'accounts.User'
@@ -232,11 +314,73 @@ EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
 EMAIL_USE_TLS = os.getenv('EMAIL_USE_TLS', default=True)
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
+# seconds before a blocked SMTP connect / command gives up (Django waits forever by default)
+EMAIL_TIMEOUT = int(os.getenv('EMAIL_TIMEOUT', '10'))
+
+# OTP mails are queued in the OutgoingEmail outbox and sent in the background (accounts/outbox.py).
+# EMAIL_OUTBOX_INLINE sends from a background thread of the web process,
+# set it to False when dedicated `manage.py process_email_outbox` workers run.
+EMAIL_OUTBOX_ENABLED = os.getenv('EMAIL_OUTBOX_ENABLED', 'True') == 'True'
+EMAIL_OUTBOX_INLINE = os.getenv('EMAIL_OUTBOX_INLINE', 'True') == 'True'
+EMAIL_OUTBOX_BATCH_SIZE = 20
+EMAIL_OUTBOX_MAX_ATTEMPTS = 6
+# first retry after this many seconds, doubling up to EMAIL_OUTBOX_RETRY_BACKOFF_MAX
+EMAIL_OUTBOX_RETRY_BACKOFF = 5
+EMAIL_OUTBOX_RETRY_BACKOFF_MAX = 600
+# open SMTP connections kept per process, and seconds an idle one is kept
+EMAIL_POOL_SIZE = int(os.getenv('EMAIL_POOL_SIZE', '2'))
+EMAIL_POOL_IDLE_TIMEOUT = 60
 SSL_STORE_ID = os.getenv('SSL_STORE_ID')
 SSL_STORE_PASSWORD = os.getenv('SSL_STORE_PASSWORD')
 SSL_SANDBOX_URL = os.getenv('SSL_SANDBOX_URL')
+SSL_VALIDATION_URL = os.getenv('SSL_VALIDATION_URL')
+SSL_TRANSACTION_QUERY_URL = os.getenv('SSL_TRANSACTION_QUERY_URL')
+# seconds a gateway checkout session is reused for repeated create requests of the same device
+PAYMENT_SESSION_TTL = int(os.getenv('PAYMENT_SESSION_TTL', '900'))
+# seconds a new payment without a gateway session counts as being initialized by another request
+PAYMENT_INIT_TTL = int(os.getenv('PAYMENT_INIT_TTL', '60'))
+# confirm every success IPN with the gateway's validation API before authorizing the device
+PAYMENT_VALIDATE_IPN = os.getenv('PAYMENT_VALIDATE_IPN', 'True') == 'True'
+
+# payment gateway HTTP client (payments/adapters/transport.py), one keep-alive pool per process
+PAYMENT_HTTP_CONNECT_TIMEOUT = float(os.getenv('PAYMENT_HTTP_CONNECT_TIMEOUT', '3.05'))
+PAYMENT_HTTP_READ_TIMEOUT = float(os.getenv('PAYMENT_HTTP_READ_TIMEOUT', '10'))
+PAYMENT_HTTP_POOL_SIZE = 10
+PAYMENT_HTTP_MAX_RETRIES = 2
+PAYMENT_HTTP_BACKOFF = 0.25
+# consecutive failures that open the circuit, and seconds before a trial request
+PAYMENT_CIRCUIT_FAILURE_THRESHOLD = 5
+PAYMENT_CIRCUIT_RESET_TIMEOUT = 30
+
+# Gateway webhooks (IPN) are stored in the WebhookEvent inbox and acknowledged at once (payments/webhooks.py).
+# PAYMENT_WEBHOOK_INLINE drains the inbox in a background thread of the web process,
+# set it to False when dedicated `manage.py process_webhooks` workers run.
+PAYMENT_WEBHOOK_INLINE = os.getenv('PAYMENT_WEBHOOK_INLINE', 'True') == 'True'
+PAYMENT_WEBHOOK_WORKERS = int(os.getenv('PAYMENT_WEBHOOK_WORKERS', '4'))
+PAYMENT_WEBHOOK_BATCH_SIZE = 50
+# a failing event (gateway / validation API down) is retried after PAYMENT_WEBHOOK_RETRY_BACKOFF seconds,
+# doubling up to PAYMENT_WEBHOOK_RETRY_BACKOFF_MAX: 10 attempts span about an hour and a half
+PAYMENT_WEBHOOK_MAX_ATTEMPTS = 10
+PAYMENT_WEBHOOK_RETRY_BACKOFF = 10
+PAYMENT_WEBHOOK_RETRY_BACKOFF_MAX = 1800
+# seconds a worker may spend on a claimed batch before another worker takes it over
+PAYMENT_WEBHOOK_LEASE = 600
+
+# Pending payment sweep (payments/reconciliation.py, `manage.py sweep_pending_payments`):
+# payments still pending after PAYMENT_SWEEP_MIN_AGE seconds are looked up with the gateway's
+# transaction query, those without a result are expired after PAYMENT_PENDING_TTL seconds.
+PAYMENT_SWEEP_MIN_AGE = int(os.getenv('PAYMENT_SWEEP_MIN_AGE', '900'))
+PAYMENT_PENDING_TTL = int(os.getenv('PAYMENT_PENDING_TTL', '86400'))
+PAYMENT_SWEEP_BATCH_SIZE = 200
+PAYMENT_SWEEP_WORKERS = 8
 
 
 
 # Public domain (used for success/fail/ipn urls). During dev use ngrok HTTPS URL.
 PUBLIC_DOMAIN = os.getenv('PUBLIC_DOMAIN')
+
+
+# In process authorized IMEI index (imei_authorization/index.py). Every lookup compares a version
+# counter in this cache, so only a cache shared by all web processes is used, lookups query the table otherwise.
+IMEI_INDEX_CACHE_ALIAS = 'default'
+IMEI_INDEX_VERIFY_HITS = True
@@ -0,0 +1,228 @@
+import io
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+from django.core.cache import caches
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import transaction
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from PIL import Image
+from rest_framework.request import Request
+from rest_framework.test import APITestCase
+
+from accounts.models import User
+from device.models import Device
+from .throttles import AnonRateThrottle
+from .transactions import defer_until_commit
+from .uploads import (IMAGE_FAILED, IMAGE_PENDING, IMAGE_READY, ImageUploader, parse_staged_name,
+                      process_staged_image, stage_image)
+
+
+def png(name='device.png'):
+    content = io.BytesIO()
+    Image.new('RGB', (1, 1)).save(content, 'PNG')
+    return SimpleUploadedFile(name, content.getvalue(), content_type='image/png')
+
+
+class StubUploader(ImageUploader):
+    def __init__(self, error=None):
+        self.error, self.uploaded = error, []
+
+    def upload(self, path, field):
+        if self.error:
+            raise self.error
+        self.uploaded.append(Path(path).name)
+        return f'image/upload/v1/{Path(path).stem}'
+
+
+# the pool threads and the test share the connection, process_staged_image must not close it
+@mock.patch('core.uploads.close_old_connections')
+class ImageUploadTests(APITestCase):
+    def setUp(self):
+        self.staging = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        self.enterContext(override_settings(IMAGE_STAGING_DIR=self.staging))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user = User.objects.create_user('owner@example.com', 'secret123')
+            self.device = Device.objects.create(owner=self.user, name='pixel', imei='350000000000001', price=100)
+        self.client.force_authenticate(self.user)
+
+    def put_image(self):
+        with mock.patch('core.uploads.get_executor') as get_executor:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.put(f'/api/v1/device/{self.device.pk}/', {'image': png()}, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        (path,) = self.staging.iterdir()
+        get_executor.return_value.submit.assert_called_once_with(process_staged_image, path)
+        return response, path
+
+    def test_request_only_stages_the_image(self, _):
+        response, path = self.put_image()
+        self.assertEqual(response.data['data']['image_status'], IMAGE_PENDING)
+        self.assertTrue(path.name.startswith(f'device.device.{self.device.pk}.image.'))
+        self.device.refresh_from_db()
+        self.assertEqual(self.device.image_status, IMAGE_PENDING)
+        self.assertFalse(self.device.image)
+
+    def test_worker_uploads_and_patches_the_object(self, _):
+        _, path = self.put_image()
+        uploader = StubUploader()
+        self.assertEqual(process_staged_image(path, uploader), IMAGE_READY)
+        self.device.refresh_from_db()
+        self.assertEqual(self.device.image_status, IMAGE_READY)
+        self.assertEqual(uploader.uploaded, [path.name])
+        self.assertTrue(self.device.image)
+        self.assertFalse(path.exists())
+
+    def test_failed_upload_keeps_the_file_for_a_retry(self, _):
+        _, path = self.put_image()
+        with self.assertLogs('core.uploads', 'ERROR'):
+            self.assertEqual(process_staged_image(path, StubUploader(OSError('timeout'))), IMAGE_FAILED)
+        self.device.refresh_from_db()
+        self.assertEqual(self.device.image_status, IMAGE_FAILED)
+        self.assertTrue(path.exists())
+
+        uploader = StubUploader()
+        with mock.patch('core.management.commands.process_staged_images.get_uploader', return_value=uploader):
+            call_command('process_staged_images', stdout=io.StringIO())
+        self.assertEqual(uploader.uploaded, [path.name])
+        self.device.refresh_from_db()
+        self.assertEqual(self.device.image_status, IMAGE_READY)
+
+    def test_deleted_object_drops_the_file(self, _):
+        _, path = self.put_image()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.device.delete()
+        self.assertIsNone(process_staged_image(path, StubUploader()))
+        self.assertFalse(path.exists())
+
+
+class StagedNameTests(TestCase):
+    def test_profile_images_are_staged_too(self):
+        with tempfile.TemporaryDirectory() as staging, override_settings(IMAGE_STAGING_DIR=Path(staging)):
+            user = User(pk=7)
+            path = stage_image(user, 'image', png('me.PNG'))
+            self.assertEqual(parse_staged_name(path), (User, '7', 'image'))
+            self.assertEqual(path.suffix, '.png')
+
+
+class SlidingWindowThrottleTests(SimpleTestCase):
+    start = 60 * 100  # a window boundary
+
+    def setUp(self):
+        self.now = self.start
+        self.throttle_class = type('TestThrottle', (AnonRateThrottle,), {
+            'cache': LocMemCache('throttle-tests', {}), 'rate': '4/min', 'timer': lambda throttle: self.now})
+        self.throttle_class.cache.clear()
+
+    def check(self, at=None, ip='203.0.113.7'):
+        if at is not None:
+            self.now = self.start + at
+        throttle = self.throttle_class()
+        allowed = throttle.allow_request(Request(RequestFactory().get('/', REMOTE_ADDR=ip)), None)
+        return allowed, (None if allowed else throttle.wait())
+
+    def test_allows_up_to_the_limit_then_denies(self):
+        for _ in range(4):
+            self.assertEqual(self.check(), (True, None))
+        allowed, wait = self.check()
+        self.assertFalse(allowed)
+        # a quarter of this window has to slide out of the next one
+        self.assertEqual(wait, 75)
+        self.assertFalse(self.check(at=74)[0])
+        self.assertTrue(self.check(at=75)[0])
+
+    def test_denied_requests_are_not_counted(self):
+        for _ in range(20):
+            self.check()
+        # 4 counted: half the previous window leaves room for 2
+        self.assertEqual([self.check(at=90)[0] for _ in range(3)], [True, True, False])
+
+    def test_previous_window_is_weighted(self):
+        for _ in range(4):
+            self.check(at=59)
+        self.assertEqual([self.check(at=90)[0] for _ in range(3)], [True, True, False])
+        allowed, wait = self.check(at=90)
+        self.assertEqual(wait, 15)
+        self.assertTrue(self.check(at=105)[0])
+
+    def test_limit_is_shared_by_the_workers(self):
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        # two web processes, each with its own client of the same shared cache
+        workers = [type('WorkerThrottle', (self.throttle_class,), {'cache': FileBasedCache(directory, {})})
+                   for _ in range(2)]
+        allowed = []
+        for i in range(6):
+            self.throttle_class = workers[i % 2]
+            allowed.append(self.check()[0])
+        self.assertEqual(allowed, [True] * 4 + [False] * 2)
+
+    def test_clients_are_counted_apart(self):
+        for _ in range(4):
+            self.check()
+        self.assertFalse(self.check()[0])
+        self.assertTrue(self.check(ip='203.0.113.8')[0])
+
+
+class ThrottledViewTests(APITestCase):
+    url = '/api/v1/accounts/verify-otp/'  # 3/hour
+
+    def setUp(self):
+        caches['default'].clear()
+
+    def test_429_with_retry_after(self):
+        for remaining in (2, 1, 0):
+            response = self.client.post(self.url, {})
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response['RateLimit-Limit'], '3')
+            self.assertEqual(response['RateLimit-Remaining'], str(remaining))
+        response = self.client.post(self.url, {})
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+        self.assertLessEqual(int(response['Retry-After']), 2 * 3600)
+        self.assertEqual(response['RateLimit-Remaining'], '0')
+
+
+class DeferUntilCommitTests(TestCase):
+    def setUp(self):
+        self.flushed = []
+
+    def defer(self, item):
+        defer_until_commit('test', item, self.flushed.append)
+
+    def test_items_are_flushed_once_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                for item in (1, 2, 3):
+                    self.defer(item)
+                self.assertEqual(self.flushed, [])
+        self.assertEqual(self.flushed, [[1, 2, 3]])
+
+    def test_rollback_drops_the_items(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(ZeroDivisionError), transaction.atomic():
+                self.defer(1)
+                1 / 0
+        self.assertEqual(self.flushed, [])
+
+    def test_savepoint_rollback_drops_only_its_items(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                self.defer(1)
+                with self.assertRaises(ZeroDivisionError), transaction.atomic():
+                    self.defer(2)
+                    1 / 0
+                with transaction.atomic():
+                    self.defer(3)
+                self.defer(4)
+        self.assertEqual(sorted(item for items in self.flushed for item in items), [1, 3, 4])
+
+
+class DeferUntilCommitAutocommitTests(TransactionTestCase):
+    def test_flushes_right_away_outside_a_transaction(self):
+        flushed = []
+        defer_until_commit('test', 1, flushed.append)
+        self.assertEqual(flushed, [[1]])
@@ -1,4 +1,71 @@
-from rest_framework.throttling import UserRateThrottle, AnonRateThrottle
+import math
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import throttling
+
+
+class SlidingWindowThrottleMixin:
+    """
+    Sliding window counter on atomic cache counters, instead of DRF's timestamp
+    history list that is read, trimmed and rewritten whole on every check.
+    One counter per client and fixed window; the estimate is this window's count
+    plus the previous window's count weighted by the share of it still inside the
+    sliding window. O(1) per check (incr + get) and, with REDIS_URL, one limit
+    shared by every worker and host. Denied requests are not counted.
+    """
+    cache = caches[getattr(settings, 'THROTTLE_CACHE_ALIAS', 'default')]
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        window, elapsed = divmod(self.timer(), self.duration)
+        current_key = f'{self.key}:{int(window)}'
+        current = self._incr(current_key)
+        previous = self.cache.get(f'{self.key}:{int(window) - 1}', 0) * (1 - elapsed / self.duration)
+        allowed = previous + current <= self.num_requests
+        if not allowed:
+            self.cache.decr(current_key)
+            current -= 1
+            self._wait = self._seconds_until_free(previous, current, elapsed)
+
+        # RateLimit-* headers (core.middleware.RateLimitHeadersMiddleware), the tightest throttle wins
+        remaining = max(0, math.floor(self.num_requests - previous - current))
+        rate_limit = getattr(request._request, 'rate_limit', None)
+        if rate_limit is None or remaining < rate_limit[1]:
+            request._request.rate_limit = (self.num_requests, remaining, math.ceil(self.duration - elapsed))
+        return allowed
+
+    def _incr(self, key):
+        try:
+            return self.cache.incr(key)
+        except ValueError:
+            # first request in this window, kept through the next one for the weighting
+            self.cache.add(key, 0, timeout=2 * self.duration + 1)
+            return self.cache.incr(key)
+
+    def _seconds_until_free(self, previous, current, elapsed):
+        if current < self.num_requests and previous:
+            # later in this window, once enough of the previous window has slid out
+            return (previous + current + 1 - self.num_requests) / previous * (self.duration - elapsed)
+        # in the next window, once enough of this one has slid out
+        share = 1 - (self.num_requests - 1) / max(current, 1)
+        return self.duration - elapsed + share * self.duration
+
+    def wait(self):
+        return self._wait
+
+
+class AnonRateThrottle(SlidingWindowThrottleMixin, throttling.AnonRateThrottle):
+    pass
+
+
+class UserRateThrottle(SlidingWindowThrottleMixin, throttling.UserRateThrottle):
+    pass
 
 
 class AuthRateThrottle(AnonRateThrottle):
@@ -15,4 +82,3 @@ class OTPRateThrottle(AnonRateThrottle):
     Rate: 3 requests per hour for anonymous users.
     """
     scope = 'otp'
-
@@ -0,0 +1,53 @@
+import threading
+import weakref
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+# (database alias, name, savepoint) -> the batch waiting for the current transaction of this thread.
+# Only Django's on_commit list holds a batch strongly: when a rollback discards the
+# callback the batch is freed and drops out of here, the next item starts a fresh one.
+_pending = threading.local()
+
+
+class _Batch:
+    def __init__(self, flush):
+        self.items = []
+        self.done = False
+        self._flush = flush
+
+    def __call__(self):
+        self.done = True
+        items, self.items = self.items, []
+        if items:
+            self._flush(items)
+
+
+def _batches():
+    if not hasattr(_pending, 'batches'):
+        _pending.batches = weakref.WeakValueDictionary()
+    return _pending.batches
+
+
+def defer_until_commit(name, item, flush, using=None):
+    """
+    Collect `item` and call flush(items) once when the current transaction commits,
+    so signal handlers firing for every row of a bulk operation turn into one
+    set based follow up instead of one per row.
+    Outside a transaction (autocommit) flush runs right away with [item].
+    Rolled back work is dropped together with Django's on_commit callbacks: items
+    are batched per innermost savepoint, so rolling one back drops just its items.
+    """
+    connection = transaction.get_connection(using)
+    if not connection.in_atomic_block:
+        flush([item])
+        return
+
+    batches = _batches()
+    savepoint = next((sid for sid in reversed(connection.savepoint_ids) if sid), None)
+    key = (using or DEFAULT_DB_ALIAS, name, savepoint)
+    batch = batches.get(key)
+    if batch is None or batch.done:
+        batch = _Batch(flush)
+        batches[key] = batch
+        transaction.on_commit(batch, using=using)
+    batch.items.append(item)
@@ -0,0 +1,163 @@
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+IMAGE_PENDING = 'pending'
+IMAGE_READY = 'ready'
+IMAGE_FAILED = 'failed'
+
+IMAGE_STATUS_CHOICES = [
+    (IMAGE_PENDING, 'Pending'),
+    (IMAGE_READY, 'Ready'),
+    (IMAGE_FAILED, 'Failed'),
+]
+
+
+class ImageUploader(ABC):
+    @abstractmethod
+    def upload(self, path, field):
+        """
+        Push the staged file at `path` to the storage backend.
+        Return the value to store in `field` (a CloudinaryResource or its db string).
+        """
+        raise NotImplementedError
+
+
+class CloudinaryImageUploader(ImageUploader):
+    def upload(self, path, field):
+        from cloudinary import uploader
+        options = {'type': field.type, 'resource_type': field.resource_type}
+        options.update({key: value for key, value in field.options.items() if not callable(value)})
+        return uploader.upload_resource(str(path), **options)
+
+
+class LocalImageUploader(ImageUploader):
+    """
+    Offline stand-in: copies the file under MEDIA_ROOT/local_uploads and stores
+    a cloudinary style reference to it. For development and load tests only.
+    Set IMAGE_UPLOAD_LATENCY (seconds) to simulate the remote round trip.
+    """
+    def upload(self, path, field):
+        from cloudinary import CloudinaryResource
+        latency = getattr(settings, 'IMAGE_UPLOAD_LATENCY', 0)
+        if latency:
+            time.sleep(latency)
+        target_dir = Path(settings.MEDIA_ROOT) / 'local_uploads'
+        target_dir.mkdir(parents=True, exist_ok=True)
+        path = Path(path)
+        public_id = uuid.uuid4().hex
+        shutil.copyfile(path, target_dir / f'{public_id}{path.suffix}')
+        return CloudinaryResource(public_id=f'local_uploads/{public_id}', format=path.suffix.lstrip('.') or None,
+                                  version=str(int(time.time())), type=field.type, resource_type=field.resource_type)
+
+
+def get_uploader():
+    return import_string(getattr(settings, 'IMAGE_UPLOADER', 'core.uploads.CloudinaryImageUploader'))()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=getattr(settings, 'IMAGE_UPLOAD_WORKERS', 4),
+                                               thread_name_prefix='image-upload')
+    return _executor
+
+
+def staging_dir():
+    path = Path(getattr(settings, 'IMAGE_STAGING_DIR', Path(settings.BASE_DIR) / 'media' / 'staging'))
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def _status_update_fields(model, *field_names):
+    update_fields = [*field_names, 'image_status']
+    if any(f.name == 'updated_at' for f in model._meta.concrete_fields):
+        update_fields.append('updated_at')
+    return update_fields
+
+
+def stage_image(instance, field_name, upload):
+    """
+    Write the uploaded file to the local staging dir.
+    The name carries <app_label>.<model>.<pk>.<field> so process_staged_images can
+    resume jobs lost with a worker restart.
+    """
+    suffix = Path(upload.name or '').suffix.lower()
+    meta = instance._meta
+    name = f'{meta.app_label}.{meta.model_name}.{instance.pk}.{field_name}.{uuid.uuid4().hex}{suffix}'
+    path = staging_dir() / name
+    with open(path, 'wb') as destination:
+        for chunk in upload.chunks():
+            destination.write(chunk)
+    return path
+
+
+def schedule_image_upload(instance, field_name, upload):
+    """
+    Stage the image, mark the object pending and hand the upload to the
+    background pool once the surrounding transaction commits.
+    """
+    path = stage_image(instance, field_name, upload)
+    instance.image_status = IMAGE_PENDING
+    # save() rather than update() so the model signals (caches, ETags, ...) see the change
+    instance.save(update_fields=_status_update_fields(type(instance)))
+    transaction.on_commit(lambda: get_executor().submit(process_staged_image, path))
+    return path
+
+
+def parse_staged_name(path):
+    app_label, model_name, pk, field_name, _ = Path(path).name.split('.', 4)
+    return apps.get_model(app_label, model_name), pk, field_name
+
+
+def process_staged_image(path, uploader=None):
+    """
+    Upload one staged file and patch the model, runs in the worker pool
+    (or inline from the process_staged_images command).
+    Returns the resulting image status, None when the object is gone.
+    """
+    close_old_connections()
+    try:
+        model, pk, field_name = parse_staged_name(path)
+        try:
+            instance = model._default_manager.get(pk=pk)
+        except model.DoesNotExist:
+            os.remove(path)
+            return None
+
+        field = model._meta.get_field(field_name)
+        update_fields = _status_update_fields(model, field_name)
+        try:
+            setattr(instance, field_name, (uploader or get_uploader()).upload(path, field))
+            instance.image_status = IMAGE_READY
+        except Exception:
+            # the staged file stays for a retry with process_staged_images
+            logger.exception("Image upload failed for %s", Path(path).name)
+            instance.image_status = IMAGE_FAILED
+            instance.save(update_fields=update_fields[1:])
+            return IMAGE_FAILED
+        # save() so the model signals (caches, ...) see the change
+        instance.save(update_fields=update_fields)
+        os.remove(path)
+        return IMAGE_READY
+    finally:
+        close_old_connections()
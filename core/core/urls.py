@@ -23,5 +23,6 @@ urlpatterns = [
     path('api/v1/device/', include('device.urls')),
     path('api/v1/imei/', include('imei_authorization.urls')),
     path('api/v1/payments/', include('payments.urls')),
+    path('api/v1/stats/', include('stats.urls')),
 
 ]
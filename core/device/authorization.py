@@ -0,0 +1,110 @@
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from core.bulk import chunked
+from core.models import clear_checkpoint, load_checkpoint, save_checkpoint
+from core.transactions import defer_until_commit
+from imei_authorization.models import AuthorizedIMEI
+from stats.models import DeviceStat
+from stats.services import apply_device_deltas
+from .cache import bump_owner_versions
+from .models import Device
+
+AUTHORIZATION_CHUNK_SIZE = getattr(settings, 'DEVICE_AUTHORIZATION_CHUNK_SIZE', 1000)
+RECONCILE_JOB = 'device_authorization_reconcile'
+
+
+def _set_authorized(lookup, authorized):
+    """
+    Flip is_authorized on the devices matching `lookup` that are not already there.
+    One short transaction per call: lock the changing rows, one UPDATE by primary key,
+    queue the stats deltas. queryset.update() sends no signals, the device caches are
+    bumped explicitly once the change is committed.
+    """
+    with transaction.atomic():
+        rows = list(Device.objects.select_for_update()
+                    .filter(is_authorized=not authorized, **lookup).values_list('pk', 'owner_id'))
+        if not rows:
+            return 0
+        updated = Device.objects.filter(pk__in=[pk for pk, _ in rows]).update(
+            is_authorized=authorized, updated_at=timezone.now())
+        now, before = ('true', 'false') if authorized else ('false', 'true')
+        apply_device_deltas(Counter({(DeviceStat.DIMENSION_AUTHORIZED, now): updated,
+                                     (DeviceStat.DIMENSION_AUTHORIZED, before): -updated}))
+        for owner_id in {owner_id for _, owner_id in rows}:
+            defer_until_commit('device_cache', owner_id, bump_owner_versions)
+    return updated
+
+
+def authorize_device(device_id):
+    """
+    Authorize one device, a no-op (returns 0) when it already is.
+    Conditional like every change here, so concurrent payment confirmations
+    authorize a device exactly once.
+    """
+    return _set_authorized({'pk': device_id}, True)
+
+
+def set_authorized_for_imeis(imeis, authorized, chunk_size=AUTHORIZATION_CHUNK_SIZE):
+    """
+    Authorize (or revoke) every device carrying one of `imeis` with set based
+    `UPDATE ... WHERE imei IN (...)` statements of at most chunk_size IMEIs each,
+    so no transaction holds row locks for long.
+    Returns the number of devices changed.
+    """
+    changed = 0
+    for chunk in chunked(dict.fromkeys(imei for imei in imeis if imei), chunk_size):
+        changed += _set_authorized({'imei__in': chunk}, authorized)
+    return changed
+
+
+def apply_imei_changes(changes):
+    """
+    committed ('add' | 'remove', imei) changes of the AuthorizedIMEI table, the last one per IMEI wins
+    """
+    final = {}
+    for action, imei in changes:
+        final[imei] = action
+    set_authorized_for_imeis([imei for imei, action in final.items() if action == 'add'], True)
+    set_authorized_for_imeis([imei for imei, action in final.items() if action == 'remove'], False)
+
+
+def reconcile_authorization(chunk_size=AUTHORIZATION_CHUNK_SIZE, grant_only=False, restart=False, on_chunk=None):
+    """
+    Walk the whole device table in primary key order and make is_authorized match
+    the AuthorizedIMEI table: devices with a whitelisted IMEI are authorized, devices
+    with an IMEI that is not whitelisted are revoked (unless grant_only).
+    Devices without an IMEI are left alone.
+    Progress is checkpointed after every chunk (core.models.JobCheckpoint), a stopped
+    run continues from there unless restart=True.
+    on_chunk(progress) is called after every chunk. Returns the final progress dict.
+    """
+    if restart:
+        clear_checkpoint(RECONCILE_JOB)
+    progress = load_checkpoint(RECONCILE_JOB) or {'last_pk': 0, 'scanned': 0, 'authorized': 0, 'revoked': 0}
+
+    while True:
+        rows = list(Device.objects.filter(pk__gt=progress['last_pk']).exclude(imei__isnull=True).exclude(imei='')
+                    .order_by('pk').values_list('pk', 'imei', 'is_authorized')[:chunk_size])
+        if not rows:
+            break
+        whitelisted = set(AuthorizedIMEI.objects.filter(imei__in=[imei for _, imei, _ in rows])
+                          .values_list('imei', flat=True))
+        grant = [pk for pk, imei, authorized in rows if not authorized and imei in whitelisted]
+        revoke = [] if grant_only else [pk for pk, imei, authorized in rows if authorized and imei not in whitelisted]
+        if grant:
+            progress['authorized'] += _set_authorized({'pk__in': grant}, True)
+        if revoke:
+            progress['revoked'] += _set_authorized({'pk__in': revoke}, False)
+
+        progress['last_pk'] = rows[-1][0]
+        progress['scanned'] += len(rows)
+        save_checkpoint(RECONCILE_JOB, progress)
+        if on_chunk is not None:
+            on_chunk(progress)
+
+    clear_checkpoint(RECONCILE_JOB)
+    return progress
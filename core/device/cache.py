@@ -0,0 +1,82 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from core.caches import is_shared
+OWNER_VERSION_KEY = 'device:version:owner:{}'
+GLOBAL_VERSION_KEY = 'device:version:all'
+
+
+def get_cache():
+    return caches[getattr(settings, 'DEVICE_CACHE_ALIAS', 'default')]
+
+
+def is_enabled():
+    """
+    Responses are only cached in a cache shared by all web processes: bump_owner_versions()
+    reaches the entries of its own process only, the other workers of a per process
+    memory cache would keep serving stale devices until the timeout.
+    """
+    return is_shared(getattr(settings, 'DEVICE_CACHE_ALIAS', 'default'))
+
+
+def _version(cache, key):
+    version = cache.get(key)
+    if version is None:
+        # unknown or evicted, start from a value older entries cannot have been stored under
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def _bump(cache, key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), timeout=None)
+
+
+def bump_owner_versions(owner_ids):
+    """
+    Invalidate every cached device response of these owners and the staff listings.
+    Called from the Device/User signals, and directly after bulk writes
+    (bulk_create, queryset.update) that do not send them.
+    """
+    cache = get_cache()
+    for owner_id in set(owner_ids):
+        _bump(cache, OWNER_VERSION_KEY.format(owner_id))
+    _bump(cache, GLOBAL_VERSION_KEY)
+
+
+def response_cache_key(kind, request):
+    """
+    kind: 'list' | 'detail'
+    Staff and admins share the global version (they see every device),
+    normal users are keyed by their own id and version.
+    The full url (page / cursor, is_authorized, ...) is part of the key.
+    None when responses are not cached (is_enabled()).
+    """
+    if not is_enabled():
+        return None
+    cache = get_cache()
+    user = request.user
+    if user.is_staff or user.is_superuser:
+        scope, version = 'all', _version(cache, GLOBAL_VERSION_KEY)
+    else:
+        scope, version = user.pk, _version(cache, OWNER_VERSION_KEY.format(user.pk))
+    digest = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+    return f'device:response:{kind}:{scope}:{version}:{digest}'
+
+
+def get_cached(key):
+    if key is None:
+        return None
+    return get_cache().get(key)
+
+
+def set_cached(key, data):
+    if key is None:
+        return
+    get_cache().set(key, data, getattr(settings, 'DEVICE_CACHE_TIMEOUT', 300))
@@ -0,0 +1,67 @@
+import random
+
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory, override_settings
+from rest_framework.test import force_authenticate
+
+from accounts.models import User
+from core.benchmarks import temporary_database, timed
+from core.latency import format_summary, summarize
+from device.models import Device
+from device.views import DeviceSearchView
+
+WORDS = ['galaxy', 'pixel', 'iphone', 'redmi', 'nokia', 'xperia', 'moto', 'oneplus', 'mate', 'nova',
+         'pro', 'max', 'lite', 'ultra', 'mini', 'plus', 'fold', 'flip', 'note', 'edge']
+TYPES = ['phone', 'tablet', 'watch', 'router', 'laptop']
+OSES = ['android', 'ios', 'harmonyos', 'kaios', 'linux']
+
+
+class Command(BaseCommand):
+    help = "Seed a throwaway database with devices and time /api/v1/device/search/ first pages."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--devices', type=int, default=100_000)
+        parser.add_argument('--owners', type=int, default=1000)
+        parser.add_argument('--queries', type=int, default=200)
+
+    def handle(self, *args, **options):
+        with temporary_database(), override_settings(ALLOWED_HOSTS=['testserver']):
+            self._run(options)
+
+    def _run(self, options):
+        rng = random.Random(7)
+        owners = User.objects.bulk_create(
+            [User(email=f'bench{i}@example.com', password='!') for i in range(options['owners'])])
+        staff = User.objects.create(email='staff@example.com', password='!', is_staff=True)
+
+        batch = []
+        for i in range(options['devices']):
+            name = ' '.join(rng.sample(WORDS, 2))
+            batch.append(Device(
+                owner=owners[i % len(owners)], name=name, imei=str(350000000000000 + i * 7919 % 10**14),
+                type=rng.choice(TYPES), os=rng.choice(OSES), price=100,
+                description=' '.join(rng.choices(WORDS, k=6)),
+            ))
+            if len(batch) == 5000:
+                Device.objects.bulk_create(batch)
+                batch = []
+        Device.objects.bulk_create(batch)
+        self.stdout.write(f"seeded {options['devices']:,} devices for {options['owners']:,} owners")
+
+        view = DeviceSearchView.as_view()
+        factory = RequestFactory()
+        scenarios = {
+            'staff text (2 words)': (staff, lambda: {'q': ' '.join(rng.sample(WORDS, 2))}),
+            'staff text (prefix)': (staff, lambda: {'q': rng.choice(WORDS)[:3]}),
+            'owner text': (None, lambda: {'q': rng.choice(WORDS)}),
+            'staff imei prefix': (staff, lambda: {'imei': str(35000000 + rng.randrange(10**6))}),
+        }
+        for label, (user, params) in scenarios.items():
+            samples = []
+            for _ in range(options['queries']):
+                request = factory.get('/api/v1/device/search/', params())
+                force_authenticate(request, user or rng.choice(owners))
+                response, elapsed = timed(view, request)
+                response.render()
+                samples.append(elapsed)
+            self.stdout.write(f"{label:24} {format_summary(summarize(samples))}")
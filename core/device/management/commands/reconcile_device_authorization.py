@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from device.authorization import AUTHORIZATION_CHUNK_SIZE, reconcile_authorization
+
+
+class Command(BaseCommand):
+    help = ("Make Device.is_authorized match the AuthorizedIMEI table for the whole device table, "
+            "in chunks. Resumes from the last checkpoint after an interruption.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=AUTHORIZATION_CHUNK_SIZE)
+        parser.add_argument('--grant-only', action='store_true',
+                            help="only authorize, never revoke devices whose IMEI is not whitelisted")
+        parser.add_argument('--restart', action='store_true', help="ignore the saved checkpoint")
+        parser.add_argument('--sleep', type=float, default=0.0,
+                            help="seconds to pause between chunks to limit the load")
+
+    def handle(self, *args, **options):
+        def on_chunk(progress):
+            if options['verbosity'] > 1:
+                self.stdout.write(f"up to device {progress['last_pk']}: scanned={progress['scanned']} "
+                                  f"authorized={progress['authorized']} revoked={progress['revoked']}")
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        progress = reconcile_authorization(chunk_size=options['chunk_size'], grant_only=options['grant_only'],
+                                           restart=options['restart'], on_chunk=on_chunk)
+        self.stdout.write(f"scanned={progress['scanned']} authorized={progress['authorized']} "
+                          f"revoked={progress['revoked']}")
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.4 on 2026-10-18 09:32
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('device', '0005_alter_device_created_at_alter_device_is_authorized_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='device',
+            index=models.Index(fields=['owner', 'is_authorized', '-created_at', '-id'], name='device_owner_auth_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='device',
+            index=models.Index(fields=['owner', '-created_at', '-id'], name='device_owner_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='device',
+            index=models.Index(fields=['-created_at', '-id'], name='device_keyset_idx'),
+        ),
+    ]
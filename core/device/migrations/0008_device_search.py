@@ -0,0 +1,61 @@
+from django.db import migrations
+
+# Keep in sync with device/search.py
+POSTGRES_VECTOR = (
+    "to_tsvector('simple', coalesce(name, '') || ' ' || coalesce(description, '') || ' ' "
+    "|| coalesce(type, '') || ' ' || coalesce(os, ''))"
+)
+
+POSTGRES_FORWARD = [
+    f"CREATE INDEX IF NOT EXISTS device_search_vector_idx ON device_device USING GIN (({POSTGRES_VECTOR}))",
+]
+POSTGRES_BACKWARD = [
+    "DROP INDEX IF EXISTS device_search_vector_idx",
+]
+
+# external content FTS5 table over device_device, kept current by triggers.
+# note: sqlite table rebuilds (some AlterField migrations) drop triggers, recreate them afterwards.
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS device_device_fts USING fts5("
+    "name, description, type, os, content='device_device', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS device_device_fts_ai AFTER INSERT ON device_device BEGIN "
+    "INSERT INTO device_device_fts(rowid, name, description, type, os) "
+    "VALUES (new.id, new.name, new.description, new.type, new.os); END",
+    "CREATE TRIGGER IF NOT EXISTS device_device_fts_ad AFTER DELETE ON device_device BEGIN "
+    "INSERT INTO device_device_fts(device_device_fts, rowid, name, description, type, os) "
+    "VALUES ('delete', old.id, old.name, old.description, old.type, old.os); END",
+    "CREATE TRIGGER IF NOT EXISTS device_device_fts_au AFTER UPDATE OF name, description, type, os "
+    "ON device_device BEGIN "
+    "INSERT INTO device_device_fts(device_device_fts, rowid, name, description, type, os) "
+    "VALUES ('delete', old.id, old.name, old.description, old.type, old.os); "
+    "INSERT INTO device_device_fts(rowid, name, description, type, os) "
+    "VALUES (new.id, new.name, new.description, new.type, new.os); END",
+    "INSERT INTO device_device_fts(device_device_fts) VALUES ('rebuild')",
+]
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS device_device_fts_ai",
+    "DROP TRIGGER IF EXISTS device_device_fts_ad",
+    "DROP TRIGGER IF EXISTS device_device_fts_au",
+    "DROP TABLE IF EXISTS device_device_fts",
+]
+
+
+def _run(statements_by_vendor):
+    def run(apps, schema_editor):
+        for statement in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('device', '0007_image_status'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _run({'postgresql': POSTGRES_FORWARD, 'sqlite': SQLITE_FORWARD}),
+            _run({'postgresql': POSTGRES_BACKWARD, 'sqlite': SQLITE_BACKWARD}),
+        ),
+    ]
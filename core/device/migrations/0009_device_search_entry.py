@@ -0,0 +1,24 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('device', '0008_device_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeviceSearchEntry',
+            fields=[
+                ('device', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_entry', serialize=False, to='device.device')),
+            ],
+            options={
+                'db_table': 'device_device_fts',
+                'managed': False,
+            },
+        ),
+    ]
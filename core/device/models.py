@@ -1,6 +1,7 @@
 from django.db import models
 from django.conf import settings
 from cloudinary.models import CloudinaryField
+from core.uploads import IMAGE_STATUS_CHOICES
 
 class Device(models.Model):
     owner = models.ForeignKey(settings.AUTH_USER_MODEL,on_delete=models.CASCADE,related_name='devices')
@@ -11,6 +12,7 @@ class Device(models.Model):
     os = models.CharField(max_length=50, blank=True, null=True)
     description = models.TextField(blank=True, null=True)
     image = CloudinaryField('device_image', blank=True, null=True)
+    image_status = models.CharField(max_length=10, choices=IMAGE_STATUS_CHOICES, blank=True, null=True) # set while an upload is staged/processed
     is_authorized= models.BooleanField(default=False, db_index=True)
 
     created_at = models.DateTimeField(auto_now_add=True, db_index=True)
@@ -20,7 +22,21 @@ class Device(models.Model):
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['owner', 'is_authorized']),
+            # keyset pagination: (created_at, id) per owner and table wide
+            models.Index(fields=['owner', 'is_authorized', '-created_at', '-id'], name='device_owner_auth_keyset_idx'),
+            models.Index(fields=['owner', '-created_at', '-id'], name='device_owner_keyset_idx'),
+            models.Index(fields=['-created_at', '-id'], name='device_keyset_idx'),
         ]
 
     def __str__(self):
         return f"{self.name} - {self.owner.email}"
+
+
+class DeviceSearchEntry(models.Model):
+    # the SQLite FTS5 table of migrations/0008_device_search.py, only here so device/search.py can join it
+    device = models.OneToOneField(Device, on_delete=models.DO_NOTHING, primary_key=True, db_column='rowid',
+                                  db_constraint=False, related_name='search_entry')
+
+    class Meta:
+        managed = False
+        db_table = 'device_device_fts'
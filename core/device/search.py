@@ -0,0 +1,79 @@
+import re
+from functools import reduce
+from operator import and_, or_
+
+from django.db import connection
+from django.db.models import BooleanField, DecimalField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+from core.filters import startswith_range
+
+MAX_TERMS = 8
+SEARCH_FIELDS = ('name', 'description', 'type', 'os')
+# ranks are rounded so the (rank, id) keyset cursor carries them exactly
+RANK_DIGITS = 6
+
+# same expression as the GIN index in migrations/0008_device_search.py
+POSTGRES_VECTOR = (
+    "to_tsvector('simple', coalesce(name, '') || ' ' || coalesce(description, '') || ' ' "
+    "|| coalesce(type, '') || ' ' || coalesce(os, ''))"
+)
+
+
+def search_terms(q):
+    """
+    words of the query, anything else is dropped so user input never reaches
+    the full text query syntax
+    """
+    return re.findall(r'\w+', (q or '').lower())[:MAX_TERMS]
+
+
+def _postgres(queryset, terms):
+    # every term as a prefix, all of them must match
+    tsquery = ' & '.join(f'{term}:*' for term in terms)
+    return queryset.filter(
+        RawSQL(f"{POSTGRES_VECTOR} @@ to_tsquery('simple', %s)", (tsquery,), output_field=BooleanField())
+    ).annotate(
+        # ts_rank is a float4, as numeric it survives the cursor's round trip through text
+        rank=RawSQL(f"round(ts_rank({POSTGRES_VECTOR}, to_tsquery('simple', %s))::numeric, {RANK_DIGITS})",
+                    (tsquery,), output_field=DecimalField())
+    )
+
+
+def _sqlite(queryset, terms):
+    match = ' '.join('"{}"*'.format(term.replace('"', '""')) for term in terms)
+    # inner join on the FTS5 table (DeviceSearchEntry) so bm25 comes out of the same MATCH scan
+    return queryset.filter(search_entry__isnull=False).filter(
+        RawSQL('device_device_fts MATCH %s', (match,), output_field=BooleanField())
+    ).annotate(
+        # bm25: lower is better, negated so both backends rank descending
+        rank=RawSQL(f'round(-bm25(device_device_fts), {RANK_DIGITS})', (), output_field=FloatField())
+    )
+
+
+def _contains(queryset, terms):
+    # other backends: every term in one of the fields, unranked
+    return queryset.filter(reduce(and_, (
+        reduce(or_, (Q(**{f'{field}__icontains': term}) for field in SEARCH_FIELDS)) for term in terms
+    ))).annotate(rank=Value(0.0, output_field=FloatField()))
+
+
+def search_devices(queryset, q=None, imei_prefix=None):
+    """
+    Ranked search over name, description, type and os (all terms, prefix matched)
+    and/or an IMEI prefix, applied on top of an already visibility-filtered queryset.
+    PostgreSQL uses the GIN tsvector index, SQLite the FTS5 table, other backends
+    an unranked icontains filter. The IMEI prefix is a range scan on the unique imei index.
+    Results carry a `rank` annotation (0 for IMEI only searches).
+    """
+    if imei_prefix:
+        queryset = queryset.filter(startswith_range('imei', imei_prefix))
+
+    terms = search_terms(q)
+    if not terms:
+        return queryset.annotate(rank=Value(0.0, output_field=FloatField()))
+    if connection.vendor == 'postgresql':
+        return _postgres(queryset, terms)
+    if connection.vendor == 'sqlite':
+        return _sqlite(queryset, terms)
+    return _contains(queryset, terms)
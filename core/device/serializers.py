@@ -1,18 +1,21 @@
 from rest_framework import serializers
 from .models import Device
 from accounts.serializers import UserSerializer
+from core.serializers import SparseFieldsetMixin, DeferredImageMixin
 
 
 
-class DeviceSerializer(serializers.ModelSerializer):
+class DeviceSerializer(DeferredImageMixin, SparseFieldsetMixin, serializers.ModelSerializer):
     image = serializers.ImageField(required=False)
     imei = serializers.CharField(required=True)
     price=serializers.DecimalField(max_digits=10, decimal_places=2, required=True)
 
     class Meta:
         model = Device
-        fields = ['id', 'owner', 'name','imei', 'type', 'os','price', 'description','is_authorized', 'image', 'created_at', 'updated_at']
-        read_only_fields = ['id', 'owner', 'created_at','is_authorized', 'updated_at']
+        fields = ['id', 'owner', 'name','imei', 'type', 'os','price', 'description','is_authorized', 'image', 'image_status', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'owner', 'created_at','is_authorized', 'image_status', 'updated_at']
+
+    expandable_fields = {'owner': UserSerializer}
 
     # imei should be unique
     def validate_imei(self, value):
@@ -27,14 +30,33 @@ class DeviceSerializer(serializers.ModelSerializer):
 
 
 
-class DeviceDetailedSerializer(serializers.ModelSerializer):
-    owner=UserSerializer()
+class DeviceImportSerializer(DeviceSerializer):
+    """
+    per row validation for bulk imports.
+    IMEI uniqueness is checked for the whole chunk in one query by the importer.
+    """
+
+    class Meta(DeviceSerializer.Meta):
+        fields = ['name', 'imei', 'type', 'os', 'price', 'description']
+        read_only_fields = []
+
+    def validate_imei(self, value):
+        return value.strip()
+
+
+
+class DeviceDetailedSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    """
+    owner is rendered as its id, ?expand=owner for the full user
+    """
     image = serializers.ImageField(required=False)
 
     class Meta:
         model = Device
-        fields = ['id', 'owner', 'name','imei', 'type', 'os','price', 'is_authorized', 'description', 'image', 'created_at', 'updated_at']
-        read_only_fields = ['id', 'owner', 'created_at','is_authorized', 'updated_at']
+        fields = ['id', 'owner', 'name','imei', 'type', 'os','price', 'is_authorized', 'description', 'image', 'image_status', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'owner', 'created_at','is_authorized', 'image_status', 'updated_at']
+
+    expandable_fields = {'owner': UserSerializer}
 
 
 
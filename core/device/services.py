@@ -0,0 +1,88 @@
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from rest_framework import serializers
+
+from core.bulk import chunked
+from imei_authorization.index import authorized_imeis
+from stats.services import apply_device_deltas, device_deltas
+from .models import Device
+from .cache import bump_owner_versions
+from .serializers import DeviceImportSerializer
+
+IMPORT_CHUNK_SIZE = getattr(settings, 'DEVICE_IMPORT_CHUNK_SIZE', 1000)
+
+
+def import_devices(owner, records, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Bulk create devices for `owner` from (row_number, record, error) tuples
+    (see core.bulk.iter_records).
+    Every chunk costs one set based lookup for existing devices, one for the
+    authorized IMEIs the in memory index reports as hits, and one bulk insert,
+    instead of three queries per device.
+    Returns a report with the created/failed counts and the per row errors.
+    """
+    report = {'created': 0, 'failed': 0, 'errors': []}
+    seen = set()
+    # one serializer for the whole import, building its fields per row costs more than the insert
+    validator = DeviceImportSerializer()
+    for chunk in chunked(records, chunk_size):
+        _import_chunk(owner, chunk, validator, seen, report)
+    if report['created']:
+        # bulk_create sends no post_save
+        bump_owner_versions([owner.pk])
+    return report
+
+
+def _fail(report, row, errors):
+    report['failed'] += 1
+    report['errors'].append({'row': row, 'errors': errors})
+
+
+def _import_chunk(owner, chunk, validator, seen, report):
+    valid = []
+    for row, record, error in chunk:
+        if error:
+            _fail(report, row, {'non_field_errors': [error]})
+            continue
+        try:
+            data = validator.run_validation(record)
+        except serializers.ValidationError as exc:
+            _fail(report, row, serializers.as_serializer_error(exc))
+            continue
+        if data['imei'] in seen:
+            _fail(report, row, {'imei': ["Duplicate IMEI in upload."]})
+            continue
+        seen.add(data['imei'])
+        valid.append((row, data))
+
+    if not valid:
+        return
+
+    imeis = [data['imei'] for _, data in valid]
+    existing = set(Device.objects.filter(imei__in=imeis).values_list('imei', flat=True))
+    authorized = authorized_imeis.authorized_subset(imeis)
+
+    pending = []
+    for row, data in valid:
+        if data['imei'] in existing:
+            _fail(report, row, {'imei': ["Device with this IMEI already exists."]})
+            continue
+        pending.append((row, Device(owner=owner, is_authorized=data['imei'] in authorized, **data)))
+
+    try:
+        with transaction.atomic():
+            Device.objects.bulk_create([device for _, device in pending])
+            # bulk_create sends no post_save, the stats deltas are queued by hand
+            apply_device_deltas(device_deltas(added=[(device.is_authorized, device.os, device.type)
+                                                     for _, device in pending]))
+        report['created'] += len(pending)
+    except IntegrityError:
+        # someone else took one of the IMEIs between the check and the insert,
+        # redo this chunk row by row so only the conflicting rows fail
+        for row, device in pending:
+            try:
+                with transaction.atomic():
+                    device.save()
+                report['created'] += 1
+            except IntegrityError:
+                _fail(report, row, {'imei': ["Device with this IMEI already exists."]})
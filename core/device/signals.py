@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from core.transactions import defer_until_commit
+from .cache import bump_owner_versions
+from .models import Device
+
+
+@receiver(post_save, sender=Device)
+@receiver(post_delete, sender=Device)
+def device_changed(sender, instance, **kwargs):
+    defer_until_commit('device_cache', instance.owner_id, bump_owner_versions)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def owner_changed(sender, instance, **kwargs):
+    # device details embed the owner
+    defer_until_commit('device_cache', instance.pk, bump_owner_versions)
@@ -1,3 +1,503 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import tempfile
 
-# Create your tests here.
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from accounts.models import User
+from core.serializers import sparse_only
+from imei_authorization.index import AuthorizedIMEIIndex
+from core.models import load_checkpoint
+from imei_authorization.models import AuthorizedIMEI
+from imei_authorization.services import ingest_imeis
+from stats.models import DeviceStat
+from .authorization import RECONCILE_JOB, reconcile_authorization
+from .cache import GLOBAL_VERSION_KEY, OWNER_VERSION_KEY, bump_owner_versions, get_cache, is_enabled
+from .models import Device
+from .serializers import DeviceSerializer
+
+
+def shared_cache(directory):
+    # a cache every process sees, without a Redis server
+    return override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory}})
+
+
+class DeviceTestCase(APITestCase):
+    def setUp(self):
+        self.enterContext(shared_cache(self.enterContext(tempfile.TemporaryDirectory())))
+        # response cache, version keys and throttle counters
+        get_cache().clear()
+        # every write runs its on_commit callbacks: a batch left pending by defer_until_commit
+        # would take the items of the later writes of the test
+        with self.captureOnCommitCallbacks(execute=True):
+            self.owner = User.objects.create_user('owner@example.com', 'secret123')
+        self.client.force_authenticate(self.owner)
+
+    def create_user(self, email, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            return User.objects.create_user(email, 'secret123', **fields)
+
+    def create_device(self, **fields):
+        fields.setdefault('owner', self.owner)
+        fields.setdefault('price', 100)
+        with self.captureOnCommitCallbacks(execute=True):
+            return Device.objects.create(**fields)
+
+
+class DeviceCacheTests(DeviceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.device = self.create_device(name='pixel', imei='350000000000001')
+
+    def version(self, key):
+        return get_cache().get(key)
+
+    def test_save_and_delete_bump_the_owner_and_global_versions(self):
+        owner_key, other_key = OWNER_VERSION_KEY.format(self.owner.pk), OWNER_VERSION_KEY.format(0)
+        for change in (self.device.save, self.device.delete):
+            before = self.version(owner_key), self.version(GLOBAL_VERSION_KEY), self.version(other_key)
+            with self.captureOnCommitCallbacks(execute=True):
+                change()
+            self.assertNotEqual(self.version(owner_key), before[0])
+            self.assertNotEqual(self.version(GLOBAL_VERSION_KEY), before[1])
+            self.assertEqual(self.version(other_key), before[2])
+
+    def test_bump_waits_for_the_commit(self):
+        key = OWNER_VERSION_KEY.format(self.owner.pk)
+        before = self.version(key)
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            self.device.save()
+        self.assertEqual(self.version(key), before)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(self.version(key), before)
+
+    def test_cached_responses_are_invalidated_on_save(self):
+        detail = f'/api/v1/device/{self.device.pk}/'
+        self.assertEqual(self.client.get(detail).data['data']['name'], 'pixel')
+        self.assertEqual(self.client.get('/api/v1/device/').data['results'][0]['name'], 'pixel')
+        with self.assertNumQueries(0):
+            self.client.get(detail)
+            self.client.get('/api/v1/device/')
+
+        self.device.name = 'galaxy'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.device.save()
+        self.assertEqual(self.client.get(detail).data['data']['name'], 'galaxy')
+        self.assertEqual(self.client.get('/api/v1/device/').data['results'][0]['name'], 'galaxy')
+
+    def test_cached_responses_are_invalidated_on_delete(self):
+        detail = f'/api/v1/device/{self.device.pk}/'
+        self.assertEqual(self.client.get(detail).status_code, 200)
+        self.assertEqual(len(self.client.get('/api/v1/device/').data['results']), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.device.delete()
+        self.assertEqual(self.client.get(detail).status_code, 404)
+        self.assertEqual(self.client.get('/api/v1/device/').data['results'], [])
+
+    def test_other_owners_keep_their_cache(self):
+        self.client.force_authenticate(self.create_user('other@example.com'))
+        self.client.get('/api/v1/device/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.device.save()
+        with self.assertNumQueries(0):
+            self.client.get('/api/v1/device/')
+
+
+class ConditionalGetTests(DeviceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.device = self.create_device(name='pixel', imei='350000000000001')
+
+    def test_unchanged_list_and_detail_answer_304_without_queries(self):
+        for url in ('/api/v1/device/', f'/api/v1/device/{self.device.pk}/', '/api/v1/device/?is_authorized=false'):
+            etag = self.client.get(url)['ETag']
+            with self.assertNumQueries(0):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response['ETag'], etag)
+
+    def test_changes_invalidate_the_etag(self):
+        url = '/api/v1/device/'
+        etag = self.client.get(url)['ETag']
+        self.create_device(name='galaxy', imei='350000000000002')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_bulk_updates_invalidate_the_etag_once_bumped(self):
+        url = f'/api/v1/device/{self.device.pk}/'
+        etag = self.client.get(url)['ETag']
+        Device.objects.filter(pk=self.device.pk).update(name='galaxy')
+        bump_owner_versions([self.owner.pk])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['data']['name'], 'galaxy')
+
+    def test_etags_are_per_user(self):
+        staff = self.create_user('staff@example.com', is_staff=True)
+        etag = self.client.get('/api/v1/device/')['ETag']
+        self.client.force_authenticate(staff)
+        self.assertEqual(self.client.get('/api/v1/device/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_wildcard_does_not_skip_the_permission_check(self):
+        self.client.force_authenticate(self.create_user('other@example.com'))
+        self.assertEqual(self.client.get(f'/api/v1/device/{self.device.pk}/', HTTP_IF_NONE_MATCH='*').status_code, 403)
+        self.assertEqual(self.client.get('/api/v1/device/0/', HTTP_IF_NONE_MATCH='*').status_code, 404)
+
+    def test_detail_if_modified_since(self):
+        url = f'/api/v1/device/{self.device.pk}/'
+        last_modified = self.client.get(url)['Last-Modified']
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE='Mon, 01 Jan 2001 00:00:00 GMT').status_code, 200)
+
+
+class KeysetPaginationTests(DeviceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.devices = [self.create_device(name=f'device {i}', imei=str(350000000000000 + i)) for i in range(7)]
+        # equal created_at on some rows, the id breaks the tie
+        Device.objects.filter(pk__in=[device.pk for device in self.devices[2:5]]).update(
+            created_at=self.devices[2].created_at)
+        self.expected = list(Device.objects.order_by('-created_at', '-id').values_list('pk', flat=True))
+
+    def walk(self, url):
+        ids, pages = [], []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append(response.data)
+            ids += [device['id'] for device in response.data['results']]
+            url = response.data['next']
+        return ids, pages
+
+    def test_next_links_visit_every_row_once(self):
+        ids, pages = self.walk('/api/v1/device/?page_size=3')
+        self.assertEqual(ids, self.expected)
+        self.assertEqual([len(page['results']) for page in pages], [3, 3, 1])
+        self.assertIsNone(pages[0]['previous'])
+
+    def test_previous_link_returns_the_page_before(self):
+        _, pages = self.walk('/api/v1/device/?page_size=3')
+        previous = self.client.get(pages[2]['previous']).data
+        self.assertEqual(previous['results'], pages[1]['results'])
+        self.assertEqual(self.client.get(previous['previous']).data['results'], pages[0]['results'])
+
+    def test_invalid_cursor_is_404(self):
+        self.assertEqual(self.client.get('/api/v1/device/?cursor=garbage').status_code, 404)
+
+    def test_offset_pagination_on_request(self):
+        response = self.client.get('/api/v1/device/?pagination=offset')
+        self.assertEqual(response.data['count'], 7)
+        response = self.client.get('/api/v1/device/?page=1')
+        self.assertEqual(response.data['count'], 7)
+        self.assertEqual([device['id'] for device in response.data['results']], self.expected)
+
+    def test_cursor_keeps_the_filters(self):
+        Device.objects.filter(pk__in=[device.pk for device in self.devices[::2]]).update(is_authorized=True)
+        ids, _ = self.walk('/api/v1/device/?is_authorized=true&page_size=2')
+        self.assertEqual(ids, [pk for pk in self.expected if pk in {device.pk for device in self.devices[::2]}])
+
+
+class DeviceAuthorizationTests(DeviceTestCase):
+    def whitelist_elsewhere(self, imei):
+        # another web process whitelists the IMEI, this one has its index loaded already
+        self.client.post('/api/v1/device/', {'name': 'first', 'imei': '350000000000009', 'price': 1})
+        AuthorizedIMEI.objects.bulk_create([AuthorizedIMEI(imei=imei)])
+        AuthorizedIMEIIndex().bump_version()
+
+    def create(self, imei):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/api/v1/device/', {'name': 'pixel', 'imei': imei, 'price': 100})
+
+    def test_new_device_of_a_whitelisted_imei_is_authorized(self):
+        self.whitelist_elsewhere('350000000000001')
+        self.assertTrue(self.create('350000000000001').data['is_authorized'])
+        self.assertFalse(self.create('350000000000002').data['is_authorized'])
+
+    def test_without_a_shared_cache(self):
+        self.enterContext(override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}))
+        self.whitelist_elsewhere('350000000000001')
+        self.assertTrue(self.create('350000000000001').data['is_authorized'])
+
+
+class DeviceImportTests(DeviceTestCase):
+    url = '/api/v1/device/import/'
+
+    def upload(self, name, content, **params):
+        return self.client.post(self.url + (f"?file_format={params['file_format']}" if params else ''),
+                                {'file': SimpleUploadedFile(name, content)}, format='multipart')
+
+    def test_csv_import(self):
+        AuthorizedIMEI.objects.create(imei='350000000000002')
+        self.create_device(name='existing', imei='350000000000003')
+        response = self.upload('devices.csv', (
+            'name,imei,price\n'
+            'pixel,350000000000001,100\n'
+            'galaxy,350000000000002,200\n'
+            'taken,350000000000003,100\n'
+            'twice,350000000000001,100\n'
+            'no price,350000000000004,\n').encode())
+        self.assertEqual(response.status_code, 200)
+        report = response.data['data']
+        self.assertEqual((report['created'], report['failed']), (2, 3))
+        self.assertEqual(sorted(error['row'] for error in report['errors']), [3, 4, 5])
+        self.assertEqual(dict(Device.objects.filter(owner=self.owner).exclude(name='existing')
+                              .values_list('imei', 'is_authorized')),
+                         {'350000000000001': False, '350000000000002': True})
+
+    def test_ndjson_import(self):
+        response = self.upload('devices.ndjson', (
+            '{"name": "pixel", "imei": "350000000000001", "price": 100}\n'
+            '\n'
+            'not json\n'
+            '[1, 2]\n').encode())
+        report = response.data['data']
+        self.assertEqual((report['created'], report['failed']), (1, 2))
+        self.assertEqual(report['errors'][0], {'row': 2, 'errors': {'non_field_errors': ["Invalid JSON."]}})
+
+    def test_import_invalidates_the_cached_list(self):
+        self.client.get('/api/v1/device/')
+        self.upload('devices.csv', b'name,imei,price\npixel,350000000000001,100\n')
+        self.assertEqual(len(self.client.get('/api/v1/device/').data['results']), 1)
+
+    def test_file_that_is_not_utf8_is_rejected_before_any_row(self):
+        content = 'name,imei,price\npixel,350000000000001,100\ncaf\u00e9,350000000000002,100\n'.encode('latin-1')
+        response = self.upload('devices.csv', content)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("UTF-8", response.data['message'])
+        self.assertFalse(Device.objects.exists())
+
+    def test_unsupported_format(self):
+        self.assertEqual(self.upload('devices.xlsx', b'').status_code, 400)
+        self.assertEqual(self.upload('devices.txt', b'', file_format='xml').status_code, 400)
+
+
+class UnsharedCacheTests(DeviceTestCase):
+    def setUp(self):
+        super().setUp()
+        # the per process memory cache of settings.CACHES
+        self.enterContext(override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}))
+        self.device = self.create_device(name='pixel', imei='350000000000001')
+
+    def test_responses_are_not_cached(self):
+        self.assertFalse(is_enabled())
+        detail = f'/api/v1/device/{self.device.pk}/'
+        self.client.get(detail)
+        self.client.get('/api/v1/device/')
+        # another worker changed the device, no bump reaches this process
+        Device.objects.filter(pk=self.device.pk).update(name='galaxy')
+        self.assertEqual(self.client.get(detail).data['data']['name'], 'galaxy')
+        self.assertEqual(self.client.get('/api/v1/device/').data['results'][0]['name'], 'galaxy')
+
+    def test_list_etag_from_one_query(self):
+        url = '/api/v1/device/'
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # changed by another worker: updated_at moves, a delete the count
+        Device.objects.filter(pk=self.device.pk).update(name='galaxy', updated_at=timezone.now())
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        Device.objects.filter(pk=self.device.pk).delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_detail_validators(self):
+        url = f'/api/v1/device/{self.device.pk}/'
+        response = self.client.get(url)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+        self.client.force_authenticate(self.create_user('other@example.com'))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH='*').status_code, 403)
+
+
+class DeviceSearchTests(DeviceTestCase):
+    def setUp(self):
+        super().setUp()
+        # a handful of identical ranks, and some better ones
+        for i in range(9):
+            self.create_device(name='galaxy pro' if i % 3 else 'galaxy note galaxy', imei=str(350000000000000 + i))
+        self.create_device(name='pixel', imei='350000000000100')
+
+    def test_ranked_pages_have_no_duplicates_or_gaps(self):
+        ids, url = [], '/api/v1/device/search/?q=gal&page_size=2'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [device['id'] for device in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(len(ids), 9)
+        self.assertEqual(set(ids), set(Device.objects.filter(name__startswith='galaxy').values_list('pk', flat=True)))
+
+    def test_every_term_must_match(self):
+        response = self.client.get('/api/v1/device/search/?q=galaxy+note')
+        self.assertEqual(len(response.data['results']), 3)
+
+    def test_search_only_sees_own_devices(self):
+        self.client.force_authenticate(self.create_user('other@example.com'))
+        self.assertEqual(self.client.get('/api/v1/device/search/?q=galaxy').data['results'], [])
+
+    def test_query_is_required(self):
+        self.assertEqual(self.client.get('/api/v1/device/search/').status_code, 400)
+
+    def test_better_matches_rank_first(self):
+        # same length, more occurrences
+        self.create_device(name='phone case cover', imei='350000000000200')
+        self.create_device(name='phone phone case', imei='350000000000201')
+        names = [device['name'] for device in self.client.get('/api/v1/device/search/?q=phone').data['results']]
+        self.assertEqual(names, ['phone phone case', 'phone case cover'])
+
+    def test_imei_prefix(self):
+        response = self.client.get('/api/v1/device/search/?imei=3500000000001')
+        self.assertEqual([device['imei'] for device in response.data['results']], ['350000000000100'])
+        response = self.client.get('/api/v1/device/search/?imei=35000000000000&page_size=20')
+        self.assertEqual([device['imei'] for device in response.data['results']],
+                         [str(350000000000000 + i) for i in range(9)])
+
+
+
+class DeviceVisibilityTests(DeviceTestCase):
+    def test_users_see_their_devices_staff_all(self):
+        other = self.create_user('other@example.com')
+        staff = self.create_user('staff@example.com', is_staff=True)
+        self.create_device(name='a', imei='350000000000001')
+        self.create_device(owner=other, name='b', imei='350000000000002')
+        for user, expected in ((self.owner, ['a']), (staff, ['a', 'b'])):
+            self.client.force_authenticate(user)
+            response = self.client.get('/api/v1/device/')
+            self.assertEqual(sorted(device['name'] for device in response.data['results']), expected)
+
+
+class SparseFieldsetTests(DeviceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.device = self.create_device(name='pixel', imei='350000000000001')
+
+    def test_fields_keeps_the_named_fields(self):
+        response = self.client.get('/api/v1/device/?fields=id,name,unknown')
+        self.assertEqual(response.data['results'], [{'id': self.device.pk, 'name': 'pixel'}])
+        response = self.client.get(f'/api/v1/device/{self.device.pk}/?fields=imei')
+        self.assertEqual(response.data['data'], {'imei': '350000000000001'})
+
+    def test_expand_owner(self):
+        self.assertEqual(self.client.get('/api/v1/device/').data['results'][0]['owner'], self.owner.pk)
+        device = self.client.get('/api/v1/device/?expand=owner,unknown&fields=id,owner').data['results'][0]
+        self.assertEqual(device['owner']['email'], 'owner@example.com')
+        device = self.client.get(f'/api/v1/device/{self.device.pk}/?expand=owner').data['data']
+        self.assertEqual(device['owner']['id'], self.owner.pk)
+
+    def test_only_the_needed_columns_are_loaded(self):
+        serializer = DeviceSerializer(fields=['id', 'name'])
+        queryset = sparse_only(Device.objects.select_related('owner'), serializer)
+        self.assertEqual(queryset.query.select_related, False)
+        self.assertEqual(queryset.query.deferred_loading, ({'id', 'name'}, False))
+
+        serializer = DeviceSerializer(fields=['id', 'owner'], expand=['owner'])
+        queryset = sparse_only(Device.objects.all(), serializer)
+        self.assertEqual(queryset.query.select_related, {'owner': {}})
+        with self.assertNumQueries(1):
+            self.assertEqual(DeviceSerializer(queryset, many=True, fields=['id', 'owner'], expand=['owner'])
+                             .data[0]['owner']['email'], 'owner@example.com')
+
+    def test_post_ignores_the_query_parameters(self):
+        response = self.client.post('/api/v1/device/?fields=id', {'name': 'galaxy', 'imei': '350000000000002', 'price': 1})
+        self.assertEqual(response.status_code, 201)
+        self.assertIn('imei', response.data)
+
+
+class DeviceExportTests(DeviceTestCase):
+    url = '/api/v1/device/export/'
+
+    def setUp(self):
+        super().setUp()
+        self.create_device(name='pixel, 8', imei='350000000000001', is_authorized=True)
+        self.create_device(name='galaxy', imei='350000000000002', description='caf\u00e9')
+        self.client.force_authenticate(self.create_user('staff@example.com', is_staff=True))
+
+    def export(self, query=''):
+        response = self.client.get(self.url + query)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Cache-Control'], 'no-store')
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv(self):
+        rows = list(csv.DictReader(io.StringIO(self.export())))
+        self.assertEqual([row['name'] for row in rows], ['pixel, 8', 'galaxy'])
+        self.assertEqual((rows[0]['owner_id'], rows[0]['is_authorized'], rows[0]['price']),
+                         (str(self.owner.pk), 'True', '100.00'))
+
+    def test_ndjson_and_filter(self):
+        rows = [json.loads(line) for line in self.export('?file_format=ndjson&is_authorized=false').splitlines()]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual((rows[0]['name'], rows[0]['description'], rows[0]['price']), ('galaxy', 'caf\u00e9', '100.00'))
+        self.assertEqual(rows[0]['created_at'], Device.objects.get(name='galaxy').created_at.isoformat())
+
+    def test_staff_only(self):
+        self.assertEqual(self.client.get(self.url + '?file_format=xml').status_code, 400)
+        self.client.force_authenticate(self.owner)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+
+class RetroactiveAuthorizationTests(DeviceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.devices = [self.create_device(name=f'device {i}', imei=str(350000000000000 + i)) for i in range(5)]
+
+    def authorized(self):
+        return set(Device.objects.filter(is_authorized=True).values_list('imei', flat=True))
+
+    def test_whitelisting_authorizes_existing_devices(self):
+        self.assertEqual(self.client.get('/api/v1/device/?is_authorized=true').data['results'], [])
+        with self.captureOnCommitCallbacks(execute=True):
+            imei = AuthorizedIMEI.objects.create(imei='350000000000001')
+        self.assertEqual(self.authorized(), {'350000000000001'})
+        # the cached list of the owner was invalidated
+        self.assertEqual(len(self.client.get('/api/v1/device/?is_authorized=true').data['results']), 1)
+        self.assertEqual(DeviceStat.objects.get(dimension='is_authorized', value='true').count, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            imei.delete()
+        self.assertEqual(self.authorized(), set())
+        self.assertEqual(DeviceStat.objects.get(dimension='is_authorized', value='true').count, 0)
+
+    def test_nothing_changes_before_the_commit(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            AuthorizedIMEI.objects.create(imei='350000000000001')
+        self.assertEqual(self.authorized(), set())
+
+    def test_bulk_ingest_authorizes_in_chunks(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            report = ingest_imeis(iter([(1, '350000000000001', None), (2, '350000000000002', None),
+                                        (3, '350000000000003', None), (4, '350000000000009', None)]), chunk_size=2)
+        self.assertEqual(report['devices_authorized'], 3)
+        self.assertEqual(self.authorized(), {'350000000000001', '350000000000002', '350000000000003'})
+
+    def test_reconcile_grants_and_revokes(self):
+        AuthorizedIMEI.objects.bulk_create([AuthorizedIMEI(imei='350000000000001'), AuthorizedIMEI(imei='350000000000002')])
+        Device.objects.filter(imei='350000000000004').update(is_authorized=True)
+        seen = []
+        progress = reconcile_authorization(chunk_size=2, on_chunk=lambda progress: seen.append(dict(progress)))
+        self.assertEqual(self.authorized(), {'350000000000001', '350000000000002'})
+        self.assertEqual((progress['scanned'], progress['authorized'], progress['revoked']), (5, 2, 1))
+        self.assertEqual([step['scanned'] for step in seen], [2, 4, 5])
+        self.assertIsNone(load_checkpoint(RECONCILE_JOB))
+
+    def test_reconcile_resumes_from_the_checkpoint(self):
+        AuthorizedIMEI.objects.bulk_create([AuthorizedIMEI(imei=device.imei) for device in self.devices])
+
+        def stop(progress):
+            raise KeyboardInterrupt
+
+        with self.assertRaises(KeyboardInterrupt):
+            reconcile_authorization(chunk_size=2, on_chunk=stop)
+        self.assertEqual(load_checkpoint(RECONCILE_JOB)['scanned'], 2)
+        progress = reconcile_authorization(chunk_size=2, grant_only=True)
+        self.assertEqual((progress['scanned'], progress['authorized']), (5, 5))
@@ -1,8 +1,11 @@
 from django.urls import path
-from . views import DeviceListCreateView,DeviceDetailAPIView
+from . views import DeviceListCreateView,DeviceDetailAPIView,DeviceImportView,DeviceSearchView,DeviceExportView
 urlpatterns = [
     path('', DeviceListCreateView.as_view(), name='device-list-create'),
     path('<int:pk>/', DeviceDetailAPIView.as_view(), name='device-detail'),
+    path('import/', DeviceImportView.as_view(), name='device-import'),
+    path('search/', DeviceSearchView.as_view(), name='device-search'),
+    path('export/', DeviceExportView.as_view(), name='device-export'),
 
     
 ]
\ No newline at end of file
@@ -3,17 +3,42 @@ from .serializers import DeviceSerializer
 from rest_framework.exceptions import NotFound, PermissionDenied
 
 
-def get_object(pk, user):
+def visible_devices(user):
+    """
+    admin and staff see every device, normal users only their own
+    """
+    if user.is_staff or user.is_superuser:
+        return Device.objects.select_related('owner').all()
+    return Device.objects.select_related('owner').filter(owner=user)
+
+
+def filter_devices(queryset, params):
+    """
+    ?is_authorized=true|false|1|0 (anything else is ignored)
+    """
+    is_authorized = params.get('is_authorized')
+    if is_authorized is not None:
+        if is_authorized.lower() in ['true', '1']:
+            queryset = queryset.filter(is_authorized=True)
+        elif is_authorized.lower() in ['false', '0']:
+            queryset = queryset.filter(is_authorized=False)
+    return queryset
+
+
+def get_object(pk, user, queryset=None):
     """
     helper function for role based object task 
     """
+    if queryset is None:
+        queryset = Device.objects.select_related('owner')
     try:
-        device = Device.objects.select_related('owner').get(pk=pk)
+        device = queryset.get(pk=pk)
     except Device.DoesNotExist:
         raise NotFound("Device not found")
 
     # only owner or staff/admin
-    if (device.owner != user) and (not user.is_staff) and (not user.is_superuser):
+    if (device.owner_id != user.pk) and (not user.is_staff) and (not user.is_superuser):
         raise PermissionDenied("You are not allowed to modify this device.")
 
     return device
+
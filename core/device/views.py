@@ -1,10 +1,20 @@
+from django.db.models import F
 from rest_framework import generics, permissions,status
+from rest_framework.parsers import MultiPartParser
 from .models import Device
 from .serializers import DeviceSerializer,DeviceDetailedSerializer
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from .utils import get_object
-from imei_authorization.models import AuthorizedIMEI
+from .utils import filter_devices, get_object, visible_devices
+from imei_authorization.index import authorized_imeis
+from core.pagination import KeysetOrPageNumberPagination, KeysetPagination
+from core.bulk import detect_format, iter_records
+from core.export import ExportAPIView
+from .services import import_devices
+from .search import search_devices, search_terms
+from .cache import get_cached, set_cached, response_cache_key
+from core.conditional import make_etag, not_modified, queryset_etag, with_validators
+from core.serializers import sparse_options, sparse_only
 
 
 class DeviceListCreateView(generics.ListCreateAPIView):
@@ -13,27 +23,59 @@ class DeviceListCreateView(generics.ListCreateAPIView):
     Only admin and staff can view all devices.
     Normal users can view their own devices only.
     Supports filtering by authorization status.
+    Keyset (cursor) paginated on (created_at, id); ?pagination=offset or ?page=<n> for the old page format.
+    Responses are cached per owner (staff: globally) and url, see device/cache.py.
+    GET answers If-None-Match with 304, the ETag is derived from the response cache key
+    (owner / global cache version and url), so no query runs for it. Without a shared
+    cache it comes from one count / max(updated_at) query over the listed devices.
+    GET supports ?fields=id,name,... and ?expand=owner, only the needed columns are loaded.
     """
     serializer_class = DeviceSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetOrPageNumberPagination
+    keyset_ordering = ('-created_at', '-id')
 
     def get_queryset(self):
-        user = self.request.user
-        queryset = Device.objects.select_related('owner').all() if (user.is_staff or user.is_superuser) else Device.objects.select_related('owner').filter(owner=user)
-        
-        is_authorized = self.request.query_params.get('is_authorized')
-        if is_authorized is not None:
-            if is_authorized.lower() in ['true', '1']:
-                queryset = queryset.filter(is_authorized=True)
-            elif is_authorized.lower() in ['false', '0']:
-                queryset = queryset.filter(is_authorized=False)
+        queryset = filter_devices(visible_devices(self.request.user), self.request.query_params)
 
+        if self.request.method == 'GET':
+            queryset = sparse_only(queryset, self.get_serializer())
         return queryset
 
+    def get_serializer(self, *args, **kwargs):
+        kwargs.update(sparse_options(self.request))
+        return super().get_serializer(*args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        cache_key = response_cache_key('list', request)
+        if cache_key is not None:
+            # the key moves with every device write of the owner (staff: of anyone)
+            etag = make_etag(cache_key)
+        elif not request.query_params.get('expand'):
+            # not cached: count and newest updated_at of the listed devices, one aggregate query
+            etag = queryset_etag(self.filter_queryset(self.get_queryset()), request.get_full_path(), request.user.pk)
+        else:
+            # embedded owners have no updated_at, hash the page instead
+            etag = None
+        if etag is not None:
+            response = not_modified(request, etag)
+            if response is not None:
+                return response
+        data = get_cached(cache_key)
+        if data is None:
+            data = super().list(request, *args, **kwargs).data
+            set_cached(cache_key, data)
+        if etag is None:
+            etag = make_etag(request.get_full_path(), data)
+            response = not_modified(request, etag)
+            if response is not None:
+                return response
+        return with_validators(Response(data), etag)
+
     def perform_create(self, serializer):
         imei = serializer.validated_data.get('imei')
-        # check if IMEI exists in AuthorizedIMEI table
-        is_authorized = AuthorizedIMEI.objects.filter(imei=imei).exists()
+        # check if IMEI exists in AuthorizedIMEI table (in memory index, no query on a miss)
+        is_authorized = authorized_imeis.contains(imei)
         serializer.save(owner=self.request.user, is_authorized=is_authorized)
 
 
@@ -45,21 +87,44 @@ class DeviceDetailAPIView(APIView):
     - Only authenticated users can access.
     - Normal users can only access their own devices.
     - Staff/Admin can access all devices.
-
+    GET supports conditional requests (ETag from the response cache key, as the list,
+    Last-Modified from updated_at) and ?fields= / ?expand=owner. The validators are compared
+    only once the device is known to be visible to the user, If-None-Match: * gets 404 / 403 too.
     """
     permission_classes = [permissions.IsAuthenticated]
 
    
     def get(self, request, pk):
-        device = get_object(pk, request.user)
-        serializer = DeviceDetailedSerializer(device)
-        return Response({'success': True, 'data': serializer.data}, status=200)
+        cache_key = response_cache_key('detail', request)
+        cached = get_cached(cache_key)
+        if cached is None:
+            # 404 / 403 before any validator is compared, an entry exists only for a user who passed them
+            serializer = DeviceDetailedSerializer(**sparse_options(request))
+            queryset = sparse_only(Device.objects.all(), serializer).annotate(last_modified=F('updated_at'))
+            serializer.instance = get_object(pk, request.user, queryset)
+            cached = {'data': serializer.data, 'last_modified': serializer.instance.last_modified}
+            set_cached(cache_key, cached)
+        # the key moves with every write of the owner, without it the data itself is hashed
+        if cache_key is not None:
+            etag = make_etag(cache_key)
+        else:
+            etag = make_etag(request.get_full_path(), cached['data'])
+        response = not_modified(request, etag, cached['last_modified'])
+        if response is not None:
+            return response
+        response = Response({'success': True, 'data': cached['data']}, status=200)
+        return with_validators(response, etag, cached['last_modified'])
 
     def put(self, request, pk):
         device = get_object(pk, request.user)
         serializer = DeviceSerializer(device, data=request.data, partial=True)
         if serializer.is_valid():
-            serializer.save()
+            imei = serializer.validated_data.get('imei', device.imei)
+            if imei != device.imei:
+                # authorization follows the IMEI
+                serializer.save(is_authorized=authorized_imeis.contains(imei))
+            else:
+                serializer.save()
             return Response({'success': True, 'message': 'Device updated', 'data': serializer.data})
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -68,3 +133,78 @@ class DeviceDetailAPIView(APIView):
         device.delete()
         return Response({'success': True, 'message': 'Device deleted'}, status=204)
 
+
+
+class DeviceImportView(APIView):
+    """
+    Bulk device import for the requesting user.
+    multipart upload, field `file`: CSV with a header row or NDJSON (one object per line),
+    columns/keys: name, imei, type, os, price, description.
+    The format is taken from ?file_format=csv|ndjson or the file extension.
+    The file is streamed and written in chunks, rows that fail are reported with their row number.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'success': False, 'message': 'file is required'}, status=status.HTTP_400_BAD_REQUEST)
+        file_format = detect_format(upload, request.query_params.get('file_format'))
+        if file_format is None:
+            return Response({'success': False, 'message': 'Unsupported file format, use csv or ndjson'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            report = import_devices(request.user, iter_records(upload, file_format))
+        except ValueError as e:
+            # not UTF-8 (core.bulk.check_encoding), nothing was imported
+            return Response({'success': False, 'message': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'success': True, 'data': report}, status=status.HTTP_200_OK)
+
+
+
+class DeviceSearchView(generics.ListAPIView):
+    """
+    Ranked device search.
+    ?q=<words>   full text over name, description, type and os (every word, prefix matched)
+    ?imei=<digits>   IMEI prefix
+    Same visibility as the device list: staff/admin search all devices, users their own.
+    Cursor paginated on (rank, id), or (imei, id) for IMEI only searches.
+    """
+    serializer_class = DeviceSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
+
+    @property
+    def keyset_ordering(self):
+        if search_terms(self.request.query_params.get('q')):
+            return ('-rank', '-id')
+        return ('imei', 'id')
+
+    def get_queryset(self):
+        params = self.request.query_params
+        queryset = sparse_only(visible_devices(self.request.user), self.get_serializer())
+        return search_devices(queryset, params.get('q'), params.get('imei', '').strip())
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.update(sparse_options(self.request))
+        return super().get_serializer(*args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        if not search_terms(request.query_params.get('q')) and not request.query_params.get('imei', '').strip():
+            return Response({'detail': 'q or imei is required'}, status=status.HTTP_400_BAD_REQUEST)
+        return super().list(request, *args, **kwargs)
+
+
+class DeviceExportView(ExportAPIView):
+    """
+    Admin and staff only.
+    Streams every device as CSV / NDJSON (?file_format=), same is_authorized filter as the list.
+    """
+    export_name = 'devices'
+    export_columns = ('id', 'owner_id', 'name', 'imei', 'type', 'os', 'price', 'description',
+                      'is_authorized', 'image', 'image_status', 'created_at', 'updated_at')
+
+    def get_queryset(self):
+        return filter_devices(Device.objects.all(), self.request.query_params)
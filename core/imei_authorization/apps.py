@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ImeiAuthorizationConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'imei_authorization'
+
+    def ready(self):
+        from . import signals  # noqa: F401
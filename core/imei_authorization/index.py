@@ -0,0 +1,216 @@
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache import caches
+
+from core.caches import is_shared
+from .models import AuthorizedIMEI
+
+VERSION_KEY = 'imei_authorization:index:version'
+
+# digits beyond this do not fit the packed 64 bit key, those IMEIs go to a plain set
+_MAX_PACKED_DIGITS = 17
+# overlay size after which local changes are merged back into the packed array
+_COMPACT_AFTER = 10000
+
+
+def _pack(imei):
+    """
+    15 digit IMEI -> int, the length goes into the low bits so leading zeros survive
+    """
+    if imei.isdigit() and len(imei) <= _MAX_PACKED_DIGITS and imei.isascii():
+        return (int(imei) << 5) | len(imei)
+    return None
+
+
+class AuthorizedIMEIIndex:
+    """
+    In process membership index of the AuthorizedIMEI table.
+
+    Numeric IMEIs are packed into a sorted array of unsigned 64 bit ints
+    (8 bytes per IMEI, binary search lookups), anything else lives in a small set.
+    The index is loaded on first use and kept current with
+    - local changes applied by the post_save/post_delete signals of this process
+    - a version counter in the shared cache, bumped on every change and read on
+      every lookup, that makes other workers reload before they answer.
+    A miss never touches the database. With verify_hits a hit is confirmed with
+    an indexed exists() query, so a stale index can only cost a query, never a wrong yes.
+    Without a cache shared by all web processes the version cannot reach the other
+    workers, every lookup then queries the table instead.
+    """
+
+    def __init__(self, cache_alias=None, verify_hits=None):
+        self.cache_alias = cache_alias or getattr(settings, 'IMEI_INDEX_CACHE_ALIAS', 'default')
+        self.verify_hits = (verify_hits if verify_hits is not None
+                            else getattr(settings, 'IMEI_INDEX_VERIFY_HITS', True))
+        self._lock = threading.RLock()
+        self._packed = None
+        self._other = set()
+        self._added = set()
+        self._removed = set()
+        self._version = None
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def is_enabled(self):
+        return is_shared(self.cache_alias)
+
+    # lookups
+
+    def contains(self, imei):
+        if not imei:
+            return False
+        if not self.is_enabled():
+            return AuthorizedIMEI.objects.filter(imei=imei).exists()
+        self._ensure_fresh()
+        if not self._member(imei):
+            return False
+        if not self.verify_hits:
+            return True
+        return AuthorizedIMEI.objects.filter(imei=imei).exists()
+
+    def authorized_subset(self, imeis):
+        """
+        set of the given IMEIs that are authorized, at most one IN query for the hits
+        """
+        if not self.is_enabled():
+            imeis = {imei for imei in imeis if imei}
+            return set(AuthorizedIMEI.objects.filter(imei__in=imeis).values_list('imei', flat=True)) if imeis else set()
+        self._ensure_fresh()
+        hits = {imei for imei in imeis if imei and self._member(imei)}
+        if not hits or not self.verify_hits:
+            return hits
+        return set(AuthorizedIMEI.objects.filter(imei__in=hits).values_list('imei', flat=True))
+
+    def _member(self, imei):
+        key = _pack(imei)
+        if key is None:
+            return imei in self._other
+        if key in self._added:
+            return True
+        if key in self._removed:
+            return False
+        packed = self._packed
+        position = bisect_left(packed, key)
+        return position < len(packed) and packed[position] == key
+
+    # loading
+
+    def load(self, imeis):
+        """
+        (re)build the index from an iterable of IMEI strings
+        """
+        keys = []
+        other = set()
+        for imei in imeis:
+            key = _pack(imei)
+            if key is None:
+                other.add(imei)
+            else:
+                keys.append(key)
+        keys.sort()
+        packed = array('Q', keys)
+        with self._lock:
+            self._packed = packed
+            self._other = other
+            self._added = set()
+            self._removed = set()
+
+    def _ensure_fresh(self):
+        # one cache read per lookup: a whitelisting committed by another worker is seen
+        # by the next device created anywhere, a stale miss would leave it unauthorized
+        version = self._current_version()
+        if self._packed is not None and version == self._version:
+            return
+        with self._lock:
+            if self._packed is not None and version == self._version:
+                return
+            # read the version before the rows, a change during the load triggers another reload
+            self.load(AuthorizedIMEI.objects.values_list('imei', flat=True).iterator(chunk_size=10000))
+            self._version = version
+
+    def _current_version(self):
+        version = self.cache.get(VERSION_KEY)
+        if version is None:
+            # cold or flushed cache, start from a value no worker has seen before
+            self.cache.add(VERSION_KEY, time.time_ns(), timeout=None)
+            version = self.cache.get(VERSION_KEY)
+        return version
+
+    # changes
+
+    def apply(self, changes):
+        """
+        apply committed ('add' | 'remove', imei) changes locally and tell the other workers
+        """
+        with self._lock:
+            if self._packed is not None:
+                for action, imei in changes:
+                    self._apply_one(action, imei)
+                if len(self._added) + len(self._removed) > _COMPACT_AFTER:
+                    self._compact()
+        self._bump(applied_locally=True)
+
+    def _apply_one(self, action, imei):
+        key = _pack(imei)
+        if key is None:
+            if action == 'add':
+                self._other.add(imei)
+            else:
+                self._other.discard(imei)
+        elif action == 'add':
+            self._removed.discard(key)
+            self._added.add(key)
+        else:
+            self._added.discard(key)
+            self._removed.add(key)
+
+    def _compact(self):
+        keys = set(self._packed)
+        keys.difference_update(self._removed)
+        keys.update(self._added)
+        self._packed = array('Q', sorted(keys))
+        self._added = set()
+        self._removed = set()
+
+    def bump_version(self):
+        """
+        Mark the table as changed for every worker, this one included.
+        Bulk writes that skip model signals (bulk_create, update, raw SQL) must call this.
+        """
+        self._bump(applied_locally=False)
+
+    def _bump(self, applied_locally):
+        try:
+            version = self.cache.incr(VERSION_KEY)
+        except ValueError:
+            self.cache.add(VERSION_KEY, time.time_ns(), timeout=None)
+            version = None
+        with self._lock:
+            # skip our own reload only when the change is already applied here
+            # and nobody else bumped in between
+            if (applied_locally and version is not None and self._version is not None
+                    and version == self._version + 1):
+                self._version = version
+            else:
+                self._version = None
+
+    def memory_usage(self):
+        """
+        approximate bytes held by the index (packed array + overlays)
+        """
+        packed = self._packed if self._packed is not None else array('Q')
+        size = sys.getsizeof(packed)
+        for overlay in (self._added, self._removed, self._other):
+            size += sys.getsizeof(overlay)
+        size += sum(sys.getsizeof(imei) for imei in self._other)
+        return size
+
+
+authorized_imeis = AuthorizedIMEIIndex()
@@ -0,0 +1,55 @@
+import random
+import sys
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from imei_authorization.index import AuthorizedIMEIIndex
+
+
+class Command(BaseCommand):
+    help = "Benchmark memory and lookup latency of the in process authorized IMEI index (no database needed)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=1_000_000, help="number of authorized IMEIs")
+        parser.add_argument('--lookups', type=int, default=200_000, help="lookups per measurement")
+
+    def handle(self, *args, **options):
+        size, lookups = options['size'], options['lookups']
+        rng = random.Random(42)
+        imeis = [str(rng.randrange(10**14, 10**15)) for _ in range(size)]
+
+        index = AuthorizedIMEIIndex(verify_hits=False)
+        tracemalloc.start()
+        started = time.perf_counter()
+        index.load(imeis)
+        load_seconds = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        index_bytes = index.memory_usage()
+        set_bytes = sys.getsizeof(set(imeis)) + sum(sys.getsizeof(imei) for imei in imeis)
+
+        hits = rng.sample(imeis, min(lookups, size))
+        misses = [str(rng.randrange(10**15, 10**16)) for _ in range(lookups)]
+        hit_ns = self._per_lookup(index, hits)
+        miss_ns = self._per_lookup(index, misses)
+
+        per_million = 1_000_000 / size
+        self.stdout.write(f"authorized IMEIs:        {size:,}")
+        self.stdout.write(f"load time:               {load_seconds:.2f}s (peak {peak / 2**20:.1f} MiB while building)")
+        self.stdout.write(f"index memory:            {index_bytes / 2**20:.1f} MiB "
+                          f"({index_bytes * per_million / 2**20:.1f} MiB per million)")
+        self.stdout.write(f"python set of str:       {set_bytes / 2**20:.1f} MiB "
+                          f"({set_bytes * per_million / 2**20:.1f} MiB per million)")
+        self.stdout.write(f"lookup hit (no verify):  {hit_ns:.0f} ns")
+        self.stdout.write(f"lookup miss:             {miss_ns:.0f} ns")
+
+    @staticmethod
+    def _per_lookup(index, imeis):
+        member = index._member
+        started = time.perf_counter_ns()
+        for imei in imeis:
+            member(imei)
+        return (time.perf_counter_ns() - started) / len(imeis)
@@ -0,0 +1,62 @@
+import io
+import random
+
+from django.core.management.base import BaseCommand
+
+from core.benchmarks import temporary_database, timed
+from imei_authorization.models import AuthorizedIMEI
+from imei_authorization.serializers import AuthorizedIMEISerializer
+from imei_authorization.services import TEXT, ingest_imeis, iter_imeis
+
+
+class Command(BaseCommand):
+    help = ("Measure whitelist ingestion throughput on a throwaway database, "
+            "against the one-request-per-IMEI serializer path.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=500_000, help="lines in the generated whitelist file")
+        parser.add_argument('--duplicate-ratio', type=float, default=0.1)
+        parser.add_argument('--invalid-ratio', type=float, default=0.01)
+        parser.add_argument('--baseline-rows', type=int, default=2000,
+                            help="IMEIs pushed through AuthorizedIMEISerializer one by one")
+
+    def handle(self, *args, **options):
+        with temporary_database():
+            self._run(options)
+
+    def _run(self, options):
+        rng = random.Random(11)
+        rows = options['rows']
+        lines = []
+        for _ in range(rows):
+            roll = rng.random()
+            if lines and roll < options['duplicate_ratio']:
+                lines.append(rng.choice(lines))
+            elif roll < options['duplicate_ratio'] + options['invalid_ratio']:
+                lines.append('not-an-imei')
+            else:
+                lines.append(str(rng.randrange(10**14, 10**15)))
+        upload = io.BytesIO(('\n'.join(lines) + '\n').encode())
+
+        report, elapsed = timed(ingest_imeis, iter_imeis(upload, TEXT))
+        report.pop('errors')
+        self.stdout.write(f"bulk ingest:  {rows:,} lines in {elapsed:.2f}s = {rows / elapsed:,.0f} lines/s  {report}")
+
+        # second run, everything is a duplicate now
+        upload.seek(0)
+        report, elapsed = timed(ingest_imeis, iter_imeis(upload, TEXT))
+        self.stdout.write(f"re-ingest:    {rows:,} lines in {elapsed:.2f}s = {rows / elapsed:,.0f} lines/s  "
+                          f"duplicates={report['duplicates']:,}")
+
+        baseline = [str(rng.randrange(10**15, 10**16)) for _ in range(options['baseline_rows'])]
+
+        def one_by_one():
+            for imei in baseline:
+                serializer = AuthorizedIMEISerializer(data={'imei': imei})
+                serializer.is_valid(raise_exception=True)
+                serializer.save()
+
+        _, elapsed = timed(one_by_one)
+        self.stdout.write(f"one by one:   {len(baseline):,} IMEIs in {elapsed:.2f}s = "
+                          f"{len(baseline) / elapsed:,.0f} IMEIs/s (serializer exists() + insert per IMEI)")
+        self.stdout.write(f"table size:   {AuthorizedIMEI.objects.count():,}")
@@ -0,0 +1,26 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from imei_authorization.services import INGEST_CHUNK_SIZE, detect_ingest_format, ingest_imeis, iter_imeis
+
+
+class Command(BaseCommand):
+    help = "Bulk add IMEIs from a whitelist file (.txt one per line, CSV with an imei column, or NDJSON)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--file-format', choices=['txt', 'csv', 'ndjson'],
+                            help="default: from the file extension")
+        parser.add_argument('--chunk-size', type=int, default=INGEST_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        with open(options['path'], 'rb') as upload:
+            file_format = detect_ingest_format(upload, options['file_format'])
+            if file_format is None:
+                raise CommandError("Unsupported file format, use --file-format txt|csv|ndjson.")
+            try:
+                report = ingest_imeis(iter_imeis(upload, file_format), chunk_size=options['chunk_size'])
+            except ValueError as e:
+                raise CommandError(str(e))
+        self.stdout.write(json.dumps(report, indent=2))
@@ -0,0 +1,30 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from imei_authorization.services import INGEST_CHUNK_SIZE, detect_ingest_format, iter_imeis, revoke_imeis
+
+
+class Command(BaseCommand):
+    help = ("Bulk delete the IMEIs listed in a file (.txt one per line, CSV with an imei column, or NDJSON), "
+            "IMEIs linked to a device are kept.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--file-format', choices=['txt', 'csv', 'ndjson'],
+                            help="default: from the file extension")
+        parser.add_argument('--chunk-size', type=int, default=INGEST_CHUNK_SIZE)
+        parser.add_argument('--show-results', action='store_true', help="print the outcome of every IMEI")
+
+    def handle(self, *args, **options):
+        with open(options['path'], 'rb') as upload:
+            file_format = detect_ingest_format(upload, options['file_format'])
+            if file_format is None:
+                raise CommandError("Unsupported file format, use --file-format txt|csv|ndjson.")
+            try:
+                report = revoke_imeis(iter_imeis(upload, file_format), chunk_size=options['chunk_size'])
+            except ValueError as e:
+                raise CommandError(str(e))
+        if not options['show_results']:
+            report.pop('results')
+        self.stdout.write(json.dumps(report, indent=2))
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.4 on 2026-10-18 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('imei_authorization', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='authorizedimei',
+            index=models.Index(fields=['-created_at', '-id'], name='authorized_imei_keyset_idx'),
+        ),
+    ]
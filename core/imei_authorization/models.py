@@ -5,5 +5,11 @@ class AuthorizedIMEI(models.Model):
     imei = models.CharField(max_length=50, unique=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # keyset pagination of the list: (created_at, id), newest first
+            models.Index(fields=['-created_at', '-id'], name='authorized_imei_keyset_idx'),
+        ]
+
     def __str__(self):
         return self.imei
\ No newline at end of file
@@ -0,0 +1,235 @@
+import codecs
+from itertools import islice
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core.bulk import CSV, check_encoding, chunked, detect_format, iter_records
+from device.authorization import set_authorized_for_imeis
+from device.models import Device
+from .index import authorized_imeis
+from .models import AuthorizedIMEI
+
+TEXT = 'txt'
+
+INGEST_CHUNK_SIZE = getattr(settings, 'IMEI_INGEST_CHUNK_SIZE', 5000)
+# IMEI without / with check digit, IMEISV
+MIN_IMEI_DIGITS = 14
+MAX_IMEI_DIGITS = 16
+# the report lists at most this many invalid rows, the counts are always complete
+MAX_REPORTED_ERRORS = 100
+
+_SEPARATORS = str.maketrans('', '', ' -./')
+
+
+def normalize_imei(value):
+    """
+    digits only IMEI string, None when the value cannot be an IMEI
+    ('35-209900-176148-1' -> '352099001761481')
+    """
+    if value is None:
+        return None
+    value = str(value).strip().translate(_SEPARATORS)
+    if value.isascii() and value.isdigit() and MIN_IMEI_DIGITS <= len(value) <= MAX_IMEI_DIGITS:
+        return value
+    return None
+
+
+def detect_ingest_format(upload, requested=None):
+    """
+    csv / ndjson like core.bulk.detect_format, plus txt: one IMEI per line
+    """
+    if (requested or '').lower() in (TEXT, 'text'):
+        return TEXT
+    if not requested and (getattr(upload, 'name', '') or '').lower().endswith('.txt'):
+        return TEXT
+    return detect_format(upload, requested)
+
+
+def iter_imeis(upload, file_format):
+    """
+    (row_number, raw value, error) from a whitelist file, streamed line by line.
+    CSV files need an `imei` column, NDJSON objects an `imei` key.
+    """
+    if file_format == TEXT:
+        check_encoding(upload)
+        lines = codecs.iterdecode(iter(upload), 'utf-8-sig')
+        for number, line in enumerate(lines, start=1):
+            line = line.strip()
+            if line:
+                yield number, line, None
+        return
+
+    for number, record, error in iter_records(upload, file_format):
+        if error:
+            yield number, None, error
+            continue
+        if number == 1 and file_format == CSV and 'imei' not in record:
+            raise ValueError("CSV files need an imei column, upload a .txt file for one IMEI per line.")
+        yield number, record.get('imei'), None
+
+
+def ingest_imeis(rows, chunk_size=INGEST_CHUNK_SIZE):
+    """
+    Add the IMEIs of (row_number, value, error) tuples to AuthorizedIMEI.
+    Values are normalised, duplicates (in the file or already stored) are skipped.
+    PostgreSQL streams everything through COPY into a temp table and inserts it with
+    one INSERT ... ON CONFLICT DO NOTHING, other databases use one lookup and one
+    bulk_create(ignore_conflicts=True) per chunk.
+    Devices carrying one of the IMEIs are authorized afterwards (device.authorization).
+    Returns {'received', 'inserted', 'duplicates', 'invalid', 'devices_authorized',
+    'errors': [{'row', 'value', 'error'}]}.
+    """
+    report = {'received': 0, 'inserted': 0, 'duplicates': 0, 'invalid': 0, 'devices_authorized': 0, 'errors': []}
+    valid = _valid_imeis(rows, report)
+    if connection.vendor == 'postgresql':
+        inserted, submitted, pending_devices = _ingest_copy(valid)
+        report['devices_authorized'] = set_authorized_for_imeis(pending_devices, True)
+    else:
+        inserted, submitted = _ingest_batches(valid, chunk_size, report)
+    report['inserted'] = inserted
+    report['duplicates'] = submitted - inserted
+    if inserted:
+        # bulk writes send no post_save, every worker reloads its index
+        authorized_imeis.bump_version()
+    return report
+
+
+REVOKE_DELETED = 'deleted'
+REVOKE_LINKED = 'linked'
+REVOKE_NOT_FOUND = 'not_found'
+REVOKE_INVALID = 'invalid'
+
+
+def revoke_imeis(rows, chunk_size=INGEST_CHUNK_SIZE):
+    """
+    Delete the IMEIs of (row_number, value, error) tuples from AuthorizedIMEI, except
+    the ones still linked to a device.
+    Per chunk: one IN query for the stored IMEIs, one for the linked devices and one
+    set based DELETE, instead of a lookup, a device check and a delete per IMEI.
+    Values are matched normalised when they look like an IMEI, as given otherwise.
+    Returns the counts per outcome and a per-IMEI outcome list in input order
+    ('deleted' | 'linked' | 'not_found' | 'invalid'), repeated IMEIs are reported once.
+    """
+    report = {REVOKE_DELETED: 0, REVOKE_LINKED: 0, REVOKE_NOT_FOUND: 0, REVOKE_INVALID: 0, 'results': []}
+    seen = set()
+    revoked_any = False
+
+    def candidates():
+        for number, value, error in rows:
+            imei = None if error or value is None else (normalize_imei(value) or str(value).strip())
+            if imei and imei in seen:
+                continue
+            seen.add(imei)
+            yield imei, value
+
+    for chunk in chunked(candidates(), chunk_size):
+        imeis = [imei for imei, _ in chunk if imei]
+        stored = set(AuthorizedIMEI.objects.filter(imei__in=imeis).values_list('imei', flat=True))
+        linked = set(Device.objects.filter(imei__in=stored).values_list('imei', flat=True))
+        deletable = stored - linked
+        if deletable:
+            _delete_imeis(deletable)
+            # devices that took one of the IMEIs since the linked check lose their authorization
+            set_authorized_for_imeis(deletable, False)
+            revoked_any = True
+        for imei, value in chunk:
+            if not imei:
+                outcome, imei = REVOKE_INVALID, value
+            elif imei in deletable:
+                outcome = REVOKE_DELETED
+            else:
+                outcome = REVOKE_LINKED if imei in linked else REVOKE_NOT_FOUND
+            report[outcome] += 1
+            report['results'].append({'imei': imei, 'outcome': outcome})
+    if revoked_any:
+        # the raw deletes sent no post_delete, every worker reloads its index
+        authorized_imeis.bump_version()
+    return report
+
+
+def _delete_imeis(imeis):
+    # one DELETE ... WHERE imei IN (...), no per row collector / post_delete
+    table = connection.ops.quote_name(AuthorizedIMEI._meta.db_table)
+    placeholders = ', '.join(['%s'] * len(imeis))
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table} WHERE imei IN ({placeholders})", list(imeis))
+
+
+def _valid_imeis(rows, report):
+    errors = report['errors']
+    for number, value, error in rows:
+        report['received'] += 1
+        imei = None if error else normalize_imei(value)
+        if imei is None:
+            report['invalid'] += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append({'row': number, 'value': value, 'error': error or "Not a valid IMEI."})
+            continue
+        yield imei
+
+
+def _ingest_batches(imeis, chunk_size, report):
+    inserted = submitted = 0
+    for chunk in chunked(imeis, chunk_size):
+        submitted += len(chunk)
+        unique = list(dict.fromkeys(chunk))
+        existing = set(AuthorizedIMEI.objects.filter(imei__in=unique).values_list('imei', flat=True))
+        new = [imei for imei in unique if imei not in existing]
+        if new:
+            now = timezone.now()
+            AuthorizedIMEI.objects.bulk_create([AuthorizedIMEI(imei=imei, created_at=now) for imei in new],
+                                               ignore_conflicts=True)
+            inserted += len(new)
+        report['devices_authorized'] += set_authorized_for_imeis(unique, True)
+    return inserted, submitted
+
+
+class _LineStream:
+    """
+    read()-able view of an iterator of IMEIs, one per line, for COPY FROM STDIN
+    """
+    def __init__(self, imeis):
+        self._imeis = imeis
+        self._buffer = ''
+        self.count = 0
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            chunk = list(islice(self._imeis, 1000))
+            if not chunk:
+                break
+            self.count += len(chunk)
+            self._buffer += '\n'.join(chunk) + '\n'
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def _ingest_copy(imeis):
+    table = connection.ops.quote_name(AuthorizedIMEI._meta.db_table)
+    devices = connection.ops.quote_name(Device._meta.db_table)
+    stream = _LineStream(iter(imeis))
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("CREATE TEMP TABLE imei_ingest (imei varchar(50)) ON COMMIT DROP")
+        raw = cursor.cursor
+        if hasattr(raw, 'copy_expert'):  # psycopg2
+            raw.copy_expert("COPY imei_ingest (imei) FROM STDIN", stream)
+        else:  # psycopg 3
+            with raw.copy("COPY imei_ingest (imei) FROM STDIN") as copy:
+                while data := stream.read(65536):
+                    copy.write(data)
+        cursor.execute(
+            f"INSERT INTO {table} (imei, created_at) SELECT DISTINCT imei, now() FROM imei_ingest "
+            "ON CONFLICT (imei) DO NOTHING"
+        )
+        inserted = cursor.rowcount
+        # only the IMEIs with devices still waiting, authorized after the commit in short chunks
+        cursor.execute(
+            f"SELECT DISTINCT i.imei FROM imei_ingest i JOIN {devices} d ON d.imei = i.imei "
+            "WHERE NOT d.is_authorized"
+        )
+        pending_devices = [imei for imei, in cursor.fetchall()]
+    return inserted, stream.count, pending_devices
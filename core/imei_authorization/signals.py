@@ -0,0 +1,20 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from core.transactions import defer_until_commit
+from device.authorization import apply_imei_changes
+from .index import authorized_imeis
+from .models import AuthorizedIMEI
+
+
+@receiver(post_save, sender=AuthorizedIMEI)
+def authorized_imei_saved(sender, instance, created, **kwargs):
+    if created:
+        defer_until_commit('authorized_imei_index', ('add', instance.imei), authorized_imeis.apply)
+        defer_until_commit('device_authorization', ('add', instance.imei), apply_imei_changes)
+
+
+@receiver(post_delete, sender=AuthorizedIMEI)
+def authorized_imei_deleted(sender, instance, **kwargs):
+    defer_until_commit('authorized_imei_index', ('remove', instance.imei), authorized_imeis.apply)
+    defer_until_commit('device_authorization', ('remove', instance.imei), apply_imei_changes)
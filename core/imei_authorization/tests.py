@@ -1,3 +1,223 @@
-from django.test import TestCase
+import tempfile
 
-# Create your tests here.
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from rest_framework.test import APITestCase
+
+from accounts.models import User
+from device.models import Device
+
+from .index import AuthorizedIMEIIndex, authorized_imeis
+from .models import AuthorizedIMEI
+from .services import ingest_imeis, normalize_imei, revoke_imeis
+
+
+def shared_cache(directory):
+    # a cache every process sees, without a Redis server
+    return override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory}})
+
+
+class AuthorizedIMEIIndexTests(TestCase):
+    def setUp(self):
+        self.enterContext(shared_cache(self.enterContext(tempfile.TemporaryDirectory())))
+        # two web processes
+        self.index, self.other = AuthorizedIMEIIndex(), AuthorizedIMEIIndex()
+
+    def whitelist(self, *imeis, index=None):
+        # bulk writes send no signals, the writer bumps the version
+        AuthorizedIMEI.objects.bulk_create([AuthorizedIMEI(imei=imei) for imei in imeis])
+        (index or self.other).bump_version()
+
+    def test_members(self):
+        self.whitelist('350000000000001', '012345678901234', 'ABC-123')
+        for imei in ('350000000000001', '012345678901234', 'ABC-123'):
+            self.assertTrue(self.index.contains(imei))
+        for imei in ('350000000000002', '12345678901234', '', None):
+            self.assertFalse(self.index.contains(imei))
+        self.assertEqual(self.index.authorized_subset(['350000000000001', '350000000000002', 'ABC-123']),
+                         {'350000000000001', 'ABC-123'})
+
+    def test_misses_need_no_query(self):
+        self.whitelist('350000000000001')
+        self.index.contains('350000000000001')
+        with self.assertNumQueries(0):
+            self.assertFalse(self.index.contains('350000000000002'))
+            self.assertEqual(self.index.authorized_subset(['350000000000002', '350000000000003']), set())
+
+    def test_whitelisting_by_another_worker_is_seen_by_the_next_lookup(self):
+        self.assertFalse(self.index.contains('350000000000001'))
+        self.whitelist('350000000000001')
+        self.assertTrue(self.index.contains('350000000000001'))
+
+    def test_local_changes_apply_without_a_reload(self):
+        self.index.contains('350000000000001')
+        AuthorizedIMEI.objects.create(imei='350000000000001')
+        self.index.apply([('add', '350000000000001')])
+        with self.assertNumQueries(1):  # the verified hit, no reload
+            self.assertTrue(self.index.contains('350000000000001'))
+        AuthorizedIMEI.objects.filter(imei='350000000000001').delete()
+        self.index.apply([('remove', '350000000000001')])
+        with self.assertNumQueries(0):
+            self.assertFalse(self.index.contains('350000000000001'))
+
+    def test_stale_hits_are_verified(self):
+        self.whitelist('350000000000001')
+        self.index.contains('350000000000001')
+        # removed on another worker, its bump not read yet
+        AuthorizedIMEI.objects.all()._raw_delete(AuthorizedIMEI.objects.db)
+        self.index._version = self.index._current_version()
+        self.assertFalse(self.index.contains('350000000000001'))
+
+    def test_signals_keep_the_index_current(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            imei = AuthorizedIMEI.objects.create(imei='350000000000001')
+        self.assertTrue(authorized_imeis.contains('350000000000001'))
+        self.assertTrue(self.other.contains('350000000000001'))
+        with self.captureOnCommitCallbacks(execute=True):
+            imei.delete()
+        self.assertFalse(authorized_imeis.contains('350000000000001'))
+        self.assertFalse(self.other.contains('350000000000001'))
+
+
+class UnsharedCacheIndexTests(TestCase):
+    def test_lookups_query_the_table(self):
+        # the per process memory cache of settings.CACHES: another worker's bump would not arrive
+        index = AuthorizedIMEIIndex()
+        self.assertFalse(index.is_enabled())
+        self.assertFalse(index.contains('350000000000001'))
+        AuthorizedIMEI.objects.bulk_create([AuthorizedIMEI(imei='350000000000001')])
+        with self.assertNumQueries(1):
+            self.assertTrue(index.contains('350000000000001'))
+        with self.assertNumQueries(1):
+            self.assertEqual(index.authorized_subset(['350000000000001', '350000000000002']), {'350000000000001'})
+        with self.assertNumQueries(0):
+            self.assertEqual(index.authorized_subset(['', None]), set())
+
+
+class IngestTests(APITestCase):
+    url = '/api/v1/imei/import/'
+
+    def setUp(self):
+        self.enterContext(shared_cache(self.enterContext(tempfile.TemporaryDirectory())))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.staff = User.objects.create_user('staff@example.com', 'secret123', is_staff=True)
+            AuthorizedIMEI.objects.create(imei='350000000000003')
+        self.client.force_authenticate(self.staff)
+
+    def upload(self, name, content, file_format=None):
+        url = self.url + (f'?file_format={file_format}' if file_format else '')
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(url, {'file': SimpleUploadedFile(name, content)}, format='multipart')
+
+    def test_normalize_imei(self):
+        self.assertEqual(normalize_imei(' 35-209900-176148-1 '), '352099001761481')
+        self.assertEqual(normalize_imei(35209900176148), '35209900176148')
+        for value in ('3520990017614', '35209900176148123', '35209900176148x', '\u0663' * 15, None):
+            self.assertIsNone(normalize_imei(value))
+
+    def test_text_file(self):
+        response = self.upload('whitelist.txt', (
+            '350000000000001\n'
+            '35-000000-000000-2\n'
+            '\n'
+            '350000000000001\n'
+            '350000000000003\n'
+            'not an imei\n').encode())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({key: response.data[key] for key in ('received', 'inserted', 'duplicates', 'invalid')},
+                         {'received': 5, 'inserted': 2, 'duplicates': 2, 'invalid': 1})
+        self.assertEqual(response.data['errors'], [{'row': 6, 'value': 'not an imei', 'error': "Not a valid IMEI."}])
+        self.assertEqual(set(AuthorizedIMEI.objects.values_list('imei', flat=True)),
+                         {'350000000000001', '350000000000002', '350000000000003'})
+        self.assertTrue(authorized_imeis.contains('350000000000002'))
+
+    def test_csv_and_ndjson(self):
+        response = self.upload('whitelist.csv', b'vendor,imei\nacme,350000000000001\nacme,\n')
+        self.assertEqual((response.data['inserted'], response.data['invalid']), (1, 1))
+        response = self.upload('whitelist', b'{"imei": "350000000000002"}\n{"imei": 350000000000004}\n[]\n',
+                               file_format='ndjson')
+        self.assertEqual((response.data['inserted'], response.data['invalid']), (2, 1))
+
+    def test_rejected_files(self):
+        self.assertEqual(self.upload('whitelist.csv', b'serial\n350000000000001\n').status_code, 400)
+        self.assertEqual(self.upload('whitelist.txt', 'caf\u00e9\n350000000000001\n'.encode('latin-1')).status_code, 400)
+        self.assertEqual(self.upload('whitelist.xlsx', b'').status_code, 400)
+        self.assertFalse(AuthorizedIMEI.objects.exclude(imei='350000000000003').exists())
+        self.client.force_authenticate(User.objects.create_user('user@example.com', 'secret123'))
+        self.assertEqual(self.upload('whitelist.txt', b'350000000000001\n').status_code, 403)
+
+    def test_chunks_find_duplicates_across_chunks(self):
+        rows = [(number, str(350000000000000 + number % 4), None) for number in range(1, 11)]
+        report = ingest_imeis(iter(rows), chunk_size=3)
+        self.assertEqual((report['received'], report['inserted'], report['duplicates']), (10, 3, 7))
+        self.assertEqual(AuthorizedIMEI.objects.count(), 4)
+
+
+class AuthorizedIMEIListTests(APITestCase):
+    url = '/api/v1/imei/'
+
+    def setUp(self):
+        self.client.force_authenticate(User.objects.create_user('staff@example.com', 'secret123', is_staff=True))
+        AuthorizedIMEI.objects.bulk_create([AuthorizedIMEI(imei=str(350000000000000 + i)) for i in range(5)]
+                                           + [AuthorizedIMEI(imei='860000000000001')])
+
+    def test_cursor_pages_newest_first(self):
+        ids, url = [], self.url + '?page_size=4'
+        while url:
+            response = self.client.get(url)
+            ids += [row['id'] for row in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(ids, list(AuthorizedIMEI.objects.order_by('-created_at', '-id').values_list('pk', flat=True)))
+
+    def test_prefix_filter(self):
+        response = self.client.get(self.url + '?imei=86')
+        self.assertEqual([row['imei'] for row in response.data['results']], ['860000000000001'])
+
+    def test_stream(self):
+        response = self.client.get(self.url + '?stream=ndjson&imei=35')
+        self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 5)
+        self.assertEqual(self.client.get(self.url + '?stream=xml').status_code, 400)
+
+
+class RevokeTests(APITestCase):
+    url = '/api/v1/imei/revoke/'
+
+    def setUp(self):
+        self.enterContext(shared_cache(self.enterContext(tempfile.TemporaryDirectory())))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.admin = User.objects.create_user('admin@example.com', 'secret123', is_staff=True, is_superuser=True)
+            Device.objects.create(owner=self.admin, name='pixel', imei='350000000000002', price=100)
+        AuthorizedIMEI.objects.bulk_create([AuthorizedIMEI(imei=str(350000000000000 + i)) for i in range(1, 4)])
+        authorized_imeis.bump_version()
+        self.client.force_authenticate(self.admin)
+
+    def test_outcome_per_imei(self):
+        response = self.client.post(self.url, {'imeis': [
+            '350000000000001', '35-000000-000000-2', '350000000000009', 'bad', '350000000000001']}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], [
+            {'imei': '350000000000001', 'outcome': 'deleted'},
+            {'imei': '350000000000002', 'outcome': 'linked'},
+            {'imei': '350000000000009', 'outcome': 'not_found'},
+            {'imei': 'bad', 'outcome': 'not_found'},
+        ])
+        self.assertEqual(set(AuthorizedIMEI.objects.values_list('imei', flat=True)), {'350000000000002', '350000000000003'})
+        self.assertFalse(authorized_imeis.contains('350000000000001'))
+
+    def test_queries_per_chunk_not_per_imei(self):
+        rows = [(number, str(350000000000000 + number), None) for number in range(1, 101)]
+        # stored IMEIs, linked devices, delete, and the devices to revoke in a savepoint
+        with self.assertNumQueries(6):
+            report = revoke_imeis(iter(rows))
+        self.assertEqual((report['deleted'], report['linked'], report['not_found']), (2, 1, 97))
+
+    def test_file_upload(self):
+        response = self.client.post(self.url, {'file': SimpleUploadedFile('revoke.txt', b'350000000000003\n')},
+                                    format='multipart')
+        self.assertEqual(response.data['deleted'], 1)
+
+    def test_admin_only_and_validation(self):
+        self.assertEqual(self.client.post(self.url, {'imeis': []}, format='json').status_code, 400)
+        self.client.force_authenticate(User.objects.create_user('staff@example.com', 'secret123', is_staff=True))
+        self.assertEqual(self.client.post(self.url, {'imeis': ['350000000000001']}, format='json').status_code, 403)
@@ -1,8 +1,11 @@
 
 from django.urls import path
-from .views import AuthorizedIMEIListCreateView, AuthorizedIMEIDeleteView
+from .views import AuthorizedIMEIListCreateView, AuthorizedIMEIDeleteView, AuthorizedIMEIExportView, AuthorizedIMEIImportView, AuthorizedIMEIRevokeView
 
 urlpatterns = [
     path('', AuthorizedIMEIListCreateView.as_view(), name='authorized-imei-list-create'),
+    path('import/', AuthorizedIMEIImportView.as_view(), name='authorized-imei-import'),
+    path('revoke/', AuthorizedIMEIRevokeView.as_view(), name='authorized-imei-revoke'),
+    path('export/', AuthorizedIMEIExportView.as_view(), name='authorized-imei-export'),
     path('<int:pk>/', AuthorizedIMEIDeleteView.as_view(), name='authorized-imei-delete'),
 ]
@@ -0,0 +1,11 @@
+from core.filters import startswith_range
+
+
+def filter_authorized_imeis(queryset, params):
+    """
+    ?imei=<prefix>, served by the unique index on imei
+    """
+    prefix = (params.get('imei') or '').strip()
+    if prefix:
+        queryset = queryset.filter(startswith_range('imei', prefix))
+    return queryset
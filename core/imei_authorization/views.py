@@ -5,31 +5,101 @@ from django.shortcuts import render
 
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework import status
+from rest_framework import generics, status
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.parsers import JSONParser, MultiPartParser
 
 from core.permissions import IsAdmin, IsStaff
+from core.bulk import FORMATS
+from core.export import ExportAPIView, export_response
+from core.pagination import KeysetPagination
 from .models import AuthorizedIMEI
 from .serializers import AuthorizedIMEISerializer
+from .services import detect_ingest_format, ingest_imeis, iter_imeis, revoke_imeis
+from .utils import filter_authorized_imeis
 from device.models import Device
 
-class AuthorizedIMEIListCreateView(APIView):
+class AuthorizedIMEIListCreateView(generics.ListCreateAPIView):
     """
     admin and staff can create
     admin and staff can get list
+    Keyset (cursor) paginated on (created_at, id), newest first.
+    ?imei=<prefix> filters by IMEI prefix.
+    ?stream=csv|ndjson streams every matching row instead of a page (full dumps).
     """
+    serializer_class = AuthorizedIMEISerializer
     permission_classes = [IsAuthenticated, (IsAdmin | IsStaff)]
+    pagination_class = KeysetPagination
+    keyset_ordering = ('-created_at', '-id')
 
-    def get(self, request):
-        imeis = AuthorizedIMEI.objects.all()
-        serializer = AuthorizedIMEISerializer(imeis, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+    def get_queryset(self):
+        return filter_authorized_imeis(AuthorizedIMEI.objects.all(), self.request.query_params)
+
+    def list(self, request, *args, **kwargs):
+        stream = request.query_params.get('stream')
+        if stream is None:
+            return super().list(request, *args, **kwargs)
+        if stream not in FORMATS:
+            return Response({"detail": f"stream must be one of: {', '.join(FORMATS)}."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return export_response(self.get_queryset().order_by('pk'), AuthorizedIMEIExportView.export_columns,
+                               stream, AuthorizedIMEIExportView.export_name)
+
+
+class AuthorizedIMEIImportView(APIView):
+    """
+    admin and staff can bulk add IMEIs from a vendor/carrier whitelist
+    multipart upload, field `file`: .txt (one IMEI per line), CSV with an imei column or NDJSON,
+    format from ?file_format=txt|csv|ndjson or the file extension.
+    Returns inserted / duplicate / invalid counts.
+    """
+    permission_classes = [IsAuthenticated, (IsAdmin | IsStaff)]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({"detail": "file is required."}, status=status.HTTP_400_BAD_REQUEST)
+        file_format = detect_ingest_format(upload, request.query_params.get('file_format'))
+        if file_format is None:
+            return Response({"detail": "Unsupported file format, use txt, csv or ndjson."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            report = ingest_imeis(iter_imeis(upload, file_format))
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(report, status=status.HTTP_200_OK)
+
+
+class AuthorizedIMEIRevokeView(APIView):
+    """
+    only admin can revoke
+    Bulk delete: JSON {"imeis": [...]} or a multipart `file` (.txt / CSV with an imei column / NDJSON).
+    IMEIs still linked to a device are kept. Returns counts and the outcome per IMEI
+    (deleted | linked | not_found | invalid).
+    """
+    permission_classes = [IsAuthenticated, IsAdmin]
+    parser_classes = [JSONParser, MultiPartParser]
 
     def post(self, request):
-        serializer = AuthorizedIMEISerializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        upload = request.FILES.get('file')
+        if upload is not None:
+            file_format = detect_ingest_format(upload, request.query_params.get('file_format'))
+            if file_format is None:
+                return Response({"detail": "Unsupported file format, use txt, csv or ndjson."},
+                                status=status.HTTP_400_BAD_REQUEST)
+            rows = iter_imeis(upload, file_format)
+        else:
+            imeis = request.data.get('imeis') if isinstance(request.data, dict) else None
+            if not isinstance(imeis, list) or not imeis:
+                return Response({"detail": "Send a non empty imeis list or a file."},
+                                status=status.HTTP_400_BAD_REQUEST)
+            rows = ((number, value, None) for number, value in enumerate(imeis, start=1))
+        try:
+            report = revoke_imeis(rows)
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(report, status=status.HTTP_200_OK)
 
 
 class AuthorizedIMEIDeleteView(APIView):
@@ -41,10 +111,21 @@ class AuthorizedIMEIDeleteView(APIView):
     def delete(self, request, pk):
         try:
             imei = AuthorizedIMEI.objects.get(pk=pk)
-            if imei in Device.objects.filter(imei=imei.imei):
+            if Device.objects.filter(imei=imei.imei).exists():
                 return Response({"detail": "Cannot delete authorized IMEI linked to a device."}, status=400)
         except AuthorizedIMEI.DoesNotExist:
             return Response({"detail": "Not found."}, status=404)
 
         imei.delete()
         return Response({"detail": "Deleted Successfully"}, status=status.HTTP_204_NO_CONTENT)
+
+
+class AuthorizedIMEIExportView(ExportAPIView):
+    """
+    admin and staff can export the whole list as CSV / NDJSON (?file_format=), ?imei=<prefix> filters
+    """
+    export_name = 'authorized-imeis'
+    export_columns = ('id', 'imei', 'created_at')
+
+    def get_queryset(self):
+        return filter_authorized_imeis(AuthorizedIMEI.objects.all(), self.request.query_params)
@@ -1,6 +1,12 @@
 from abc import ABC, abstractmethod
 
+from .transport import get_transport
+
 class PaymentAdapter(ABC):
+    def __init__(self, transport=None):
+        # pooled, retrying HTTP client shared by every adapter of the process
+        self.transport = transport or get_transport()
+
     @abstractmethod
     def init_payment(self, payment, return_urls: dict, ipn_url: str) -> dict:
         """
@@ -17,3 +23,20 @@ class PaymentAdapter(ABC):
             { "tran_id": ..., "status": "VALID"/"FAILED", "val_id": ..., ... }
         """
         raise NotImplementedError
+
+    @abstractmethod
+    def validate(self, val_id: str) -> dict:
+        """
+        Confirm a notification with the provider's validation API.
+        Return the provider response, with at least "status", "tran_id" and "amount".
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def query_transaction(self, tran_id: str) -> list:
+        """
+        The provider's records for a payment (tran_id), used to reconcile
+        payments whose notification never arrived.
+        Return a list of dicts with at least "status", "val_id" and "amount".
+        """
+        raise NotImplementedError
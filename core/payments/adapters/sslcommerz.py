@@ -1,8 +1,23 @@
-import requests
 from .base import PaymentAdapter
 from django.conf import settings
 
-SSL_API_URL = getattr(settings, 'SSL_SANDBOX_URL', 'https://sandbox.sslcommerz.com/gwprocess/v4/api.php')
+SSL_API_URL = 'https://sandbox.sslcommerz.com/gwprocess/v4/api.php'
+SSL_VALIDATION_URL = 'https://sandbox.sslcommerz.com/validator/api/validationserverAPI.php'
+SSL_TRANSACTION_QUERY_URL = 'https://sandbox.sslcommerz.com/validator/api/merchantTransIDvalidationAPI.php'
+
+
+def api_url():
+    # read per call, so a local stand-in (payments/local_gateway.py) can be swapped in
+    return getattr(settings, 'SSL_SANDBOX_URL', None) or SSL_API_URL
+
+
+def validation_url():
+    return getattr(settings, 'SSL_VALIDATION_URL', None) or SSL_VALIDATION_URL
+
+
+def transaction_query_url():
+    return getattr(settings, 'SSL_TRANSACTION_QUERY_URL', None) or SSL_TRANSACTION_QUERY_URL
+
 
 class SSLCommerzAdapter(PaymentAdapter):
     def init_payment(self, payment, return_urls: dict, ipn_url: str) -> dict:
@@ -37,8 +52,8 @@ class SSLCommerzAdapter(PaymentAdapter):
             "value_a": f"device_id:{payment.device.id}"
         }
 
-        # call SSLCommerz endpoint
-        resp = requests.post(SSL_API_URL, data=payload, timeout=15)
+        # call SSLCommerz endpoint, session init is not idempotent: only retried when it never left
+        resp = self.transport.post(api_url(), data=payload)
         resp.raise_for_status()
         return resp.json()
 
@@ -56,3 +71,34 @@ class SSLCommerzAdapter(PaymentAdapter):
             "val_id": val_id,
             "raw": request_data
         }
+
+    def validate(self, val_id: str) -> dict:
+        """
+        Ask the validation API about a val_id received in an IPN.
+        Returns its JSON: status (VALID / VALIDATED / INVALID_TRANSACTION), tran_id, amount, ...
+        """
+        resp = self.transport.get(validation_url(), params={
+            "val_id": val_id,
+            "store_id": settings.SSL_STORE_ID,
+            "store_passwd": settings.SSL_STORE_PASSWORD,
+            "format": "json",
+        })
+        resp.raise_for_status()
+        return resp.json()
+
+    def query_transaction(self, tran_id: str) -> list:
+        """
+        Transaction query by tran_id: every gateway attempt recorded for our payment,
+        each with status (VALID / VALIDATED / FAILED / CANCELLED / PENDING ...), val_id and amount.
+        """
+        resp = self.transport.get(transaction_query_url(), params={
+            "tran_id": tran_id,
+            "store_id": settings.SSL_STORE_ID,
+            "store_passwd": settings.SSL_STORE_PASSWORD,
+            "format": "json",
+        })
+        resp.raise_for_status()
+        data = resp.json()
+        if data.get('APIConnect') not in (None, 'DONE'):
+            raise ValueError(f"transaction query failed: {data.get('APIConnect')}")
+        return data.get('element') or []
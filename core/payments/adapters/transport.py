@@ -0,0 +1,251 @@
+import logging
+import random
+import threading
+import time
+from collections import Counter, deque
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+from core.latency import summarize
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'})
+RETRY_STATUSES = frozenset({429, 502, 503, 504})
+# latency samples kept for the metrics percentiles
+LATENCY_SAMPLES = 1000
+
+
+class GatewayUnavailable(requests.RequestException):
+    """
+    raised without calling the gateway while its circuit is open
+    """
+    def __init__(self, host, retry_after):
+        super().__init__(f"{host} is failing, circuit open for another {retry_after:.0f}s")
+        self.host = host
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    closed: requests pass, consecutive failures are counted.
+    open: after `failure_threshold` failures, requests fail fast for `reset_timeout` seconds.
+    half_open: then a single trial request is let through, success closes the circuit, failure reopens it.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, host, failure_threshold, reset_timeout):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def before_request(self):
+        with self._lock:
+            if self.state == self.OPEN:
+                waited = time.monotonic() - self._opened_at
+                if waited < self.reset_timeout:
+                    raise GatewayUnavailable(self.host, self.reset_timeout - waited)
+                self.state = self.HALF_OPEN
+                self._trial_running = False
+            if self.state == self.HALF_OPEN:
+                if self._trial_running:
+                    raise GatewayUnavailable(self.host, self.reset_timeout)
+                self._trial_running = True
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.opened += 1
+                    logger.warning("Circuit for %s opened after %s failures", self.host, self.failures)
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def snapshot(self):
+        return {'state': self.state, 'consecutive_failures': self.failures, 'times_opened': self.opened}
+
+
+def _not_sent(error):
+    """
+    the request never reached the gateway (connect refused / timed out), safe to retry any method
+    """
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+class GatewayTransport:
+    """
+    Shared HTTP client for the payment adapters, one per process.
+    - keep-alive connection pool (requests.Session + urllib3), no handshake per payment
+    - (connect, read) timeouts instead of a single 15s one
+    - bounded retries with full jitter backoff, for idempotent methods and for
+      any request that provably never left (connect errors)
+    - a circuit breaker per gateway host that fails fast while it is degraded
+    - request / retry / failure counters, latency percentiles and pool usage in stats()
+    """
+
+    def __init__(self, connect_timeout=3.05, read_timeout=10.0, pool_size=10, max_retries=2, backoff=0.25,
+                 max_backoff=2.0, failure_threshold=5, reset_timeout=30.0):
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self._breakers = {}
+        self._counters = Counter()
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+        self._lock = threading.Lock()
+
+    def breaker(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            breaker = self._breakers.get(host)
+            if breaker is None:
+                breaker = self._breakers[host] = CircuitBreaker(host, self.failure_threshold, self.reset_timeout)
+        return breaker
+
+    def request(self, method, url, idempotent=None, **kwargs):
+        """
+        session.request() with the retry / circuit breaker policy.
+        idempotent defaults to the HTTP method semantics, pass True for POST
+        endpoints that are safe to repeat (lookups, validations).
+        Returns the last response, raises the last connection error or GatewayUnavailable.
+        """
+        method = method.upper()
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        kwargs.setdefault('timeout', self.timeout)
+        breaker = self.breaker(url)
+
+        attempt = 0
+        while True:
+            try:
+                breaker.before_request()
+            except GatewayUnavailable:
+                self._count('short_circuited')
+                raise
+            self._count('requests')
+            started = time.perf_counter()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.RequestException as e:
+                self._record(started)
+                self._count('errors')
+                breaker.record_failure()
+                if attempt >= self.max_retries or not (idempotent or _not_sent(e)):
+                    raise
+                logger.info("Retrying %s %s after %s", method, url, e.__class__.__name__)
+            else:
+                self._record(started)
+                if response.status_code >= 500:
+                    self._count('errors')
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                if response.status_code not in RETRY_STATUSES or not idempotent or attempt >= self.max_retries:
+                    return response
+                response.close()
+                logger.info("Retrying %s %s after HTTP %s", method, url, response.status_code)
+
+            attempt += 1
+            self._count('retries')
+            time.sleep(random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt)))
+
+    def post(self, url, idempotent=False, **kwargs):
+        return self.request('POST', url, idempotent=idempotent, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _record(self, started):
+        self._latencies.append(time.perf_counter() - started)
+
+    def pool_stats(self):
+        """
+        per host connection pool usage: connections opened, requests sent, idle kept-alive connections
+        """
+        stats = {}
+        for prefix in ('https://', 'http://'):
+            pools = self.session.get_adapter(prefix).poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                # the urllib3 queue holds None placeholders for connections not opened yet
+                idle = [conn for conn in list(pool.pool.queue) if conn is not None] if pool.pool is not None else []
+                stats[f'{pool.scheme}://{pool.host}:{pool.port}'] = {
+                    'connections_opened': pool.num_connections,
+                    'requests': pool.num_requests,
+                    'idle': len(idle),
+                    'max_size': pool.pool.maxsize if pool.pool is not None else 0,
+                }
+        return stats
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+            breakers = {host: breaker.snapshot() for host, breaker in self._breakers.items()}
+        return {
+            'counters': {name: counters.get(name, 0)
+                         for name in ('requests', 'errors', 'retries', 'short_circuited')},
+            'latency': summarize(list(self._latencies)),
+            'circuits': breakers,
+            'pools': self.pool_stats(),
+        }
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def get_transport():
+    """
+    the process wide transport, created on first use (after a fork, never shared across processes)
+    """
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                _transport = GatewayTransport(
+                    connect_timeout=getattr(settings, 'PAYMENT_HTTP_CONNECT_TIMEOUT', 3.05),
+                    read_timeout=getattr(settings, 'PAYMENT_HTTP_READ_TIMEOUT', 10.0),
+                    pool_size=getattr(settings, 'PAYMENT_HTTP_POOL_SIZE', 10),
+                    max_retries=getattr(settings, 'PAYMENT_HTTP_MAX_RETRIES', 2),
+                    backoff=getattr(settings, 'PAYMENT_HTTP_BACKOFF', 0.25),
+                    failure_threshold=getattr(settings, 'PAYMENT_CIRCUIT_FAILURE_THRESHOLD', 5),
+                    reset_timeout=getattr(settings, 'PAYMENT_CIRCUIT_RESET_TIMEOUT', 30.0),
+                )
+    return _transport
@@ -2,5 +2,7 @@ from django.contrib import admin
 
 # Register your models here.
 
-from .models import Payment
-admin.site.register(Payment)
\ No newline at end of file
+from .models import Payment, PaymentNotification, WebhookEvent
+admin.site.register(Payment)
+admin.site.register(PaymentNotification)
+admin.site.register(WebhookEvent)
\ No newline at end of file
@@ -0,0 +1,298 @@
+"""
+Local SSLCommerz stand-in for development and load tests, never for production.
+
+Implements the parts of the gateway the app talks to:
+- POST /gwprocess/v4/api.php                        session init, returns GatewayPageURL
+- GET  /gwprocess/v4/gw.php?SESSIONKEY=...          the checkout page: the customer "pays",
+                                                    the IPN is posted to the session's ipn_url
+                                                    and the browser is redirected to success_url / fail_url
+- GET  /validator/api/validationserverAPI.php       validation of a val_id
+- GET  /validator/api/merchantTransIDvalidationAPI.php   transaction query by tran_id
+Latency and failures are injected per GatewayBehaviour.
+"""
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+INIT_PATH = '/gwprocess/v4/api.php'
+CHECKOUT_PATH = '/gwprocess/v4/gw.php'
+VALIDATION_PATH = '/validator/api/validationserverAPI.php'
+TRANSACTION_QUERY_PATH = '/validator/api/merchantTransIDvalidationAPI.php'
+
+
+class GatewayBehaviour:
+    """
+    latency: mean seconds added to every API call, +-jitter (fraction of it)
+    init_error_rate: share of session inits answered with HTTP 500
+    decline_rate: share of session inits answered with status FAILED
+    payment_failure_rate: share of checkouts that end in a FAILED IPN
+    ipn_delay: seconds between checkout and IPN
+    duplicate_ipn_rate: share of IPNs sent twice
+    ipn_loss_rate: share of IPNs never sent (left to the pending payment sweep)
+    ipn_retries: resends of an IPN the app did not answer with 200
+    """
+    def __init__(self, latency=0.0, jitter=0.5, init_error_rate=0.0, decline_rate=0.0,
+                 payment_failure_rate=0.0, ipn_delay=0.0, duplicate_ipn_rate=0.0, ipn_loss_rate=0.0,
+                 ipn_retries=3, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.init_error_rate = init_error_rate
+        self.decline_rate = decline_rate
+        self.payment_failure_rate = payment_failure_rate
+        self.ipn_delay = ipn_delay
+        self.duplicate_ipn_rate = duplicate_ipn_rate
+        self.ipn_loss_rate = ipn_loss_rate
+        self.ipn_retries = ipn_retries
+        self.random = random.Random(seed)
+
+    def chance(self, rate):
+        return rate > 0 and self.random.random() < rate
+
+    def delay(self):
+        if self.latency > 0:
+            spread = self.latency * self.jitter
+            time.sleep(max(0.0, self.random.uniform(self.latency - spread, self.latency + spread)))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        logger.debug("local gateway: " + format, *args)
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        form = dict(parse_qsl(self.rfile.read(length).decode()))
+        if url.path == INIT_PATH:
+            return self._send(*self.server.gateway.init_session(form))
+        self._send(404, {'status': 'FAILED', 'failedreason': 'Not found'})
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = dict(parse_qsl(url.query))
+        gateway = self.server.gateway
+        if url.path == CHECKOUT_PATH:
+            location = gateway.checkout(query.get('SESSIONKEY', ''))
+            if location is None:
+                return self._send(404, {'status': 'FAILED', 'failedreason': 'Invalid session'})
+            return self._send(302, None, {'Location': location})
+        if url.path == VALIDATION_PATH:
+            return self._send(*gateway.validation(query))
+        if url.path == TRANSACTION_QUERY_PATH:
+            return self._send(*gateway.transaction_query(query))
+        self._send(404, {'status': 'FAILED', 'failedreason': 'Not found'})
+
+    def _send(self, status, body, headers=None):
+        data = json.dumps(body).encode() if body is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class LocalSSLCommerz:
+    """
+    The stand-in server, run in a background thread:
+
+        gateway = LocalSSLCommerz(behaviour=GatewayBehaviour(latency=0.05)).start()
+        settings.SSL_SANDBOX_URL = gateway.init_url
+        settings.SSL_VALIDATION_URL = gateway.validation_url
+        ...
+        gateway.stop()
+
+    With store_id / store_password set, inits and validations with other credentials are declined.
+    """
+    def __init__(self, host='127.0.0.1', port=0, behaviour=None, store_id=None, store_password=None,
+                 ipn_workers=8):
+        self.behaviour = behaviour or GatewayBehaviour()
+        self.store_id = store_id
+        self.store_password = store_password
+        self.counters = Counter()
+        self.sessions = {}
+        self.validations = {}
+        self.transactions = {}
+        self._lock = threading.Lock()
+        self._server = _Server((host, port), _Handler)
+        self._server.gateway = self
+        self._thread = None
+        self._ipn_pool = ThreadPoolExecutor(max_workers=ipn_workers, thread_name_prefix='local-gateway-ipn')
+        self._ipn_session = requests.Session()
+        self._ipn_session.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize=ipn_workers))
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def init_url(self):
+        return self.url + INIT_PATH
+
+    @property
+    def validation_url(self):
+        return self.url + VALIDATION_PATH
+
+    @property
+    def transaction_query_url(self):
+        return self.url + TRANSACTION_QUERY_PATH
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='local-gateway', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._ipn_pool.shutdown(wait=True)
+        self._ipn_session.close()
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _credentials_ok(self, data):
+        return ((self.store_id is None or data.get('store_id') == self.store_id)
+                and (self.store_password is None or data.get('store_passwd') == self.store_password))
+
+    # API
+
+    def init_session(self, form):
+        behaviour = self.behaviour
+        behaviour.delay()
+        self._count('init')
+        if behaviour.chance(behaviour.init_error_rate):
+            self._count('init_error')
+            return 500, {'status': 'FAILED', 'failedreason': 'Internal error (injected)'}
+        if not self._credentials_ok(form):
+            self._count('init_declined')
+            return 200, {'status': 'FAILED', 'failedreason': 'Store Credential Error Or Store is De-active'}
+        if behaviour.chance(behaviour.decline_rate):
+            self._count('init_declined')
+            return 200, {'status': 'FAILED', 'failedreason': 'Declined (injected)'}
+        missing = [name for name in ('tran_id', 'total_amount', 'ipn_url') if not form.get(name)]
+        if missing:
+            self._count('init_declined')
+            return 200, {'status': 'FAILED', 'failedreason': f"Missing {', '.join(missing)}"}
+
+        session_key = uuid.uuid4().hex.upper()
+        with self._lock:
+            self.sessions[session_key] = {
+                'tran_id': form['tran_id'],
+                'amount': form['total_amount'],
+                'currency': form.get('currency', 'BDT'),
+                'ipn_url': form['ipn_url'],
+                'success_url': form.get('success_url'),
+                'fail_url': form.get('fail_url'),
+                'value_a': form.get('value_a', ''),
+                'record': {'tran_id': form['tran_id'], 'val_id': '', 'amount': form['total_amount'],
+                           'currency': form.get('currency', 'BDT'), 'status': 'PENDING',
+                           'tran_date': time.strftime('%Y-%m-%d %H:%M:%S')},
+            }
+            self.transactions.setdefault(form['tran_id'], []).append(self.sessions[session_key]['record'])
+        return 200, {
+            'status': 'SUCCESS',
+            'failedreason': '',
+            'sessionkey': session_key,
+            'GatewayPageURL': f'{self.url}{CHECKOUT_PATH}?{urlencode({"Q": "pay", "SESSIONKEY": session_key})}',
+        }
+
+    def checkout(self, session_key):
+        """
+        the customer completes (or fails) the payment, returns the redirect location
+        """
+        with self._lock:
+            session = self.sessions.pop(session_key, None)
+        if session is None:
+            return None
+        self._count('checkout')
+        behaviour = self.behaviour
+        failed = behaviour.chance(behaviour.payment_failure_rate)
+        val_id = uuid.uuid4().hex[:20].upper()
+        ipn = {
+            'tran_id': session['tran_id'],
+            'val_id': val_id,
+            'amount': session['amount'],
+            'store_amount': str((Decimal(session['amount']) * Decimal('0.975')).quantize(Decimal('0.01'))),
+            'currency': session['currency'],
+            'card_type': 'VISA-Dutch Bangla',
+            'bank_tran_id': uuid.uuid4().hex[:16],
+            'tran_date': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'status': 'FAILED' if failed else 'VALID',
+            'value_a': session['value_a'],
+        }
+        with self._lock:
+            session['record'].update(status=ipn['status'], val_id=val_id, tran_date=ipn['tran_date'])
+            if not failed:
+                self.validations[val_id] = ipn
+        if behaviour.chance(behaviour.ipn_loss_rate):
+            self._count('ipn_lost')
+            copies = 0
+        else:
+            copies = 2 if behaviour.chance(behaviour.duplicate_ipn_rate) else 1
+        for _ in range(copies):
+            self._ipn_pool.submit(self._post_ipn, session['ipn_url'], ipn)
+        return session['fail_url'] if failed else session['success_url']
+
+    def _post_ipn(self, ipn_url, ipn):
+        if self.behaviour.ipn_delay:
+            time.sleep(self.behaviour.ipn_delay)
+        for attempt in range(self.behaviour.ipn_retries + 1):
+            try:
+                response = self._ipn_session.post(ipn_url, data=ipn, timeout=10)
+                if response.status_code == 200:
+                    self._count('ipn_delivered')
+                    return
+                self._count('ipn_rejected')
+            except requests.RequestException:
+                self._count('ipn_error')
+            time.sleep(min(2 ** attempt * 0.1, 2))
+        self._count('ipn_given_up')
+        logger.warning("local gateway: IPN for tran_id %s not delivered", ipn['tran_id'])
+
+    def validation(self, query):
+        self.behaviour.delay()
+        self._count('validation')
+        if not self._credentials_ok(query):
+            return 200, {'status': 'INVALID_TRANSACTION', 'error': 'Store credential mismatch'}
+        with self._lock:
+            ipn = self.validations.get(query.get('val_id', ''))
+            first = ipn is not None and not ipn.get('validated')
+            if first:
+                ipn['validated'] = True
+        if ipn is None:
+            return 200, {'status': 'INVALID_TRANSACTION'}
+        # the real API answers VALIDATED for a val_id it has validated before
+        result = {key: value for key, value in ipn.items() if key != 'validated'}
+        result['status'] = 'VALID' if first else 'VALIDATED'
+        return 200, result
+
+    def transaction_query(self, query):
+        self.behaviour.delay()
+        self._count('transaction_query')
+        if not self._credentials_ok(query):
+            return 200, {'APIConnect': 'INVALID_REQUEST', 'no_of_trans_found': 0, 'element': []}
+        with self._lock:
+            records = [dict(record) for record in self.transactions.get(query.get('tran_id', ''), [])]
+        return 200, {'APIConnect': 'DONE', 'no_of_trans_found': len(records), 'element': records}
@@ -0,0 +1,101 @@
+import random
+import threading
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, close_old_connections, connection
+from django.db.models import Count
+from django.test import RequestFactory, override_settings
+
+from core.benchmarks import temporary_database, timed
+from core.latency import format_summary, summarize
+from device.models import Device
+from payments.models import Payment, WebhookEvent
+from payments.views import PaymentWebhookView
+from payments.webhooks import drain_inbox
+
+
+class Command(BaseCommand):
+    help = ("Measure webhook acknowledgement latency and inbox drain throughput on a throwaway "
+            "database. SQLite serializes writers, run against PostgreSQL for worker scaling numbers.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--payments', type=int, default=2000)
+        parser.add_argument('--retry-ratio', type=float, default=0.2,
+                            help="share of notifications the gateway sends twice")
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--batch-size', type=int, default=50)
+
+    def handle(self, *args, **options):
+        # no gateway here: the notifications are made up, apply them unvalidated
+        with temporary_database(file_backed=True), override_settings(PAYMENT_WEBHOOK_INLINE=False,
+                                                                      PAYMENT_VALIDATE_IPN=False):
+            self._run(options)
+
+    def _run(self, options):
+        rng = random.Random(5)
+        owner = get_user_model().objects.create(email='bench@example.com', password='!')
+        devices = Device.objects.bulk_create(
+            Device(owner=owner, name=f'device {i}', imei=str(10**14 + i), price=Decimal('100.00'))
+            for i in range(options['payments']))
+        payments = Payment.objects.bulk_create(
+            Payment(user=owner, device=device, amount=Decimal('15.00')) for device in devices)
+
+        notifications = []
+        for payment in payments:
+            body = {'tran_id': str(payment.id), 'status': 'VALID', 'val_id': f'val-{payment.id}'}
+            notifications.append(body)
+            if rng.random() < options['retry_ratio']:
+                notifications.append(body)
+        rng.shuffle(notifications)
+
+        factory = RequestFactory()
+        view = PaymentWebhookView.as_view()
+        samples = []
+        for body in notifications:
+            response, elapsed = timed(view, factory.post('/api/v1/payments/webhook/', body))
+            assert response.status_code == 200, response.data
+            samples.append(elapsed)
+        self.stdout.write(f"ack:    {len(samples):,} notifications  {format_summary(summarize(samples))}  "
+                          f"= {len(samples) / sum(samples):,.0f}/s sequential")
+
+        errors = []
+
+        def work():
+            try:
+                while True:
+                    try:
+                        if not drain_inbox(options['batch_size']):
+                            return
+                    except OperationalError as e:
+                        # SQLite: another worker holds the write lock, the batch rolled back
+                        errors.append(e)
+            finally:
+                close_old_connections()
+
+        workers = options['workers']
+        if connection.vendor == 'sqlite' and workers > 1:
+            # one writer at a time, extra workers only collide on the database lock
+            self.stdout.write(f"sqlite: draining with 1 worker instead of {workers}")
+            workers = 1
+
+        def drain():
+            threads = [threading.Thread(target=work) for _ in range(workers)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        _, elapsed = timed(drain)
+        handled = WebhookEvent.objects.exclude(status=WebhookEvent.STATUS_PENDING).count()
+        self.stdout.write(f"drain:  {handled:,} events in {elapsed:.2f}s = {handled / elapsed:,.0f}/s "
+                          f"with {workers} workers, batch {options['batch_size']}")
+        if errors:
+            self.stdout.write(f"rolled back batches: {len(errors)} ({errors[0]})")
+
+        by_status = dict(WebhookEvent.objects.order_by().values_list('status').annotate(Count('id')))
+        confirmed = Payment.objects.filter(status=Payment.STATUS_SUCCESS).count()
+        authorized = Device.objects.filter(is_authorized=True).count()
+        self.stdout.write(f"events: {by_status}  payments confirmed: {confirmed:,}/{len(payments):,}  "
+                          f"devices authorized: {authorized:,}")
@@ -0,0 +1,185 @@
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+import requests
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.db.models import Count
+from django.test import override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from core.benchmarks import live_app_server, temporary_database
+from core.latency import format_summary, summarize
+from device.models import Device
+from payments.local_gateway import LocalSSLCommerz
+from payments.models import Payment, WebhookEvent
+from payments.reconciliation import sweep_pending_payments
+from payments.webhooks import drain_inbox
+from .run_local_gateway import add_behaviour_arguments, behaviour_from_options
+
+STORE_ID = 'loadtest'
+STORE_PASSWORD = 'loadtest@ssl'
+
+
+class Command(BaseCommand):
+    help = ("End to end payment load test on a throwaway database: the app is served on a local port, "
+            "SSLCommerz is replaced by the local stand-in. Every flow creates a payment, follows the "
+            "gateway page (the stand-in then posts the IPN) and polls the device until it is authorized.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--flows', type=int, default=200, help="payments to run, one user and device each")
+        parser.add_argument('--concurrency', type=int, default=8, help="flows in flight at once")
+        parser.add_argument('--skip-validation', action='store_true',
+                            help="apply IPNs without asking the validation API (PAYMENT_VALIDATE_IPN=False)")
+        parser.add_argument('--webhook-workers', type=int, default=0,
+                            help="process_webhooks style worker threads, 0 keeps the in process drain")
+        parser.add_argument('--poll-interval', type=float, default=0.05)
+        parser.add_argument('--timeout', type=float, default=30.0, help="seconds a flow waits for the authorization")
+        parser.add_argument('--double-click-rate', type=float, default=0.0,
+                            help="share of flows that post the create request a second time")
+        parser.add_argument('--sweep', action='store_true',
+                            help="run the pending payment sweep afterwards (pair with --ipn-loss-rate)")
+        add_behaviour_arguments(parser)
+
+    def handle(self, *args, **options):
+        with temporary_database(file_backed=True), live_app_server() as app_url:
+            gateway = LocalSSLCommerz(behaviour=behaviour_from_options(options),
+                                      store_id=STORE_ID, store_password=STORE_PASSWORD).start()
+            try:
+                with override_settings(
+                        ALLOWED_HOSTS=['127.0.0.1', 'localhost'], PUBLIC_DOMAIN=app_url,
+                        SSL_SANDBOX_URL=gateway.init_url, SSL_VALIDATION_URL=gateway.validation_url,
+                        SSL_TRANSACTION_QUERY_URL=gateway.transaction_query_url,
+                        SSL_STORE_ID=STORE_ID, SSL_STORE_PASSWORD=STORE_PASSWORD,
+                        PAYMENT_VALIDATE_IPN=not options['skip_validation'],
+                        PAYMENT_WEBHOOK_INLINE=not options['webhook_workers']):
+                    self._run(app_url, gateway, options)
+            finally:
+                gateway.stop()
+
+    def _run(self, app_url, gateway, options):
+        User = get_user_model()
+        users = User.objects.bulk_create(
+            User(email=f'loadtest{i}@example.com', password='!') for i in range(options['flows']))
+        devices = Device.objects.bulk_create(
+            Device(owner=user, name=f'device {i}', imei=str(10**14 + i), price=Decimal('1000.00'))
+            for i, user in enumerate(users))
+        flows = [(device.pk, str(AccessToken.for_user(user))) for user, device in zip(users, devices)]
+
+        stop = threading.Event()
+        workers = [threading.Thread(target=self._webhook_worker, args=(stop,))
+                   for _ in range(options['webhook_workers'])]
+        for worker in workers:
+            worker.start()
+
+        local = threading.local()
+        timings = {'create': [], 'create_repeat': [], 'checkout': [], 'end_to_end': []}
+        outcomes = Counter()
+        lock = threading.Lock()
+
+        def run_flow(flow):
+            device_id, token = flow
+            session = getattr(local, 'session', None)
+            if session is None:
+                session = local.session = requests.Session()
+            outcome, samples = self._flow(session, app_url, device_id, token, options)
+            with lock:
+                outcomes[outcome] += 1
+                for name, value in samples.items():
+                    timings[name].append(value)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            list(pool.map(run_flow, flows))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        for worker in workers:
+            worker.join()
+
+        authorized = outcomes['authorized']
+        self.stdout.write(f"{len(flows):,} flows, concurrency {options['concurrency']}, {elapsed:.2f}s: "
+                          f"{len(flows) / elapsed:,.1f} flows/s, {authorized / elapsed:,.1f} authorized/s")
+        self.stdout.write(f"outcomes:    {dict(outcomes)}")
+        for name, samples in timings.items():
+            self.stdout.write(f"{name + ':':<14} {format_summary(summarize(samples))}")
+        self.stdout.write(f"stand-in:    {dict(gateway.counters)}")
+        self.stdout.write(f"inbox:       {self._counts(WebhookEvent.objects.all())}")
+        self.stdout.write(f"payments:    {self._counts(Payment.objects.all())}")
+        if options['double_click_rate']:
+            self.stdout.write(f"reused:      {len(timings['create_repeat'])} repeated creates, "
+                              f"{gateway.counters['init']} gateway inits for {len(flows)} flows")
+        if options['sweep']:
+            # every payment still pending is due: asked at once, expired when the gateway has no result
+            report = sweep_pending_payments(min_age=0, ttl=0)
+            self.stdout.write(f"sweep:       {report['scanned']} scanned in {report['duration_s']:.2f}s, "
+                              f"{report['gateway_calls']} gateway calls ({report['gateway_errors']} errors), "
+                              f"confirmed {report['confirmed']}, failed {report['failed']}, "
+                              f"expired {report['expired']}, unchanged {report['unchanged']}")
+            self.stdout.write(f"payments:    {self._counts(Payment.objects.all())}")
+            authorized += report['confirmed']
+        devices_authorized = Device.objects.filter(is_authorized=True).count()
+        payments_confirmed = Payment.objects.filter(status=Payment.STATUS_SUCCESS).count()
+        consistent = devices_authorized == payments_confirmed == authorized
+        self.stdout.write(f"consistency: {'ok' if consistent else 'MISMATCH'} "
+                          f"(devices authorized {devices_authorized}, payments confirmed {payments_confirmed})")
+
+    def _flow(self, session, app_url, device_id, token, options):
+        """
+        create -> gateway page (redirect) -> IPN -> device authorized, returns (outcome, timings)
+        """
+        headers = {'Authorization': f'Bearer {token}'}
+        samples = {}
+        started = time.perf_counter()
+        try:
+            response = session.post(f'{app_url}/api/v1/payments/create/', json={'device_id': device_id},
+                                    headers=headers, timeout=30)
+            samples['create'] = time.perf_counter() - started
+            if response.status_code != 200:
+                return f'create {response.status_code}', samples
+            created = response.json()
+
+            if options['double_click_rate'] and random.random() < options['double_click_rate']:
+                repeat_started = time.perf_counter()
+                repeat = session.post(f'{app_url}/api/v1/payments/create/', json={'device_id': device_id},
+                                      headers=headers, timeout=30)
+                samples['create_repeat'] = time.perf_counter() - repeat_started
+                if repeat.status_code != 200 or repeat.json()['payment_id'] != created['payment_id']:
+                    return 'repeat not reused', samples
+
+            page_started = time.perf_counter()
+            response = session.get(created['payment_url'], allow_redirects=False, timeout=30)
+            samples['checkout'] = time.perf_counter() - page_started
+            if '/fail/' in response.headers.get('Location', ''):
+                return 'payment failed', samples
+
+            deadline = started + options['timeout']
+            while time.perf_counter() < deadline:
+                response = session.get(f'{app_url}/api/v1/device/{device_id}/?fields=is_authorized',
+                                       headers=headers, timeout=30)
+                if response.status_code == 200 and response.json()['data'].get('is_authorized'):
+                    samples['end_to_end'] = time.perf_counter() - started
+                    return 'authorized', samples
+                time.sleep(options['poll_interval'])
+            return 'timeout', samples
+        except requests.RequestException as e:
+            return f'error {type(e).__name__}', samples
+
+    def _webhook_worker(self, stop):
+        try:
+            while not stop.is_set():
+                try:
+                    if not drain_inbox():
+                        stop.wait(0.02)
+                except Exception:
+                    stop.wait(0.05)
+        finally:
+            close_old_connections()
+
+    @staticmethod
+    def _counts(queryset):
+        return dict(queryset.order_by().values_list('status').annotate(Count('id')))
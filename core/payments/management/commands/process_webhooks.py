@@ -0,0 +1,72 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from payments.webhooks import WEBHOOK_BATCH_SIZE, drain_inbox, purge_events
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = ("Worker pool applying the queued payment webhooks (WebhookEvent inbox). "
+            "Runs until interrupted, or until the inbox is empty with --once.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=getattr(settings, 'PAYMENT_WEBHOOK_WORKERS', 4))
+        parser.add_argument('--batch-size', type=int, default=WEBHOOK_BATCH_SIZE,
+                            help="events leased together, each one is then applied in its own transaction")
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help="seconds an idle worker waits before checking the inbox again")
+        parser.add_argument('--once', action='store_true',
+                            help="exit when no event is due (retries waiting for their backoff stay queued)")
+        parser.add_argument('--purge-days', type=int, default=None,
+                            help="first delete handled events older than this many days")
+
+    def handle(self, *args, **options):
+        if options['purge_days'] is not None:
+            self.stdout.write(f"purged {purge_events(options['purge_days']):,} handled events")
+
+        stop = threading.Event()
+        handled = []
+
+        def work():
+            count = 0
+            try:
+                while not stop.is_set():
+                    try:
+                        done = drain_inbox(options['batch_size'])
+                    except Exception:
+                        # database gone / locked: nothing was leased, try again after a pause
+                        logger.exception("Webhook drain failed")
+                        close_old_connections()
+                        stop.wait(options['poll_interval'])
+                        continue
+                    count += done
+                    if not done:
+                        if options['once']:
+                            break
+                        stop.wait(options['poll_interval'])
+            finally:
+                handled.append(count)
+                close_old_connections()
+
+        threads = [threading.Thread(target=work, name=f'webhook-worker-{i}', daemon=True)
+                   for i in range(options['workers'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        try:
+            while any(thread.is_alive() for thread in threads):
+                for thread in threads:
+                    thread.join(timeout=0.5)
+        except KeyboardInterrupt:
+            stop.set()
+            for thread in threads:
+                thread.join()
+        elapsed = time.perf_counter() - started
+        total = sum(handled)
+        self.stdout.write(f"handled {total:,} events in {elapsed:.2f}s with {options['workers']} workers")
@@ -0,0 +1,50 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from payments.local_gateway import GatewayBehaviour, LocalSSLCommerz
+
+
+def add_behaviour_arguments(parser):
+    parser.add_argument('--latency', type=float, default=0.0, help="mean seconds added to every gateway call")
+    parser.add_argument('--init-error-rate', type=float, default=0.0, help="share of inits answered with HTTP 500")
+    parser.add_argument('--decline-rate', type=float, default=0.0, help="share of inits answered with FAILED")
+    parser.add_argument('--payment-failure-rate', type=float, default=0.0, help="share of FAILED IPNs")
+    parser.add_argument('--ipn-delay', type=float, default=0.0, help="seconds between checkout and IPN")
+    parser.add_argument('--duplicate-ipn-rate', type=float, default=0.0, help="share of IPNs sent twice")
+    parser.add_argument('--ipn-loss-rate', type=float, default=0.0, help="share of IPNs never sent")
+
+
+def behaviour_from_options(options):
+    return GatewayBehaviour(
+        latency=options['latency'], init_error_rate=options['init_error_rate'],
+        decline_rate=options['decline_rate'], payment_failure_rate=options['payment_failure_rate'],
+        ipn_delay=options['ipn_delay'], duplicate_ipn_rate=options['duplicate_ipn_rate'],
+        ipn_loss_rate=options['ipn_loss_rate'])
+
+
+class Command(BaseCommand):
+    help = ("Run the local SSLCommerz stand-in (payments/local_gateway.py) for development. "
+            "Point SSL_SANDBOX_URL / SSL_VALIDATION_URL / SSL_TRANSACTION_QUERY_URL at the printed urls.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8010)
+        add_behaviour_arguments(parser)
+
+    def handle(self, *args, **options):
+        gateway = LocalSSLCommerz(host=options['host'], port=options['port'],
+                                  behaviour=behaviour_from_options(options),
+                                  store_id=settings.SSL_STORE_ID, store_password=settings.SSL_STORE_PASSWORD).start()
+        self.stdout.write(f"SSL_SANDBOX_URL={gateway.init_url}")
+        self.stdout.write(f"SSL_VALIDATION_URL={gateway.validation_url}")
+        self.stdout.write(f"SSL_TRANSACTION_QUERY_URL={gateway.transaction_query_url}")
+        try:
+            while True:
+                time.sleep(60)
+                self.stdout.write(str(dict(gateway.counters)))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            gateway.stop()
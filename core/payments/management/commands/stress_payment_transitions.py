@@ -0,0 +1,113 @@
+import queue
+import random
+import threading
+import time
+from collections import Counter
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, close_old_connections
+from django.test import override_settings
+
+from core.benchmarks import temporary_database
+from device.models import Device
+from payments.models import Payment, PaymentNotification, WebhookEvent
+from payments.webhooks import apply_event
+from stats.models import DeviceStat, PaymentStatusStat
+from stats.services import rebuild_device_stats, rebuild_payment_stats
+
+
+class Command(BaseCommand):
+    help = ("Fire shuffled, replayed and conflicting notifications for the same payments from "
+            "concurrent threads on a throwaway database, and check that every payment was "
+            "confirmed and its device authorized exactly once. Real row level concurrency "
+            "needs PostgreSQL, SQLite serializes the writers.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--payments', type=int, default=200)
+        parser.add_argument('--replays', type=int, default=3, help="copies of each VALID notification")
+        parser.add_argument('--failures', type=int, default=2, help="FAILED notifications per payment")
+        parser.add_argument('--threads', type=int, default=8)
+
+    def handle(self, *args, **options):
+        # no gateway here: the notifications are made up, apply them unvalidated
+        with temporary_database(file_backed=True), override_settings(PAYMENT_VALIDATE_IPN=False):
+            self._run(options)
+
+    def _run(self, options):
+        rng = random.Random(17)
+        owner = get_user_model().objects.create(email='stress@example.com', password='!')
+        devices = Device.objects.bulk_create(
+            Device(owner=owner, name=f'device {i}', imei=str(10**14 + i), price=Decimal('100.00'))
+            for i in range(options['payments']))
+        payments = Payment.objects.bulk_create(
+            Payment(user=owner, device=device, amount=Decimal('15.00')) for device in devices)
+        rebuild_device_stats()
+        rebuild_payment_stats()
+
+        events = queue.Queue()
+        notifications = []
+        for payment in payments:
+            tran_id = str(payment.id)
+            notifications += [{'tran_id': tran_id, 'status': 'VALID', 'val_id': f'val-{tran_id}'}] * options['replays']
+            notifications.append({'tran_id': tran_id, 'status': 'VALID', 'val_id': f'other-{tran_id}'})
+            notifications += [{'tran_id': tran_id, 'status': 'FAILED'}] * options['failures']
+        rng.shuffle(notifications)
+        for payload in notifications:
+            events.put(WebhookEvent(tran_id=payload['tran_id'], payload=payload))
+
+        outcomes = Counter()
+        lock = threading.Lock()
+        retries = []
+
+        def work():
+            try:
+                while True:
+                    try:
+                        event = events.get_nowait()
+                    except queue.Empty:
+                        return
+                    while True:
+                        try:
+                            outcome = apply_event(event)
+                            break
+                        except OperationalError:
+                            # SQLite: database locked by another thread, the transaction rolled back
+                            retries.append(1)
+                            time.sleep(rng.random() / 100)
+                    with lock:
+                        outcomes[outcome.split(',')[0]] += 1
+            finally:
+                close_old_connections()
+
+        threads = [threading.Thread(target=work) for _ in range(options['threads'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(f"{len(notifications):,} notifications for {len(payments):,} payments from "
+                          f"{options['threads']} threads in {elapsed:.2f}s ({len(retries)} lock retries)")
+        for outcome, count in sorted(outcomes.items()):
+            self.stdout.write(f"  {outcome}: {count:,}")
+
+        total = len(payments)
+        stats_device = dict(DeviceStat.objects.filter(dimension=DeviceStat.DIMENSION_AUTHORIZED)
+                            .values_list('value', 'count'))
+        stats_payment = dict(PaymentStatusStat.objects.values_list('status', 'count'))
+        checks = {
+            'one confirmation per payment': outcomes['payment confirmed'] == total,
+            'every payment successful': Payment.objects.filter(status=Payment.STATUS_SUCCESS).count() == total,
+            'every device authorized': Device.objects.filter(is_authorized=True).count() == total,
+            'one notification row per val_id': PaymentNotification.objects.count() == 2 * total,
+            'device stats': stats_device.get('true') == total and not stats_device.get('false'),
+            'payment stats': stats_payment.get(Payment.STATUS_SUCCESS) == total and not any(
+                stats_payment.get(status) for status in (Payment.STATUS_PENDING, Payment.STATUS_FAILED)),
+        }
+        for name, ok in checks.items():
+            self.stdout.write(f"  {'ok  ' if ok else 'FAIL'} {name}")
+        if not all(checks.values()):
+            raise CommandError("payment transitions are not exactly once")
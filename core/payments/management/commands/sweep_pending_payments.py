@@ -0,0 +1,42 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.latency import format_summary
+from payments.reconciliation import (PENDING_TTL, SWEEP_BATCH_SIZE, SWEEP_MIN_AGE, SWEEP_WORKERS,
+                                     sweep_pending_payments)
+
+
+class Command(BaseCommand):
+    help = ("Reconcile pending payments with the gateway's transaction query and expire stale ones. "
+            "Run it from cron, or keep it running with --interval.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-age', type=int, default=SWEEP_MIN_AGE,
+                            help="seconds a pending payment is left alone before the gateway is asked")
+        parser.add_argument('--ttl', type=int, default=PENDING_TTL,
+                            help="seconds after which a payment without gateway result is expired")
+        parser.add_argument('--batch-size', type=int, default=SWEEP_BATCH_SIZE)
+        parser.add_argument('--workers', type=int, default=SWEEP_WORKERS, help="concurrent gateway calls")
+        parser.add_argument('--interval', type=float, default=None,
+                            help="repeat every this many seconds instead of a single run")
+        parser.add_argument('--json', action='store_true', help="print the report as JSON")
+
+    def handle(self, *args, **options):
+        while True:
+            report = sweep_pending_payments(min_age=options['min_age'], ttl=options['ttl'],
+                                            batch_size=options['batch_size'], workers=options['workers'])
+            if options['json']:
+                self.stdout.write(json.dumps(report))
+            else:
+                self.stdout.write(
+                    f"{report['started_at']}: scanned {report['scanned']} pending payments in "
+                    f"{report['duration_s']:.2f}s, gateway calls {report['gateway_calls']} "
+                    f"(errors {report['gateway_errors']}), confirmed {report['confirmed']}, "
+                    f"failed {report['failed']}, expired {report['expired']}, "
+                    f"still pending {report['still_pending']}, unchanged {report['unchanged']}")
+                self.stdout.write(f"  gateway latency: {format_summary(report['gateway_latency'])}")
+            if options['interval'] is None:
+                return
+            time.sleep(options['interval'])
@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 from decimal import Decimal
 from device.models import Device
 
@@ -7,11 +8,13 @@ class Payment(models.Model):
     STATUS_PENDING = 'pending'
     STATUS_SUCCESS = 'success'
     STATUS_FAILED = 'failed'
+    STATUS_EXPIRED = 'expired'  # pending past PAYMENT_PENDING_TTL without a gateway result
 
     STATUS_CHOICES = [
         (STATUS_PENDING, 'Pending'),
         (STATUS_SUCCESS, 'Success'),
         (STATUS_FAILED, 'Failed'),
+        (STATUS_EXPIRED, 'Expired'),
     ]
 
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='payments')
@@ -22,12 +25,22 @@ class Payment(models.Model):
     transaction_id = models.CharField(max_length=255, blank=True, null=True, db_index=True)  # gateway tran id / val_id
     created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # gateway checkout page of the session opened for this payment, reused while the session is valid
+    gateway_url = models.URLField(max_length=500, blank=True, default='')
+    gateway_session_at = models.DateTimeField(null=True, blank=True)
+    # client supplied Idempotency-Key header of the create request
+    idempotency_key = models.CharField(max_length=255, null=True, blank=True)
 
     class Meta:
         ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'idempotency_key'], name='payment_idempotency_key_uniq'),
+        ]
         indexes = [
             models.Index(fields=['user', 'status']),
             models.Index(fields=['device', 'status']),
+            # pending payment sweep: oldest first per status (payments/reconciliation.py)
+            models.Index(fields=['status', 'created_at', 'id'], name='payment_status_created_idx'),
         ]
 
     def __str__(self):
@@ -41,3 +54,62 @@ class Payment(models.Model):
         if device.price is None:
             raise ValueError("Device price not set.")
         return (device.price * Decimal('0.15')).quantize(Decimal('0.01'))
+
+
+class PaymentNotification(models.Model):
+    """
+    One row per gateway validation id seen for a payment.
+    The unique (payment, val_id) pair turns a replayed notification into a
+    failed INSERT, no read needed to detect it.
+    """
+    payment = models.ForeignKey(Payment, on_delete=models.CASCADE, related_name='notifications')
+    val_id = models.CharField(max_length=255)
+    status = models.CharField(max_length=20, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['payment', 'val_id'], name='payment_notification_uniq'),
+        ]
+
+    def __str__(self):
+        return f"PaymentNotification#{self.id} payment={self.payment_id} val_id={self.val_id}"
+
+
+class WebhookEvent(models.Model):
+    """
+    Inbox of received gateway notifications (IPN).
+    The webhook only stores the raw payload, payments/webhooks.py applies it later.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    provider = models.CharField(max_length=30, default='sslcommerz')
+    tran_id = models.CharField(max_length=255, blank=True, db_index=True)
+    payload = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # next retry while pending, end of the worker's lease while it is being applied
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default='')
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            # the queue: only pending rows, by due time
+            models.Index(fields=['next_attempt_at', 'id'], condition=models.Q(status='pending'),
+                         name='webhook_event_due_idx'),
+            models.Index(fields=['status', 'processed_at'], name='webhook_event_processed_idx'),
+        ]
+
+    def __str__(self):
+        return f"WebhookEvent#{self.id} {self.provider} tran_id={self.tran_id} - {self.status}"
@@ -0,0 +1,137 @@
+import logging
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from core.latency import summarize
+from .models import Payment
+from .services import confirm_payment, expire_payment, fail_payment, get_adapter, record_notification
+
+logger = logging.getLogger(__name__)
+
+# seconds a payment is left alone before the gateway is asked (the customer may still be paying)
+SWEEP_MIN_AGE = getattr(settings, 'PAYMENT_SWEEP_MIN_AGE', 15 * 60)
+# seconds after which a payment the gateway knows nothing conclusive about is expired
+PENDING_TTL = getattr(settings, 'PAYMENT_PENDING_TTL', 24 * 60 * 60)
+SWEEP_BATCH_SIZE = getattr(settings, 'PAYMENT_SWEEP_BATCH_SIZE', 200)
+SWEEP_WORKERS = getattr(settings, 'PAYMENT_SWEEP_WORKERS', 8)
+
+PAID_STATUSES = ('VALID', 'VALIDATED')
+FAILED_STATUSES = ('FAILED', 'CANCELLED', 'UNATTEMPTED', 'EXPIRED')
+
+
+def _amount(value):
+    try:
+        return Decimal(str(value))
+    except InvalidOperation:
+        return None
+
+
+def gateway_result(payment, records):
+    """
+    ('paid', val_id) when one gateway attempt was paid with the right amount,
+    ('failed', None) when every attempt failed, (None, None) while nothing is conclusive
+    """
+    for record in records:
+        if (record.get('status') or '').upper() in PAID_STATUSES:
+            if _amount(record.get('amount')) == payment.amount:
+                return 'paid', record.get('val_id') or ''
+            logger.warning("Payment %s: gateway amount %s does not match %s",
+                           payment.pk, record.get('amount'), payment.amount)
+    if records and all((record.get('status') or '').upper() in FAILED_STATUSES for record in records):
+        return 'failed', None
+    return None, None
+
+
+def _query(adapter, payment):
+    """
+    runs in the worker pool: (records, error, seconds), no database access here
+    """
+    started = time.perf_counter()
+    try:
+        return adapter.query_transaction(str(payment.pk)), None, time.perf_counter() - started
+    except Exception as e:
+        return None, e, time.perf_counter() - started
+
+
+def reconcile_payment(payment, records, expire_before):
+    """
+    Apply the gateway's view of one pending payment. Every change is a compare and set
+    transition, a notification processed in the meantime wins. Returns the outcome.
+    """
+    result, val_id = gateway_result(payment, records)
+    if result == 'paid':
+        with transaction.atomic():
+            # a late IPN for the same val_id becomes a replay
+            record_notification(payment, val_id, 'VALID')
+            return 'confirmed' if confirm_payment(payment, val_id) else 'unchanged'
+    if result == 'failed':
+        return 'failed' if fail_payment(payment) else 'unchanged'
+    if payment.created_at <= expire_before:
+        return 'expired' if expire_payment(payment) else 'unchanged'
+    return 'still_pending'
+
+
+def sweep_pending_payments(min_age=None, ttl=None, batch_size=None, workers=None, provider='sslcommerz', now=None):
+    """
+    Reconcile payments left pending (their IPN never arrived) with the gateway.
+
+    Pending payments older than min_age seconds are read oldest first, in keyset
+    batches over the (status, created_at, id) index. The gateway's transaction
+    query for a batch runs concurrently in a pool of at most `workers` threads,
+    the results are applied from this thread. Payments the gateway has no result
+    for are expired once older than ttl seconds.
+    Returns the run report.
+    """
+    min_age = SWEEP_MIN_AGE if min_age is None else min_age
+    ttl = PENDING_TTL if ttl is None else ttl
+    now = now or timezone.now()
+    adapter = get_adapter(provider)
+    started = time.perf_counter()
+    outcomes = Counter()
+    latencies = []
+    errors = Counter()
+
+    pending = (Payment.objects.filter(status=Payment.STATUS_PENDING, created_at__lte=now - timedelta(seconds=min_age))
+               .select_related('device').only('id', 'status', 'amount', 'created_at', 'device_id', 'device__imei')
+               .order_by('created_at', 'id'))
+    expire_before = now - timedelta(seconds=ttl)
+    cursor = None
+    with ThreadPoolExecutor(max_workers=workers or SWEEP_WORKERS, thread_name_prefix='payment-sweep') as pool:
+        while True:
+            queryset = pending
+            if cursor is not None:
+                queryset = queryset.filter(Q(created_at__gt=cursor[0]) | Q(created_at=cursor[0], id__gt=cursor[1]))
+            batch = list(queryset[:batch_size or SWEEP_BATCH_SIZE])
+            if not batch:
+                break
+            cursor = (batch[-1].created_at, batch[-1].pk)
+            outcomes['scanned'] += len(batch)
+
+            for payment, (records, error, elapsed) in zip(batch, pool.map(lambda p: _query(adapter, p), batch)):
+                latencies.append(elapsed)
+                if error is not None:
+                    # unknown state, never expired on a failed call
+                    errors[type(error).__name__] += 1
+                    continue
+                outcomes[reconcile_payment(payment, records, expire_before)] += 1
+
+    report = {
+        'started_at': now.isoformat(),
+        'duration_s': round(time.perf_counter() - started, 3),
+        'scanned': outcomes.pop('scanned', 0),
+        'gateway_calls': len(latencies),
+        'gateway_errors': sum(errors.values()),
+        'gateway_error_types': dict(errors),
+        'gateway_latency': summarize(latencies),
+        **{outcome: outcomes[outcome] for outcome in ('confirmed', 'failed', 'expired', 'still_pending', 'unchanged')},
+    }
+    logger.info("Pending payment sweep: %s", report)
+    return report
@@ -3,6 +3,7 @@ from .models import Payment
 from device.models import Device
 from decimal import Decimal
 from device.serializers import DeviceSerializer
+from core.serializers import SparseFieldsetMixin
 
 class CreatePaymentSerializer(serializers.ModelSerializer):
     device_id = serializers.IntegerField(write_only=True)
@@ -13,6 +14,9 @@ class CreatePaymentSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'amount', 'status', 'transaction_id', 'created_at']
 
     def validate_device_id(self, value):
+        """
+        the device is loaded once here, create() and the view use validated_data['device']
+        """
         user = self.context['request'].user
         try:
             device = Device.objects.get(id=value, owner=user)
@@ -20,18 +24,28 @@ class CreatePaymentSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Device not found or not owned by you.")
         if device.is_authorized:
             raise serializers.ValidationError("Device is already authorized.")
+        self._device = device
         return value
 
+    def validate(self, attrs):
+        attrs['device'] = self._device
+        return attrs
+
     def create(self, validated_data):
         user = self.context['request'].user
-        device = Device.objects.get(id=validated_data['device_id'], owner=user)
-        amount = Payment.calculate_fee_for_device(device)  # 15% of device price
-        payment = Payment.objects.create(user=user, device=device, amount=amount, status=Payment.STATUS_PENDING)
+        device = validated_data['device']
+        amount = validated_data.get('amount') or Payment.calculate_fee_for_device(device)  # 15% of device price
+        payment = Payment.objects.create(user=user, device=device, amount=amount, status=Payment.STATUS_PENDING,
+                                         idempotency_key=validated_data.get('idempotency_key'))
         return payment
 
-class PaymentDetailSerializer(serializers.ModelSerializer):
-    device = DeviceSerializer()
+class PaymentDetailSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    """
+    device is rendered as its id, ?expand=device for the full device
+    """
 
     class Meta:
         model = Payment
-        fields = ['id', 'device', 'amount', 'status', 'transaction_id', 'created_at']
\ No newline at end of file
+        fields = ['id', 'device', 'amount', 'status', 'transaction_id', 'created_at']
+
+    expandable_fields = {'device': DeviceSerializer}
\ No newline at end of file
@@ -1,7 +1,152 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from device.authorization import authorize_device
+from device.models import Device
+from imei_authorization.index import authorized_imeis
+from imei_authorization.models import AuthorizedIMEI
+from stats.services import apply_payment_change
 from .adapters.sslcommerz import SSLCommerzAdapter
+from .models import Payment, PaymentNotification
+
+# target status -> statuses it may be reached from.
+# success is final. A validated payment wins over an earlier failure or expiry,
+# a late failure never overwrites a success.
+TRANSITIONS = {
+    Payment.STATUS_SUCCESS: (Payment.STATUS_PENDING, Payment.STATUS_FAILED, Payment.STATUS_EXPIRED),
+    Payment.STATUS_FAILED: (Payment.STATUS_PENDING,),
+    Payment.STATUS_EXPIRED: (Payment.STATUS_PENDING,),
+}
+
+# seconds a gateway checkout session stays usable, a pending payment is reused within it
+SESSION_TTL = getattr(settings, 'PAYMENT_SESSION_TTL', 15 * 60)
+# seconds a pending payment without a session yet counts as being initialized by another request
+INIT_TTL = getattr(settings, 'PAYMENT_INIT_TTL', 60)
+
 
 def get_adapter(provider: str = 'sslcommerz'):
     provider = provider.lower()
     if provider == 'sslcommerz':
         return SSLCommerzAdapter()
     raise ValueError(f"Unsupported provider: {provider}")
+
+
+def _stats_row(payment, status):
+    return {'created_at': payment.created_at, 'status': status, 'amount': payment.amount}
+
+
+def transition_payment(payment, target, transaction_id=None):
+    """
+    Move the payment to `target` if TRANSITIONS allow it from its current status.
+
+    Compare and set: `UPDATE ... WHERE id = %s AND status = <status last seen>`.
+    Of several concurrent callers exactly one matches, the others re-read the
+    status and stop once the transition is no longer allowed.
+    queryset.update() sends no signals, the stats are moved here.
+    Returns the previous status, None when nothing changed. `payment` is updated in place.
+    """
+    sources = TRANSITIONS[target]
+    observed = payment.status
+    while observed in sources:
+        changes = {'status': target, 'updated_at': timezone.now()}
+        if transaction_id is not None:
+            changes['transaction_id'] = transaction_id
+        if Payment.objects.filter(pk=payment.pk, status=observed).update(**changes):
+            apply_payment_change(_stats_row(payment, observed), _stats_row(payment, target))
+            for name, value in changes.items():
+                setattr(payment, name, value)
+            return observed
+        observed = Payment.objects.filter(pk=payment.pk).values_list('status', flat=True).first()
+    if observed is not None:
+        payment.status = observed
+    return None
+
+
+def record_notification(payment, val_id, status=''):
+    """
+    False when this (payment, val_id) was seen before, the notification is a replay.
+    Notifications without val_id cannot be told apart and always count as new.
+    """
+    if not val_id:
+        return True
+    try:
+        with transaction.atomic():
+            PaymentNotification.objects.create(payment_id=payment.pk, val_id=val_id[:255], status=status[:20])
+    except IntegrityError:
+        return False
+    return True
+
+
+def confirm_payment(payment, val_id=None):
+    """
+    Mark the payment successful and authorize its device and IMEI, all in one transaction.
+    Returns False when the payment was already confirmed (nothing done).
+    """
+    with transaction.atomic():
+        if transition_payment(payment, Payment.STATUS_SUCCESS, val_id or str(payment.pk)) is None:
+            return False
+        authorize_device(payment.device_id)
+        imei = payment.device.imei
+        if imei and not authorized_imeis.contains(imei):
+            AuthorizedIMEI.objects.get_or_create(imei=imei)
+    return True
+
+
+def fail_payment(payment, transaction_id=None):
+    """
+    pending -> failed, False when the payment is not pending anymore
+    """
+    return transition_payment(payment, Payment.STATUS_FAILED, transaction_id) is not None
+
+
+def expire_payment(payment):
+    """
+    pending -> expired, False when the payment is not pending anymore
+    """
+    return transition_payment(payment, Payment.STATUS_EXPIRED) is not None
+
+
+def session_is_open(payment, now=None):
+    """
+    the payment is pending and its gateway checkout page can still be used
+    """
+    if payment.status != Payment.STATUS_PENDING or not payment.gateway_url or payment.gateway_session_at is None:
+        return False
+    return payment.gateway_session_at > (now or timezone.now()) - timedelta(seconds=SESSION_TTL)
+
+
+def reusable_payment(user, device, amount):
+    """
+    The user's latest pending payment for the device with an open gateway session
+    and the current amount, or one still being initialized (no session yet, created
+    within INIT_TTL), None when a new one is needed. One query.
+    Call it inside transaction.atomic() with lock_device() first, so concurrent
+    requests for the device check and create one after the other.
+    """
+    now = timezone.now()
+    open_session = Q(amount=amount, gateway_session_at__gt=now - timedelta(seconds=SESSION_TTL)) & ~Q(gateway_url='')
+    initializing = Q(gateway_url='', created_at__gt=now - timedelta(seconds=INIT_TTL))
+    return (Payment.objects
+            .filter(open_session | initializing, user=user, device=device, status=Payment.STATUS_PENDING)
+            .order_by('-created_at').first())
+
+
+def lock_device(device):
+    """
+    row lock on the device until the end of the transaction (a no-op on SQLite,
+    which serializes writers anyway)
+    """
+    Device.objects.select_for_update().filter(pk=device.pk).values_list('pk', flat=True).first()
+
+
+def remember_gateway_session(payment, gateway_url):
+    """
+    store the checkout page of a freshly initialized session, one UPDATE without signals
+    """
+    payment.gateway_url, payment.gateway_session_at = gateway_url[:500], timezone.now()
+    Payment.objects.filter(pk=payment.pk).update(
+        gateway_url=payment.gateway_url, gateway_session_at=payment.gateway_session_at)
@@ -1,3 +1,526 @@
-from django.test import TestCase
+import io
+import json
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from accounts.models import User
+from device.models import Device
+from . import reconciliation
+from .adapters.transport import CircuitBreaker, GatewayTransport, GatewayUnavailable
+from .adapters.sslcommerz import SSLCommerzAdapter
+from .models import Payment, PaymentNotification, WebhookEvent
+from .reconciliation import sweep_pending_payments
+from .services import transition_payment
+from .webhooks import WEBHOOK_MAX_ATTEMPTS, InvalidEvent, _claim, _schedule_retry, apply_event, drain_inbox
+
+
+class PaymentTestCase(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.user = User.objects.create_user('user@example.com', 'secret123')
+        self.device = Device.objects.create(owner=self.user, name='pixel', imei='350000000000001', price=100)
+        self.payment = Payment.objects.create(user=self.user, device=self.device, amount=Decimal('15.00'))
+
+    def event(self, status='VALID', val_id='val-1', tran_id=None):
+        return WebhookEvent.objects.create(tran_id=str(tran_id or self.payment.pk), payload={
+            'tran_id': str(tran_id or self.payment.pk), 'status': status, 'val_id': val_id})
+
+    def validation(self, status='VALID', amount='15.00', tran_id=None, **kwargs):
+        result = {'status': status, 'amount': amount, 'tran_id': str(tran_id or self.payment.pk)}
+        return mock.patch.object(SSLCommerzAdapter, 'validate', return_value=result, **kwargs)
+
+
+class TransitionTests(PaymentTestCase):
+    def status(self):
+        return Payment.objects.get(pk=self.payment.pk).status
+
+    def test_success_applies_once(self):
+        self.assertEqual(transition_payment(self.payment, Payment.STATUS_SUCCESS, 'val-1'), Payment.STATUS_PENDING)
+        self.assertEqual(self.payment.status, Payment.STATUS_SUCCESS)
+        self.assertIsNone(transition_payment(self.payment, Payment.STATUS_SUCCESS, 'val-2'))
+        self.assertEqual(Payment.objects.get(pk=self.payment.pk).transaction_id, 'val-1')
+
+    def test_late_failure_does_not_overwrite_success(self):
+        transition_payment(self.payment, Payment.STATUS_SUCCESS)
+        self.assertIsNone(transition_payment(self.payment, Payment.STATUS_FAILED))
+        self.assertIsNone(transition_payment(self.payment, Payment.STATUS_EXPIRED))
+        self.assertEqual(self.status(), Payment.STATUS_SUCCESS)
+
+    def test_success_wins_over_an_earlier_failure(self):
+        self.assertEqual(transition_payment(self.payment, Payment.STATUS_FAILED), Payment.STATUS_PENDING)
+        self.assertEqual(transition_payment(self.payment, Payment.STATUS_SUCCESS), Payment.STATUS_FAILED)
+        self.assertEqual(self.status(), Payment.STATUS_SUCCESS)
+
+    def test_stale_copy_loses_the_compare_and_set(self):
+        stale = Payment.objects.get(pk=self.payment.pk)
+        transition_payment(self.payment, Payment.STATUS_SUCCESS)
+        # still sees pending, the UPDATE matches no row and the status is read again
+        self.assertIsNone(transition_payment(stale, Payment.STATUS_FAILED))
+        self.assertEqual(stale.status, Payment.STATUS_SUCCESS)
+        self.assertEqual(self.status(), Payment.STATUS_SUCCESS)
+
+    def test_stale_copy_still_applies_an_allowed_transition(self):
+        stale = Payment.objects.get(pk=self.payment.pk)
+        transition_payment(self.payment, Payment.STATUS_FAILED)
+        self.assertEqual(transition_payment(stale, Payment.STATUS_SUCCESS), Payment.STATUS_FAILED)
+
+
+@override_settings(PAYMENT_VALIDATE_IPN=True)
+class ApplyEventTests(PaymentTestCase):
+    def test_success_confirms_and_authorizes_the_device(self):
+        with self.validation():
+            self.assertEqual(apply_event(self.event()), 'payment confirmed, device authorized')
+        self.payment.refresh_from_db()
+        self.device.refresh_from_db()
+        self.assertEqual(self.payment.status, Payment.STATUS_SUCCESS)
+        self.assertTrue(self.device.is_authorized)
+
+    def test_replayed_notification_is_dropped(self):
+        with self.validation() as validate:
+            apply_event(self.event())
+            self.assertEqual(apply_event(self.event()), 'duplicate notification')
+        self.assertEqual(validate.call_count, 1)
+        self.assertEqual(PaymentNotification.objects.count(), 1)
+
+    def test_new_notification_for_a_confirmed_payment_is_ignored(self):
+        with self.validation():
+            apply_event(self.event())
+            self.assertEqual(apply_event(self.event(val_id='val-2')), 'ignored, payment is success')
+        self.assertEqual(apply_event(self.event(status='FAILED', val_id='val-3')), 'ignored, payment is success')
+        self.assertEqual(Payment.objects.get(pk=self.payment.pk).status, Payment.STATUS_SUCCESS)
+
+    def test_rejected_validation_is_invalid(self):
+        validations = (self.validation(status='INVALID_TRANSACTION'), self.validation(amount='1.00'),
+                       self.validation(tran_id=self.payment.pk + 1))
+        for i, validation in enumerate(validations):
+            with validation, self.assertRaises(InvalidEvent):
+                apply_event(self.event(val_id=f'val-{i}'))
+        # nothing recorded, a valid notification with the same val_id is still applied
+        self.assertFalse(PaymentNotification.objects.exists())
+        self.assertEqual(Payment.objects.get(pk=self.payment.pk).status, Payment.STATUS_PENDING)
+
+    def test_failure(self):
+        self.assertEqual(apply_event(self.event(status='FAILED')), 'payment failed')
+        self.assertEqual(Payment.objects.get(pk=self.payment.pk).status, Payment.STATUS_FAILED)
+
+    def test_unknown_payment(self):
+        with self.assertRaises(InvalidEvent):
+            apply_event(self.event(tran_id='999999'))
+
+
+class SweepTests(PaymentTestCase):
+    def setUp(self):
+        super().setUp()
+        self.now = timezone.now()
+        self.payments = {}
+        for name, age in (('paid', 3600), ('failed', 3600), ('unknown', 3600), ('stale', 2 * 86400),
+                          ('error', 2 * 86400), ('fresh', 60)):
+            payment = Payment.objects.create(user=self.user, device=self.device, amount=Decimal('15.00'))
+            Payment.objects.filter(pk=payment.pk).update(created_at=self.now - timedelta(seconds=age))
+            self.payments[name] = payment
+        self.payment.delete()
+        self.records = {
+            'paid': [{'status': 'FAILED'}, {'status': 'VALID', 'val_id': 'val-1', 'amount': '15.00'}],
+            'failed': [{'status': 'FAILED'}, {'status': 'CANCELLED'}],
+            'unknown': [],
+            'stale': [{'status': 'PENDING'}],
+        }
+
+    def query(self, tran_id):
+        name = next(name for name, payment in self.payments.items() if str(payment.pk) == tran_id)
+        if name == 'error':
+            raise requests.ConnectionError('gateway down')
+        return self.records[name]
+
+    def sweep(self, **kwargs):
+        with mock.patch.object(SSLCommerzAdapter, 'query_transaction', side_effect=self.query) as query:
+            report = sweep_pending_payments(min_age=900, ttl=86400, now=self.now, **kwargs)
+        return report, query
+
+    def status(self, name):
+        return Payment.objects.get(pk=self.payments[name].pk).status
+
+    def test_outcomes(self):
+        report, query = self.sweep(batch_size=2, workers=3)
+        self.assertEqual({key: report[key] for key in (
+            'scanned', 'gateway_calls', 'gateway_errors', 'confirmed', 'failed', 'expired', 'still_pending')},
+            {'scanned': 5, 'gateway_calls': 5, 'gateway_errors': 1, 'confirmed': 1, 'failed': 1, 'expired': 1,
+             'still_pending': 1})
+        self.assertEqual(report['gateway_error_types'], {'ConnectionError': 1})
+        self.assertEqual(report['gateway_latency']['count'], 5)
+        self.assertEqual({name: self.status(name) for name in self.payments}, {
+            'paid': Payment.STATUS_SUCCESS, 'failed': Payment.STATUS_FAILED, 'unknown': Payment.STATUS_PENDING,
+            'stale': Payment.STATUS_EXPIRED, 'error': Payment.STATUS_PENDING, 'fresh': Payment.STATUS_PENDING})
+        # recent payments are left to their IPN
+        self.assertNotIn(str(self.payments['fresh'].pk), [call.args[0] for call in query.call_args_list])
+        self.device.refresh_from_db()
+        self.assertTrue(self.device.is_authorized)
+
+    def test_late_ipn_after_the_sweep_is_a_replay(self):
+        self.sweep()
+        with override_settings(PAYMENT_VALIDATE_IPN=False):
+            self.assertEqual(apply_event(self.event(tran_id=self.payments['paid'].pk)), 'duplicate notification')
+
+    def test_wrong_amount_is_not_paid(self):
+        self.records['paid'] = [{'status': 'VALID', 'val_id': 'val-1', 'amount': '1.00'}]
+        with self.assertLogs('payments.reconciliation', 'WARNING'):
+            report, _ = self.sweep()
+        self.assertEqual(report['confirmed'], 0)
+        self.assertEqual(self.status('paid'), Payment.STATUS_PENDING)
+
+    def test_payment_settled_in_the_meantime_is_unchanged(self):
+        self.records['failed'] = [{'status': 'FAILED'}]
+        fail_payment = reconciliation.fail_payment
+
+        def settled_first(payment, *args):
+            # the IPN confirmed it between the read and the sweep's transition
+            transition_payment(Payment.objects.get(pk=payment.pk), Payment.STATUS_SUCCESS)
+            return fail_payment(payment, *args)
+
+        with mock.patch.object(reconciliation, 'fail_payment', side_effect=settled_first):
+            report, _ = self.sweep()
+        self.assertEqual((report['failed'], report['unchanged']), (0, 1))
+        self.assertEqual(self.status('failed'), Payment.STATUS_SUCCESS)
+
+    def test_command(self):
+        out = io.StringIO()
+        with mock.patch.object(SSLCommerzAdapter, 'query_transaction', side_effect=self.query):
+            call_command('sweep_pending_payments', '--json', '--min-age', '900', stdout=out)
+        self.assertEqual(json.loads(out.getvalue())['scanned'], 5)
+
+
+class CreatePaymentTests(PaymentTestCase, APITestCase):
+    url = '/api/v1/payments/create/'
+    session = {'status': 'SUCCESS', 'GatewayPageURL': 'https://sandbox.example.com/pay/1'}
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+
+    def create(self, device=None, result=None, **headers):
+        with mock.patch.object(SSLCommerzAdapter, 'init_payment', **(result or {'return_value': self.session})) as init:
+            response = self.client.post(self.url, {'device_id': (device or self.device).pk}, headers=headers)
+        return response, init.call_count
+
+    def open_session(self, payment, age=0):
+        Payment.objects.filter(pk=payment.pk).update(
+            gateway_url='https://sandbox.example.com/pay/0', gateway_session_at=timezone.now() - timedelta(seconds=age))
+
+    def test_new_payment_opens_a_session(self):
+        self.payment.delete()
+        response, calls = self.create()
+        self.assertEqual((response.status_code, calls), (200, 1))
+        self.assertEqual(response.data['payment_url'], self.session['GatewayPageURL'])
+        self.assertFalse(response.data['reused'])
+        payment = Payment.objects.get(pk=response.data['payment_id'])
+        self.assertEqual((payment.amount, payment.gateway_url), (Decimal('15.00'), self.session['GatewayPageURL']))
+
+    def test_device_is_loaded_once(self):
+        self.payment.delete()
+        # device, device lock, reusable payment, insert and the session update, savepoint included
+        with self.assertNumQueries(7):
+            self.create()
+
+    def test_open_session_is_reused(self):
+        self.open_session(self.payment)
+        response, calls = self.create()
+        self.assertEqual((response.status_code, calls), (200, 0))
+        self.assertTrue(response.data['reused'])
+        self.assertEqual(response.data['payment_id'], self.payment.pk)
+        self.assertEqual(Payment.objects.count(), 1)
+
+    def test_expired_session_or_other_amount_is_not_reused(self):
+        self.open_session(self.payment, age=16 * 60)
+        response, calls = self.create()
+        self.assertEqual((response.status_code, calls), (200, 1))
+        self.assertNotEqual(response.data['payment_id'], self.payment.pk)
+        Payment.objects.exclude(pk=self.payment.pk).delete()
+        self.open_session(self.payment)
+        Device.objects.filter(pk=self.device.pk).update(price=200)
+        self.assertEqual(self.create()[1], 1)
+
+    def test_payment_being_initialized_is_409(self):
+        response, calls = self.create()
+        self.assertEqual((response.status_code, calls), (409, 0))
+        self.assertEqual(response.data['payment_id'], self.payment.pk)
+        self.assertEqual(response['Retry-After'], '1')
+
+    def test_idempotency_key(self):
+        self.payment.delete()
+        first, _ = self.create(**{'Idempotency-Key': 'key-1'})
+        response, calls = self.create(**{'Idempotency-Key': 'key-1'})
+        self.assertEqual((response.status_code, calls), (200, 0))
+        self.assertEqual(response.data['payment_id'], first.data['payment_id'])
+        other = Device.objects.create(owner=self.user, name='iphone', imei='350000000000002', price=100)
+        self.assertEqual(self.create(other, **{'Idempotency-Key': 'key-1'})[0].status_code, 422)
+        Payment.objects.filter(pk=first.data['payment_id']).update(status=Payment.STATUS_FAILED)
+        self.assertEqual(self.create(**{'Idempotency-Key': 'key-1'})[0].status_code, 409)
+
+    def test_gateway_errors_fail_the_payment(self):
+        self.payment.delete()
+        response, _ = self.create(result={'side_effect': requests.ConnectionError('down')})
+        self.assertEqual(response.status_code, 502)
+        response, _ = self.create(result={'side_effect': GatewayUnavailable('sslcommerz', 12.5)})
+        self.assertEqual((response.status_code, response['Retry-After']), (503, '13'))
+        self.assertEqual(set(Payment.objects.values_list('status', flat=True)), {Payment.STATUS_FAILED})
+
+    def test_validation(self):
+        other = User.objects.create_user('other@example.com', 'secret123')
+        foreign = Device.objects.create(owner=other, name='pixel', imei='350000000000009', price=100)
+        self.assertEqual(self.create(foreign)[0].status_code, 400)
+        Device.objects.filter(pk=self.device.pk).update(is_authorized=True)
+        self.assertEqual(self.create()[0].status_code, 400)
+
+
+class PaymentsListTests(PaymentTestCase, APITestCase):
+    url = '/api/v1/payments/list/'
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+
+    def test_if_none_match(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.assertNumQueries(1):  # the aggregate, no page
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        transition_payment(self.payment, Payment.STATUS_FAILED)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_inserts_and_deletes_change_the_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        other = Payment.objects.create(user=self.user, device=self.device, amount=Decimal('15.00'))
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        etag = self.client.get(self.url)['ETag']
+        other.delete()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_embedded_devices_count_when_expanded(self):
+        url = self.url + '?expand=device'
+        etag = self.client.get(url)['ETag']
+        self.device.name = 'galaxy'
+        self.device.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['device']['name'], 'galaxy')
+
+    def test_etag_depends_on_the_query_and_the_user(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(self.url + '?status=success', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.client.force_authenticate(User.objects.create_user('other@example.com', 'secret123'))
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_sparse_fields_and_expand(self):
+        response = self.client.get(self.url + '?fields=id,status')
+        self.assertEqual(response.data['results'], [{'id': self.payment.pk, 'status': Payment.STATUS_PENDING}])
+        response = self.client.get(self.url + '?fields=id,device&expand=device')
+        self.assertEqual(response.data['results'][0]['device']['imei'], '350000000000001')
+
+
+class PaymentExportTests(PaymentTestCase, APITestCase):
+    def test_status_filter(self):
+        Payment.objects.create(user=self.user, device=self.device, amount=Decimal('20.00'), status=Payment.STATUS_SUCCESS)
+        self.client.force_authenticate(User.objects.create_user('staff@example.com', 'secret123', is_staff=True))
+        response = self.client.get('/api/v1/payments/export/?status=success')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'id,user_id,device_id,amount,status,transaction_id,created_at,updated_at')
+        self.assertEqual(len(lines), 2)
+        self.assertIn(',20.00,success,', lines[1])
+
+
+def http_response(status_code):
+    response = requests.Response()
+    response.status_code = status_code
+    response.raw = io.BytesIO()
+    return response
+
+
+class TransportTests(SimpleTestCase):
+    url = 'https://gateway.example.com/api'
+
+    def setUp(self):
+        self.transport = GatewayTransport(max_retries=2, backoff=0, failure_threshold=3, reset_timeout=30)
+        self.send = self.enterContext(mock.patch.object(self.transport.session, 'request'))
+
+    def test_idempotent_requests_are_retried(self):
+        self.send.side_effect = [http_response(503), requests.ReadTimeout(), http_response(200)]
+        self.assertEqual(self.transport.get(self.url).status_code, 200)
+        self.assertEqual(self.send.call_count, 3)
+        self.assertEqual(self.transport.stats()['counters'], {'requests': 3, 'errors': 2, 'retries': 2,
+                                                             'short_circuited': 0})
+
+    def test_post_is_retried_only_when_it_never_left(self):
+        self.send.side_effect = requests.ReadTimeout()
+        with self.assertRaises(requests.ReadTimeout):
+            self.transport.post(self.url)
+        self.assertEqual(self.send.call_count, 1)
+
+        self.send.reset_mock()
+        self.send.side_effect = [requests.ConnectTimeout(), http_response(200)]
+        self.assertEqual(self.transport.post(self.url).status_code, 200)
+        self.assertEqual(self.send.call_count, 2)
+
+        self.send.reset_mock()
+        self.send.side_effect = [http_response(503)]
+        self.assertEqual(self.transport.post(self.url).status_code, 503)
+
+    def test_default_timeouts(self):
+        self.send.return_value = http_response(200)
+        self.transport.get(self.url)
+        self.assertEqual(self.send.call_args.kwargs['timeout'], (3.05, 10.0))
+
+    def test_circuit_opens_and_fails_fast(self):
+        self.send.return_value = http_response(500)
+        with self.assertLogs('payments.adapters.transport', 'WARNING'):
+            for _ in range(3):
+                self.transport.post(self.url)
+        with self.assertRaises(GatewayUnavailable) as raised:
+            self.transport.post(self.url)
+        self.assertEqual(self.send.call_count, 3)
+        self.assertGreater(raised.exception.retry_after, 29)
+        self.assertEqual(self.transport.stats()['circuits']['gateway.example.com']['state'], CircuitBreaker.OPEN)
+        # other hosts keep their own circuit
+        self.assertEqual(self.transport.post('https://other.example.com/').status_code, 500)
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def test_half_open_lets_one_trial_through(self):
+        breaker = CircuitBreaker('gateway', failure_threshold=1, reset_timeout=30)
+        with self.assertLogs('payments.adapters.transport', 'WARNING'):
+            breaker.record_failure()
+        with mock.patch('payments.adapters.transport.time.monotonic', return_value=breaker._opened_at + 31):
+            breaker.before_request()
+            self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+            with self.assertRaises(GatewayUnavailable):
+                breaker.before_request()
+            breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        breaker.before_request()
+
+    def test_failed_trial_reopens(self):
+        breaker = CircuitBreaker('gateway', failure_threshold=5, reset_timeout=30)
+        breaker.state, breaker._opened_at = CircuitBreaker.OPEN, 0
+        breaker.before_request()
+        with self.assertLogs('payments.adapters.transport', 'WARNING'):
+            breaker.record_failure()
+        self.assertEqual(breaker.snapshot(), {'state': CircuitBreaker.OPEN, 'consecutive_failures': 1,
+                                              'times_opened': 1})
+        with self.assertRaises(GatewayUnavailable):
+            breaker.before_request()
+
+
+@override_settings(PAYMENT_VALIDATE_IPN=True)
+class WebhookTests(PaymentTestCase, APITestCase):
+    def test_webhook_stores_the_event_and_the_drain_applies_it(self):
+        payload = {'tran_id': str(self.payment.pk), 'status': 'VALID', 'val_id': 'val-1'}
+        for _ in range(2):
+            self.assertEqual(self.client.post('/api/v1/payments/webhook/', payload).status_code, 200)
+        self.assertEqual(Payment.objects.get(pk=self.payment.pk).status, Payment.STATUS_PENDING)
+
+        with self.validation():
+            self.assertEqual(drain_inbox(), 2)
+        self.assertEqual(Payment.objects.get(pk=self.payment.pk).status, Payment.STATUS_SUCCESS)
+        self.assertTrue(Device.objects.get(pk=self.device.pk).is_authorized)
+        self.assertEqual(WebhookEvent.objects.filter(status=WebhookEvent.STATUS_DONE).count(), 2)
+        self.assertEqual(drain_inbox(), 0)
+
+    def test_invalid_events_are_not_retried(self):
+        self.event(tran_id='999999')
+        with self.assertLogs('payments.webhooks', 'WARNING'):
+            self.assertEqual(drain_inbox(), 1)
+        self.assertEqual(WebhookEvent.objects.get().status, WebhookEvent.STATUS_FAILED)
+
+    def test_validation_call_holds_no_transaction(self):
+        self.event()
+        depth = len(connection.savepoint_ids)
+        seen = []
+
+        def validate(val_id):
+            seen.append(len(connection.savepoint_ids))
+            return {'status': 'VALID', 'amount': '15.00', 'tran_id': str(self.payment.pk)}
+
+        with mock.patch.object(SSLCommerzAdapter, 'validate', side_effect=validate):
+            drain_inbox()
+        self.assertEqual(seen, [depth])
+
+    def test_missing_tran_id(self):
+        self.assertEqual(self.client.post('/api/v1/payments/webhook/', {'status': 'VALID'}).status_code, 400)
+
+
+@override_settings(PAYMENT_VALIDATE_IPN=True)
+class WebhookRetryTests(PaymentTestCase):
+    def setUp(self):
+        super().setUp()
+        self.event_id = self.event().pk
+
+    def drain_with_the_gateway_down(self, error=None):
+        with self.validation(side_effect=error or requests.ConnectionError('refused')) as validate, \
+                self.assertLogs('payments.webhooks', 'WARNING'):
+            handled = drain_inbox()
+        return handled, validate
+
+    def make_due(self):
+        WebhookEvent.objects.filter(pk=self.event_id).update(next_attempt_at=timezone.now())
+
+    def test_failures_back_off_exponentially(self):
+        for attempt, delay in ((1, 10), (2, 20), (3, 40)):
+            started = timezone.now()
+            self.assertEqual(self.drain_with_the_gateway_down()[0], 0)
+            event = WebhookEvent.objects.get(pk=self.event_id)
+            self.assertEqual((event.status, event.attempts), (WebhookEvent.STATUS_PENDING, attempt))
+            self.assertIn('refused', event.last_error)
+            waited = (event.next_attempt_at - started).total_seconds()
+            self.assertTrue(delay * 0.75 <= waited <= delay * 1.25 + 1, waited)
+            # not due yet: nothing claimed, the gateway not asked again
+            with self.validation() as validate:
+                self.assertEqual(drain_inbox(), 0)
+            self.assertFalse(validate.called)
+            self.make_due()
+
+        with self.validation():
+            self.assertEqual(drain_inbox(), 1)
+        event = WebhookEvent.objects.get(pk=self.event_id)
+        self.assertEqual((event.status, event.attempts, event.last_error), (WebhookEvent.STATUS_DONE, 4, ''))
+
+    def test_given_up_after_the_last_attempt(self):
+        WebhookEvent.objects.filter(pk=self.event_id).update(attempts=WEBHOOK_MAX_ATTEMPTS - 1)
+        with self.validation(side_effect=requests.ConnectionError('refused')), \
+                self.assertLogs('payments.webhooks', 'ERROR'):
+            self.assertEqual(drain_inbox(), 1)
+        event = WebhookEvent.objects.get(pk=self.event_id)
+        self.assertEqual((event.status, event.attempts), (WebhookEvent.STATUS_FAILED, WEBHOOK_MAX_ATTEMPTS))
+        self.assertIsNotNone(event.processed_at)
+
+    def test_open_circuit_delays_the_retry(self):
+        started = timezone.now()
+        self.drain_with_the_gateway_down(GatewayUnavailable('gateway.example.com', 120))
+        event = WebhookEvent.objects.get(pk=self.event_id)
+        self.assertGreaterEqual(event.next_attempt_at, started + timedelta(seconds=120))
+
+    def test_claimed_events_are_leased(self):
+        self.assertEqual([event.pk for event in _claim(10)], [self.event_id])
+        # another worker finds nothing until the lease runs out
+        self.assertEqual(_claim(10), [])
+        WebhookEvent.objects.filter(pk=self.event_id).update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(_claim(10)[0].attempts, 2)
+
+    def test_background_drain_wakes_up_for_the_next_retry(self):
+        self.drain_with_the_gateway_down()
+        with mock.patch('payments.webhooks.threading.Timer') as timer:
+            _schedule_retry()
+        delay = timer.call_args.args[0]
+        self.assertTrue(5 <= delay <= 13, delay)
+        timer.return_value.start.assert_called_once_with()
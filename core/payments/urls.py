@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import CreatePaymentView, PaymentWebhookView, PaymentSuccessView, PaymentFailView, PaymentCancelView,PaymentsListView
+from .views import CreatePaymentView, PaymentWebhookView, PaymentSuccessView, PaymentFailView, PaymentCancelView,PaymentsListView,PaymentExportView,GatewayMetricsView
 
 urlpatterns = [
     path('create/', CreatePaymentView.as_view(), name='payments-create'),
@@ -8,4 +8,6 @@ urlpatterns = [
     path('fail/', PaymentFailView.as_view(), name='payments-fail'),
     path('cancel/', PaymentCancelView.as_view(), name='payments-cancel'),
     path('list/', PaymentsListView.as_view(), name='payments-list'),
+    path('export/', PaymentExportView.as_view(), name='payments-export'),
+    path('gateway/metrics/', GatewayMetricsView.as_view(), name='payments-gateway-metrics'),
 ]
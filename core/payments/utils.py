@@ -0,0 +1,14 @@
+def filter_payments(queryset, params):
+    """
+    ?status=, ?device_id=, ?user_id= filters shared by the payment list and export
+    """
+    status_param = params.get('status')
+    if status_param:
+        queryset = queryset.filter(status=status_param)
+    device_id = params.get('device_id')
+    if device_id:
+        queryset = queryset.filter(device_id=device_id)
+    user_id = params.get('user_id')
+    if user_id:
+        queryset = queryset.filter(user_id=user_id)
+    return queryset
@@ -5,14 +5,22 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from django.conf import settings
+from django.db import IntegrityError, transaction
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from .serializers import CreatePaymentSerializer,PaymentDetailSerializer
 from .models import Payment
-from .services import get_adapter
-from imei_authorization.models import AuthorizedIMEI
+from .services import (fail_payment, get_adapter, lock_device, remember_gateway_session, reusable_payment,
+                       session_is_open)
+from .webhooks import enqueue_webhook
+from .adapters.transport import GatewayUnavailable, get_transport
+from .utils import filter_payments
 from decimal import Decimal
+import os
 from core.permissions import IsAdmin, IsStaff
+from core.conditional import not_modified, queryset_etag, with_validators
+from core.serializers import sparse_options, sparse_only
+from core.export import ExportAPIView
 # import logging
 
 # logger = logging.getLogger(__name__)
@@ -22,18 +30,47 @@ class CreatePaymentView(generics.CreateAPIView):
     Create payment record and initialize provider (SSLCommerz).
     Request body: { "device_id": <id> }
     Response: { payment_id, amount, payment_url }
+    A pending payment of the same device whose gateway session is still open
+    (PAYMENT_SESSION_TTL) is returned again instead of opening a new session,
+    so double clicks and retries do not call the gateway. While another request
+    is still initializing one the answer is 409; the device row lock makes
+    concurrent requests check and create one after the other.
+    With an Idempotency-Key header a repeated request returns the payment created
+    by the first one, 409 while that one is still in flight or no longer payable.
     """
     serializer_class = CreatePaymentSerializer
     permission_classes = [IsAuthenticated]
 
     def post(self, request, *args, **kwargs):
+        idempotency_key = request.headers.get('Idempotency-Key', '').strip()[:255] or None
+        if idempotency_key:
+            payment = Payment.objects.filter(user=request.user, idempotency_key=idempotency_key).first()
+            if payment is not None:
+                return self._replay(payment, request.data.get('device_id'))
+
         serializer = self.get_serializer(data=request.data, context={'request': request})
         if not serializer.is_valid():
             return Response({"detail": "Validation failed", "errors": serializer.errors},
                             status=status.HTTP_400_BAD_REQUEST)
-        payment = serializer.save()
-        # Refetch with select_related 
-        payment = Payment.objects.select_related('user', 'device').get(id=payment.id)
+        device = serializer.validated_data['device']
+        amount = Payment.calculate_fee_for_device(device)
+        try:
+            with transaction.atomic():
+                lock_device(device)
+                existing = reusable_payment(request.user, device, amount)
+                if existing is None:
+                    payment = serializer.save(amount=amount, idempotency_key=idempotency_key)
+        except IntegrityError:
+            if idempotency_key is None:
+                raise
+            # a concurrent request with the same Idempotency-Key won
+            payment = Payment.objects.get(user=request.user, idempotency_key=idempotency_key)
+            return self._replay(payment, device.pk)
+        if existing is not None:
+            if existing.gateway_url:
+                return self._session_response(existing, reused=True)
+            return self._in_progress(existing, "A payment for this device is being initialized")
+        # user and device are the instances loaded above, no refetch
 
         adapter = get_adapter('sslcommerz')
 
@@ -48,82 +85,75 @@ class CreatePaymentView(generics.CreateAPIView):
 
         try:
             res = adapter.init_payment(payment, return_urls=return_urls, ipn_url=ipn_url)
+        except GatewayUnavailable as e:
+            # circuit open, the gateway was not called
+            fail_payment(payment)
+            response = Response({"detail": "Payment gateway temporarily unavailable", "error": str(e)},
+                                status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            response['Retry-After'] = str(int(e.retry_after) + 1)
+            return response
         except Exception as e:
             # logger.exception("SSLCommerz init error")
-            payment.status = Payment.STATUS_FAILED
-            payment.save()
+            fail_payment(payment)
             return Response({"detail": "Failed to initialize payment", "error": str(e)},
                             status=status.HTTP_502_BAD_GATEWAY)
 
         # if provider returns success
         if res.get('status') == 'SUCCESS' and res.get('GatewayPageURL'):
-            return Response({
-                "payment_id": payment.id,
-                "amount": str(payment.amount),
-                "payment_url": res.get('GatewayPageURL'),
-                "raw": res  #we will remove in prod
-            })
+            remember_gateway_session(payment, res['GatewayPageURL'])
+            response = self._session_response(payment)
+            response.data["raw"] = res  #we will remove in prod
+            return response
         else:
-            payment.status = Payment.STATUS_FAILED
-            payment.save()
+            fail_payment(payment)
             return Response({"detail": "Payment initialization failed", "provider_response": res}, status=400)
 
+    @staticmethod
+    def _session_response(payment, reused=False):
+        return Response({
+            "payment_id": payment.id,
+            "amount": str(payment.amount),
+            "payment_url": payment.gateway_url,
+            "reused": reused,
+        })
+
+    @staticmethod
+    def _in_progress(payment, detail):
+        response = Response({"detail": detail, "payment_id": payment.id}, status=status.HTTP_409_CONFLICT)
+        response['Retry-After'] = '1'
+        return response
+
+    def _replay(self, payment, device_id):
+        """
+        response to a repeated Idempotency-Key
+        """
+        if str(payment.device_id) != str(device_id):
+            return Response({"detail": "Idempotency-Key was used for another device"},
+                            status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        if session_is_open(payment):
+            return self._session_response(payment, reused=True)
+        if payment.status == Payment.STATUS_PENDING and not payment.gateway_url:
+            return self._in_progress(payment, "A request with this Idempotency-Key is in progress")
+        return Response({"detail": "Idempotency-Key was already used", "payment_id": payment.id,
+                         "status": payment.status}, status=status.HTTP_409_CONFLICT)
+
 
 @method_decorator(csrf_exempt, name='dispatch')
 class PaymentWebhookView(APIView):
     """
     Endpoint to receive SSLCommerz IPN/webhook.
     SSLCommerz will POST to this endpoint. No authentication (AllowAny).
+    The notification is stored in the WebhookEvent inbox and acknowledged right away,
+    the payment / device updates are applied in the background (payments/webhooks.py).
     """
     permission_classes = [AllowAny]
     throttle_classes = []  # Disable throttling for webhook (external service)
 
     def post(self, request, *args, **kwargs):
-        data = request.data or request.POST.dict()
-        adapter = get_adapter('sslcommerz')
-        info = adapter.verify_payload(data)
-        tran_id = info.get('tran_id')
-        status_received = (info.get('status') or '').upper()
-        # print("===============================accesed webhook=====================================")
-
-        if not tran_id:
-            # logger.warning("Webhook without tran_id: %s", data)
+        event = enqueue_webhook(request.data or request.POST)
+        if event is None:
             return Response({"detail": "tran_id missing"}, status=400)
-
-        try:
-            payment = Payment.objects.select_related('device').get(id=tran_id)
-        except Payment.DoesNotExist:
-            # logger.warning("Webhook for unknown payment %s", tran_id)
-            return Response({"detail": "payment not found"}, status=404)
-
-        # Idempotent handling: if already success, ignore
-        if payment.status == Payment.STATUS_SUCCESS:
-            return Response({"detail": "already processed"}, status=200)
-
-        # SSLCommerz indicates 'VALID' for success in IPN, sometimes 'FAILED' otherwise
-        if status_received in ('VALID', 'SUCCESS'):
-            payment.status = Payment.STATUS_SUCCESS
-            payment.transaction_id = info.get('val_id') or data.get('tran_id') or ''
-            payment.save()
-
-            # authorize device and add IMEI
-            device = payment.device
-            device.is_authorized = True
-            device.save()
-            if device.imei:
-                AuthorizedIMEI.objects.get_or_create(imei=device.imei)
-
-            print("payment confirmed, device authorized status done")
-
-            return Response({"detail": "payment confirmed, device authorized"}, status=200)
-
-        else:
-            payment.status = Payment.STATUS_FAILED
-            payment.transaction_id = info.get('val_id') or data.get('tran_id') or ''
-            payment.save()
-            return Response({"detail": "payment failed"}, status=200)
-
-
+        return Response({"detail": "received", "event_id": event.id}, status=200)
 
 
 class PaymentSuccessView(generics.GenericAPIView):
@@ -143,11 +173,27 @@ class PaymentCancelView(generics.GenericAPIView):
 
 
 
+class GatewayMetricsView(APIView):
+    """
+    Admins and Staff only.
+    Payment gateway HTTP metrics of the worker process answering the request:
+    request / error / retry / short circuit counters, latency percentiles,
+    circuit breaker state per gateway host and connection pool usage.
+    """
+    permission_classes = [IsAuthenticated, (IsAdmin | IsStaff)]
+
+    def get(self, request):
+        return Response({'pid': os.getpid(), **get_transport().stats()}, status=200)
+
+
 class PaymentsListView(generics.ListAPIView):
     """
     Admins and Staff can view all payments.
     User can view their payments
     Added filtering by status, user, or device.
+    Supports conditional GET, the ETag comes from one count / max(updated_at) query
+    (embedded devices included), so a 304 loads and serializes nothing.
+    ?fields=id,status,... and ?expand=device, only the needed columns are loaded.
     """
     serializer_class = PaymentDetailSerializer
     permission_classes = [IsAuthenticated]
@@ -155,17 +201,36 @@ class PaymentsListView(generics.ListAPIView):
     def get_queryset(self):
         user = self.request.user
         if user.is_superuser or user.is_staff:
-            queryset = Payment.objects.select_related('user', 'device').all()
+            queryset = Payment.objects.all()
         else:
-            queryset = Payment.objects.select_related('user', 'device').filter(user=user)  # regular users can see only their payments
-
-        status_param = self.request.query_params.get('status')
-        if status_param:
-            queryset = queryset.filter(status=status_param)
-        device_id = self.request.query_params.get('device_id')
-        if device_id:
-            queryset = queryset.filter(device_id=device_id)
-        user_id = self.request.query_params.get('user_id')
-        if user_id:
-            queryset = queryset.filter(user_id=user_id)
-        return queryset
+            queryset = Payment.objects.filter(user=user)  # regular users can see only their payments
+
+        queryset = filter_payments(queryset, self.request.query_params)
+        return sparse_only(queryset, self.get_serializer())
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.update(sparse_options(self.request))
+        return super().get_serializer(*args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        # validated before the page is loaded: count and newest updated_at of the listed payments
+        # (and of their devices when embedded), one aggregate query
+        related = ('device',) if 'device' in sparse_options(request).get('expand', ()) else ()
+        etag = queryset_etag(self.filter_queryset(self.get_queryset()), request.get_full_path(),
+                             request.user.pk, related=related)
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+        return with_validators(super().list(request, *args, **kwargs), etag)
+
+
+class PaymentExportView(ExportAPIView):
+    """
+    Admin and staff only.
+    Streams payments as CSV / NDJSON (?file_format=), filtered like the list by status, device_id and user_id.
+    """
+    export_name = 'payments'
+    export_columns = ('id', 'user_id', 'device_id', 'amount', 'status', 'transaction_id', 'created_at', 'updated_at')
+
+    def get_queryset(self):
+        return filter_payments(Payment.objects.all(), self.request.query_params)
@@ -0,0 +1,230 @@
+import logging
+import random
+import threading
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from core.background import BackgroundDrain
+from .models import Payment, PaymentNotification, WebhookEvent
+from .services import confirm_payment, fail_payment, get_adapter, record_notification
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_BATCH_SIZE = getattr(settings, 'PAYMENT_WEBHOOK_BATCH_SIZE', 50)
+WEBHOOK_MAX_ATTEMPTS = getattr(settings, 'PAYMENT_WEBHOOK_MAX_ATTEMPTS', 10)
+# retry n waits RETRY_BACKOFF * 2**(n-1) seconds (+-25%), at most RETRY_BACKOFF_MAX
+RETRY_BACKOFF = getattr(settings, 'PAYMENT_WEBHOOK_RETRY_BACKOFF', 10)
+RETRY_BACKOFF_MAX = getattr(settings, 'PAYMENT_WEBHOOK_RETRY_BACKOFF_MAX', 1800)
+# seconds a worker may spend on a claimed batch before another worker takes it over
+WEBHOOK_LEASE = getattr(settings, 'PAYMENT_WEBHOOK_LEASE', 600)
+
+
+class InvalidEvent(Exception):
+    """
+    the event can never be applied (unknown payment, ...), it is not retried
+    """
+
+
+def _payload(data):
+    # form posts arrive as a QueryDict, keep the last value per key like request.POST.dict()
+    return data.dict() if hasattr(data, 'dict') else dict(data)
+
+
+def enqueue_webhook(data, provider='sslcommerz'):
+    """
+    Store one notification in the inbox, one INSERT and nothing else.
+    Returns None when the payload has no tran_id (not worth keeping).
+    """
+    payload = _payload(data)
+    info = get_adapter(provider).verify_payload(payload)
+    tran_id = info.get('tran_id')
+    if not tran_id:
+        return None
+    event = WebhookEvent.objects.create(provider=provider, tran_id=str(tran_id)[:255], payload=payload)
+    transaction.on_commit(schedule_drain)
+    return event
+
+
+def _check_validation(adapter, payment, val_id):
+    """
+    Confirm a success notification with the gateway's validation API (PAYMENT_VALIDATE_IPN),
+    so a forged POST to the webhook cannot authorize a device.
+    Transport errors propagate and the event is retried.
+    """
+    if not val_id:
+        raise InvalidEvent("success notification without val_id")
+    result = adapter.validate(val_id)
+    if (result.get('status') or '').upper() not in ('VALID', 'VALIDATED'):
+        raise InvalidEvent(f"val_id {val_id!r} rejected by the gateway: {result.get('status')}")
+    try:
+        amount = Decimal(str(result.get('amount')))
+    except InvalidOperation:
+        amount = None
+    if str(result.get('tran_id')) != str(payment.pk) or amount != payment.amount:
+        raise InvalidEvent(f"val_id {val_id!r} does not match payment {payment.pk}")
+
+
+def apply_event(event):
+    """
+    Apply one notification to its payment.
+    The gateway's validation API is called before the transaction that records the
+    notification and moves the payment, so no lock is held during the round trip.
+    Replays are dropped by the (payment, val_id) key, the transition itself is a
+    compare and set (payments.services.transition_payment), so concurrent
+    notifications for the same payment cannot both apply.
+    Returns a short outcome for the logs.
+    """
+    adapter = get_adapter(event.provider)
+    info = adapter.verify_payload(event.payload)
+    status_received = (info.get('status') or '').upper()
+    val_id = info.get('val_id') or ''
+    try:
+        payment = Payment.objects.select_related('device').get(id=event.tran_id)
+    except (Payment.DoesNotExist, ValueError):
+        raise InvalidEvent(f"payment {event.tran_id!r} not found")
+
+    # SSLCommerz indicates 'VALID' for success in IPN, sometimes 'FAILED' otherwise
+    succeeded = status_received in ('VALID', 'SUCCESS')
+    if succeeded and getattr(settings, 'PAYMENT_VALIDATE_IPN', True):
+        if val_id and PaymentNotification.objects.filter(payment_id=payment.pk, val_id=val_id[:255]).exists():
+            # a replay, not worth a validation call
+            return 'duplicate notification'
+        _check_validation(adapter, payment, val_id)
+
+    with transaction.atomic():
+        if not record_notification(payment, val_id, status_received):
+            return 'duplicate notification'
+        if succeeded:
+            if confirm_payment(payment, val_id):
+                return 'payment confirmed, device authorized'
+        elif fail_payment(payment, val_id or event.tran_id):
+            return 'payment failed'
+        return f'ignored, payment is {payment.status}'
+
+
+def retry_delay(attempts):
+    delay = min(RETRY_BACKOFF * 2 ** (attempts - 1), RETRY_BACKOFF_MAX)
+    return delay * random.uniform(0.75, 1.25)
+
+
+def _claim(batch_size):
+    """
+    Lease up to batch_size due events to this worker and commit, so no lock is held
+    while they are validated and applied. An event whose lease ran out (the worker
+    died) is due again.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(WebhookEvent.objects.select_for_update(skip_locked=True)
+                   .filter(status=WebhookEvent.STATUS_PENDING, next_attempt_at__lte=now)
+                   .order_by('next_attempt_at', 'id').values_list('id', flat=True)[:batch_size])
+        if ids:
+            WebhookEvent.objects.filter(pk__in=ids).update(
+                attempts=F('attempts') + 1, next_attempt_at=now + timedelta(seconds=WEBHOOK_LEASE))
+    return list(WebhookEvent.objects.filter(pk__in=ids).order_by('id')) if ids else []
+
+
+def drain_inbox(batch_size=None):
+    """
+    Lease up to batch_size due events and apply them.
+
+    The rows are claimed with SELECT ... FOR UPDATE SKIP LOCKED in a short transaction,
+    so any number of workers can drain concurrently without taking the same event twice.
+    Each event is then applied in its own transaction (apply_event), its stats deltas
+    are applied when that one commits (stats.services). An event that fails with a
+    transient error (gateway down, database locked, ...) is retried after an exponential
+    backoff, until WEBHOOK_MAX_ATTEMPTS marks it failed, so an outage does not use up
+    its attempts at once. Events of a worker that died are due again after their lease,
+    replays of applied ones are dropped by apply_event.
+    Returns the number of events applied or given up, retries waiting for their turn
+    are not counted.
+    """
+    events = _claim(batch_size or WEBHOOK_BATCH_SIZE)
+    if not events:
+        return 0
+    done, handled = [], []
+    for event in events:
+        try:
+            outcome = apply_event(event)
+        except InvalidEvent as e:
+            event.status, event.last_error = WebhookEvent.STATUS_FAILED, str(e)
+            logger.warning("Webhook event %s dropped: %s", event.id, e)
+            handled.append(event)
+        except Exception as e:
+            event.last_error = repr(e)
+            if event.attempts >= WEBHOOK_MAX_ATTEMPTS:
+                event.status = WebhookEvent.STATUS_FAILED
+                logger.exception("Webhook event %s given up after %s attempts", event.id, event.attempts)
+            else:
+                # a gateway with an open circuit says when it is worth asking again
+                delay = max(retry_delay(event.attempts), getattr(e, 'retry_after', 0))
+                event.next_attempt_at = timezone.now() + timedelta(seconds=delay)
+                logger.warning("Webhook event %s failed (attempt %s), retry in %.0fs: %r",
+                               event.id, event.attempts, delay, e)
+            handled.append(event)
+        else:
+            done.append(event.pk)
+            logger.debug("Webhook event %s: %s", event.id, outcome)
+
+    now = timezone.now()
+    # the common case in one statement, bulk_update's CASE per row is slow on big batches
+    WebhookEvent.objects.filter(pk__in=done).update(
+        status=WebhookEvent.STATUS_DONE, last_error='', processed_at=now)
+    for event in handled:
+        if event.status != WebhookEvent.STATUS_PENDING:
+            event.processed_at = now
+        event.save(update_fields=['status', 'next_attempt_at', 'last_error', 'processed_at'])
+    return len(done) + sum(event.status != WebhookEvent.STATUS_PENDING for event in handled)
+
+
+def purge_events(older_than_days, chunk_size=5000):
+    """
+    delete handled (done / failed) events older than the given age, in chunks
+    """
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    handled = WebhookEvent.objects.exclude(status=WebhookEvent.STATUS_PENDING).filter(processed_at__lt=cutoff)
+    deleted = 0
+    while True:
+        ids = list(handled.values_list('pk', flat=True)[:chunk_size])
+        if not ids:
+            return deleted
+        deleted += WebhookEvent.objects.filter(pk__in=ids).delete()[0]
+
+
+# in process drain, so events are applied right away even without process_webhooks workers
+
+_retry_timer = None
+_retry_lock = threading.Lock()
+
+
+def _schedule_retry():
+    """
+    wake up for the earliest event waiting for a retry, nothing else would trigger a drain
+    """
+    global _retry_timer
+    due = (WebhookEvent.objects.filter(status=WebhookEvent.STATUS_PENDING)
+           .order_by('next_attempt_at').values_list('next_attempt_at', flat=True).first())
+    if due is None:
+        return
+    with _retry_lock:
+        if _retry_timer is not None:
+            _retry_timer.cancel()
+        _retry_timer = threading.Timer(max((due - timezone.now()).total_seconds(), 0.1), schedule_drain)
+        _retry_timer.daemon = True
+        _retry_timer.start()
+
+
+background_drain = BackgroundDrain(drain_inbox, 'webhook-drain', 'PAYMENT_WEBHOOK_INLINE', after=_schedule_retry)
+
+
+def schedule_drain():
+    """
+    Start a background drain unless one is already queued.
+    A burst of notifications is handled by a single drain running until the inbox is empty.
+    """
+    background_drain.schedule()
@@ -0,0 +1,8 @@
+from django.contrib import admin
+
+# Register your models here.
+from .models import DeviceStat, PaymentStat, PaymentStatusStat
+
+admin.site.register(DeviceStat)
+admin.site.register(PaymentStat)
+admin.site.register(PaymentStatusStat)
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from stats.services import rebuild_device_stats, rebuild_payment_stats
+
+
+class Command(BaseCommand):
+    help = "Recompute the device and payment summary tables from the source tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', choices=['devices', 'payments'],
+                            help="rebuild one of the tables only")
+
+    def handle(self, *args, **options):
+        if options['only'] in (None, 'devices'):
+            self.stdout.write(f"device stats: {rebuild_device_stats()} rows")
+        if options['only'] in (None, 'payments'):
+            self.stdout.write(f"payment stats: {rebuild_payment_stats()} rows")
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from stats.services import reconcile_stats
+
+
+class Command(BaseCommand):
+    help = ("Correct summary rows that drifted from the device and payment tables (deltas lost with a "
+            "process that died right after its commit). Safe to run periodically next to live traffic.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--settle', type=float, default=None,
+                            help="seconds between the two reads of the drift (default STATS_RECONCILE_SETTLE)")
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"corrected {reconcile_stats(options['settle'])} summary rows")
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.4 on 2026-10-18 09:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeviceStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(choices=[('total', 'Total'), ('is_authorized', 'Authorization status'), ('os', 'OS'), ('type', 'Type')], max_length=20)),
+                ('value', models.CharField(blank=True, default='', max_length=50)),
+                ('count', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('dimension', 'value'), name='device_stat_dimension_value_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PaymentStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('status', models.CharField(max_length=10)),
+                ('count', models.BigIntegerField(default=0)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+            ],
+            options={
+                'ordering': ['-day', 'status'],
+                'constraints': [models.UniqueConstraint(fields=('day', 'status'), name='payment_stat_day_status_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,48 @@
+from django.db import migrations
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def populate(apps, schema_editor):
+    """
+    fill the summary tables for data that existed before them (same as rebuild_stats)
+    """
+    Device = apps.get_model('device', 'Device')
+    Payment = apps.get_model('payments', 'Payment')
+    DeviceStat = apps.get_model('stats', 'DeviceStat')
+    PaymentStat = apps.get_model('stats', 'PaymentStat')
+
+    stats = [DeviceStat(dimension='total', value='', count=Device.objects.count())]
+    for dimension in ('is_authorized', 'os', 'type'):
+        counts = {}
+        for group in Device.objects.order_by().values(dimension).annotate(count=Count('pk')):
+            value = group[dimension]
+            if dimension == 'is_authorized':
+                value = 'true' if value else 'false'
+            counts[value or ''] = counts.get(value or '', 0) + group['count']
+        stats.extend(DeviceStat(dimension=dimension, value=value, count=count) for value, count in counts.items())
+    DeviceStat.objects.bulk_create(stats)
+
+    groups = (Payment.objects.order_by().annotate(day=TruncDate('created_at'))
+              .values('day', 'status').annotate(count=Count('pk'), amount=Sum('amount')))
+    PaymentStat.objects.bulk_create(
+        [PaymentStat(day=group['day'], status=group['status'], count=group['count'], amount=group['amount'] or 0)
+         for group in groups], batch_size=1000)
+
+
+def clear(apps, schema_editor):
+    apps.get_model('stats', 'DeviceStat').objects.all().delete()
+    apps.get_model('stats', 'PaymentStat').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stats', '0001_initial'),
+        ('device', '0008_device_search'),
+        ('payments', '0002_alter_payment_created_at_alter_payment_status_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate, clear),
+    ]
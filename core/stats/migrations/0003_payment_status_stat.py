@@ -0,0 +1,38 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:08
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def populate(apps, schema_editor):
+    """
+    running totals from the existing per day rows
+    """
+    PaymentStat = apps.get_model('stats', 'PaymentStat')
+    PaymentStatusStat = apps.get_model('stats', 'PaymentStatusStat')
+    PaymentStatusStat.objects.bulk_create(
+        [PaymentStatusStat(status=group['status'], count=group['count'], amount=group['amount'] or 0)
+         for group in PaymentStat.objects.order_by().values('status').annotate(count=Sum('count'), amount=Sum('amount'))])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stats', '0002_populate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentStatusStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(max_length=10, unique=True)),
+                ('count', models.BigIntegerField(default=0)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+            ],
+            options={
+                'ordering': ['status'],
+            },
+        ),
+        migrations.RunPython(populate, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,66 @@
+from django.db import models
+
+
+class DeviceStat(models.Model):
+    """
+    device count per (dimension, value), e.g. ('os', 'android') -> 42.
+    ('total', '') holds the number of devices, None values are stored as ''.
+    """
+    DIMENSION_TOTAL = 'total'
+    DIMENSION_AUTHORIZED = 'is_authorized'
+    DIMENSION_OS = 'os'
+    DIMENSION_TYPE = 'type'
+
+    DIMENSION_CHOICES = [
+        (DIMENSION_TOTAL, 'Total'),
+        (DIMENSION_AUTHORIZED, 'Authorization status'),
+        (DIMENSION_OS, 'OS'),
+        (DIMENSION_TYPE, 'Type'),
+    ]
+
+    dimension = models.CharField(max_length=20, choices=DIMENSION_CHOICES)
+    value = models.CharField(max_length=50, blank=True, default='')
+    count = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['dimension', 'value'], name='device_stat_dimension_value_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.dimension}={self.value}: {self.count}"
+
+
+class PaymentStat(models.Model):
+    """
+    payment count and amount per creation day and current status
+    """
+    day = models.DateField()
+    status = models.CharField(max_length=10)
+    count = models.BigIntegerField(default=0)
+    amount = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ['-day', 'status']
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'status'], name='payment_stat_day_status_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.status}: {self.count} / {self.amount}"
+
+
+class PaymentStatusStat(models.Model):
+    """
+    payment count and amount per current status over all days,
+    the running totals behind the by-status part of the payment stats
+    """
+    status = models.CharField(max_length=10, unique=True)
+    count = models.BigIntegerField(default=0)
+    amount = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ['status']
+
+    def __str__(self):
+        return f"{self.status}: {self.count} / {self.amount}"
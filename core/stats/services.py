@@ -0,0 +1,236 @@
+import time
+from collections import Counter
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from core.transactions import defer_until_commit
+from device.models import Device
+from payments.models import Payment
+from .models import DeviceStat, PaymentStat, PaymentStatusStat
+
+DEVICE_TRACKED_FIELDS = ('is_authorized', 'os', 'type')
+PAYMENT_TRACKED_FIELDS = ('status', 'amount')
+
+def _increment(model, keys, **deltas):
+    """
+    atomic `col = col + delta` on the summary row, created on first use
+    """
+    changes = {name: F(name) + delta for name, delta in deltas.items()}
+    if model.objects.filter(**keys).update(**changes):
+        return
+    model.objects.bulk_create([model(**keys)], ignore_conflicts=True)
+    model.objects.filter(**keys).update(**changes)
+
+
+def _summed(counters):
+    total = Counter()
+    for counter in counters:
+        total.update(counter)
+    return total
+
+
+# devices
+
+def device_keys(is_authorized, os, type):
+    return [
+        (DeviceStat.DIMENSION_TOTAL, ''),
+        (DeviceStat.DIMENSION_AUTHORIZED, 'true' if is_authorized else 'false'),
+        (DeviceStat.DIMENSION_OS, os or ''),
+        (DeviceStat.DIMENSION_TYPE, type or ''),
+    ]
+
+
+def device_deltas(added=(), removed=()):
+    """
+    Counter of (dimension, value) -> delta for rows given as
+    (is_authorized, os, type) tuples, unchanged keys cancel out
+    """
+    deltas = Counter()
+    for row in added:
+        deltas.update(device_keys(*row))
+    for row in removed:
+        deltas.subtract(device_keys(*row))
+    return deltas
+
+
+def apply_device_deltas(deltas):
+    """
+    Called from the Device signals, and directly after bulk writes
+    (bulk_create, queryset.update) that do not send them.
+    The deltas of a transaction (of each of its savepoints) are summed and applied once
+    it commits, so the few summary rows every write touches ('total', ...) are locked for
+    one short UPDATE per key instead of from the first write until the end of each
+    writer's transaction. A process that dies between the commit and the flush loses
+    them, reconcile_stats() corrects that drift.
+    """
+    defer_until_commit('device_stats', deltas, _flush_device_deltas)
+
+
+def _flush_device_deltas(batch):
+    # keys in a fixed order so concurrent flushes cannot deadlock
+    with transaction.atomic():
+        for (dimension, value), delta in sorted(_summed(batch).items()):
+            if delta:
+                _increment(DeviceStat, {'dimension': dimension, 'value': value}, count=delta)
+
+
+# payments
+
+def payment_key(payment_or_row):
+    created_at = payment_or_row['created_at'] if isinstance(payment_or_row, dict) else payment_or_row.created_at
+    status = payment_or_row['status'] if isinstance(payment_or_row, dict) else payment_or_row.status
+    return timezone.localdate(created_at), status
+
+
+def apply_payment_change(previous, current):
+    """
+    previous / current: {'created_at', 'status', 'amount'} or None (created / deleted)
+    applied once the transaction commits, as apply_device_deltas
+    """
+    deltas = Counter()
+    amounts = Counter()
+    for row, sign in ((previous, -1), (current, 1)):
+        if row is None:
+            continue
+        key = payment_key(row)
+        deltas[key] += sign
+        amounts[key] += sign * Decimal(str(row['amount'] or 0))
+    defer_until_commit('payment_stats', (deltas, amounts), _flush_payment_deltas)
+
+
+def _flush_payment_deltas(batch):
+    deltas = _summed(deltas for deltas, _ in batch)
+    amounts = _summed(amounts for _, amounts in batch)
+    status_deltas, status_amounts = Counter(), Counter()
+    with transaction.atomic():
+        for (day, status), delta in sorted(deltas.items()):
+            if delta or amounts[(day, status)]:
+                _increment(PaymentStat, {'day': day, 'status': status}, count=delta, amount=amounts[(day, status)])
+                status_deltas[status] += delta
+                status_amounts[status] += amounts[(day, status)]
+        # running totals, so the all time by-status read does not sum every day
+        for status, delta in sorted(status_deltas.items()):
+            if delta or status_amounts[status]:
+                _increment(PaymentStatusStat, {'status': status}, count=delta, amount=status_amounts[status])
+
+
+# full rebuild and reconciliation, from the source tables
+
+def _device_counts():
+    """
+    (dimension, value) -> count of the devices table
+    """
+    rows = Counter()
+    for dimension in (DeviceStat.DIMENSION_AUTHORIZED, DeviceStat.DIMENSION_OS, DeviceStat.DIMENSION_TYPE):
+        for group in Device.objects.order_by().values(dimension).annotate(count=Count('pk')):
+            value = group[dimension]
+            if dimension == DeviceStat.DIMENSION_AUTHORIZED:
+                value = 'true' if value else 'false'
+            rows[(dimension, value or '')] += group['count']
+    rows[(DeviceStat.DIMENSION_TOTAL, '')] = Device.objects.count()
+    return rows
+
+
+def _payment_totals():
+    """
+    (day, status) -> (count, amount) of the payments table
+    """
+    groups = (Payment.objects.order_by().annotate(day=TruncDate('created_at'))
+              .values('day', 'status').annotate(count=Count('pk'), amount=Sum('amount')))
+    return {(group['day'], group['status']): (group['count'], group['amount'] or Decimal(0)) for group in groups}
+
+
+def rebuild_device_stats():
+    rows = _device_counts()
+    with transaction.atomic():
+        DeviceStat.objects.all().delete()
+        DeviceStat.objects.bulk_create(
+            [DeviceStat(dimension=dimension, value=value, count=count) for (dimension, value), count in rows.items()])
+    return len(rows)
+
+
+def rebuild_payment_stats():
+    stats = [PaymentStat(day=day, status=status, count=count, amount=amount)
+             for (day, status), (count, amount) in _payment_totals().items()]
+    totals = {}
+    for stat in stats:
+        total = totals.setdefault(stat.status, PaymentStatusStat(status=stat.status))
+        total.count += stat.count
+        total.amount += stat.amount
+    with transaction.atomic():
+        PaymentStat.objects.all().delete()
+        PaymentStat.objects.bulk_create(stats, batch_size=1000)
+        PaymentStatusStat.objects.all().delete()
+        PaymentStatusStat.objects.bulk_create(totals.values())
+    return len(stats)
+
+
+def _drift(actual, stored):
+    """
+    key -> (actual - stored) value tuples, for the keys that differ
+    """
+    drift = {}
+    for key in actual.keys() | stored.keys():
+        width = len(actual.get(key) or stored[key])
+        difference = tuple(a - b for a, b in zip(actual.get(key, (0,) * width), stored.get(key, (0,) * width)))
+        if any(difference):
+            drift[key] = difference
+    return drift
+
+
+def _device_drift():
+    actual = {key: (count,) for key, count in _device_counts().items()}
+    stored = {(dimension, value): (count,)
+              for dimension, value, count in DeviceStat.objects.values_list('dimension', 'value', 'count')}
+    return _drift(actual, stored)
+
+
+def _payment_drift():
+    actual = _payment_totals()
+    status_totals = {}
+    for (_, status), (count, amount) in actual.items():
+        total = status_totals.get(status, (0, Decimal(0)))
+        status_totals[status] = (total[0] + count, total[1] + amount)
+    stored = {(day, status): (count, amount)
+              for day, status, count, amount in PaymentStat.objects.values_list('day', 'status', 'count', 'amount')}
+    stored_totals = {status: (count, amount)
+                     for status, count, amount in PaymentStatusStat.objects.values_list('status', 'count', 'amount')}
+    return {**{('day', key): value for key, value in _drift(actual, stored).items()},
+            **{('status', key): value for key, value in _drift(status_totals, stored_totals).items()}}
+
+
+def _stable(read, settle):
+    # a flush still running after its commit shows up once, drift left by a lost one in both reads
+    first = read()
+    if not first:
+        return {}
+    time.sleep(settle)
+    return {key: value for key, value in read().items() if first.get(key) == value}
+
+
+def reconcile_stats(settle=None):
+    """
+    Correct the drift of the summary tables left by deltas that never ran (a process
+    killed between its commit and the after commit flush). Unlike the rebuild it is
+    safe next to live writers: the drift is read twice, `settle` seconds apart
+    (STATS_RECONCILE_SETTLE), only what did not change in between is applied, and it is
+    applied with the same increments as the flushes. Returns the number of corrected rows.
+    """
+    if settle is None:
+        settle = getattr(settings, 'STATS_RECONCILE_SETTLE', 5)
+    devices = _stable(_device_drift, settle)
+    payments = _stable(_payment_drift, settle)
+    with transaction.atomic():
+        for (dimension, value), (delta,) in sorted(devices.items()):
+            _increment(DeviceStat, {'dimension': dimension, 'value': value}, count=delta)
+        for (table, key), (delta, amount) in sorted(payments.items(), key=lambda item: (item[0][0], str(item[0][1]))):
+            if table == 'day':
+                _increment(PaymentStat, {'day': key[0], 'status': key[1]}, count=delta, amount=amount)
+            else:
+                _increment(PaymentStatusStat, {'status': key}, count=delta, amount=amount)
+    return len(devices) + len(payments)
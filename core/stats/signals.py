@@ -0,0 +1,64 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from device.models import Device
+from payments.models import Payment
+from .services import (DEVICE_TRACKED_FIELDS, PAYMENT_TRACKED_FIELDS, apply_device_deltas,
+                       apply_payment_change, device_deltas)
+
+
+def _previous(sender, instance, update_fields, tracked):
+    """
+    tracked column values as stored before this save, None for inserts and for
+    saves that cannot change them (update_fields without a tracked column)
+    """
+    if instance._state.adding or instance.pk is None:
+        return None
+    if update_fields is not None and not set(update_fields) & set(tracked):
+        return None
+    return sender._default_manager.filter(pk=instance.pk).values(*tracked).first()
+
+
+@receiver(pre_save, sender=Device)
+def device_before_save(sender, instance, update_fields=None, **kwargs):
+    instance._stats_previous = _previous(sender, instance, update_fields, DEVICE_TRACKED_FIELDS)
+
+
+@receiver(post_save, sender=Device)
+def device_saved(sender, instance, created, **kwargs):
+    current = (instance.is_authorized, instance.os, instance.type)
+    if created:
+        apply_device_deltas(device_deltas(added=[current]))
+        return
+    previous = instance.__dict__.pop('_stats_previous', None)
+    if previous is not None:
+        apply_device_deltas(device_deltas(added=[current], removed=[tuple(previous[f] for f in DEVICE_TRACKED_FIELDS)]))
+
+
+@receiver(post_delete, sender=Device)
+def device_deleted(sender, instance, **kwargs):
+    apply_device_deltas(device_deltas(removed=[(instance.is_authorized, instance.os, instance.type)]))
+
+
+@receiver(pre_save, sender=Payment)
+def payment_before_save(sender, instance, update_fields=None, **kwargs):
+    instance._stats_previous = _previous(sender, instance, update_fields, PAYMENT_TRACKED_FIELDS + ('created_at',))
+
+
+def _payment_row(payment):
+    return {'created_at': payment.created_at, 'status': payment.status, 'amount': payment.amount}
+
+
+@receiver(post_save, sender=Payment)
+def payment_saved(sender, instance, created, **kwargs):
+    if created:
+        apply_payment_change(None, _payment_row(instance))
+        return
+    previous = instance.__dict__.pop('_stats_previous', None)
+    if previous is not None and previous != _payment_row(instance):
+        apply_payment_change(previous, _payment_row(instance))
+
+
+@receiver(post_delete, sender=Payment)
+def payment_deleted(sender, instance, **kwargs):
+    apply_payment_change(_payment_row(instance), None)
@@ -0,0 +1,145 @@
+from decimal import Decimal
+from unittest import mock
+
+from django.db import transaction
+from rest_framework.test import APITestCase
+
+from accounts.models import User
+from device.models import Device
+from payments.models import Payment
+from payments.services import transition_payment
+from .models import DeviceStat, PaymentStat, PaymentStatusStat
+from .services import rebuild_device_stats, rebuild_payment_stats, reconcile_stats
+
+
+class StatsTestCase(APITestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user = User.objects.create_user('user@example.com', 'secret123')
+
+    def committed(self):
+        # TestCase never commits, run the on_commit callbacks of the block
+        return self.captureOnCommitCallbacks(execute=True)
+
+    def create_device(self, index, **fields):
+        return Device.objects.create(owner=self.user, name=f'device {index}', imei=str(350000000000000 + index),
+                                     price=100, **fields)
+
+
+class DeviceStatsTests(StatsTestCase):
+    def device_stats(self):
+        return dict(((stat.dimension, stat.value), stat.count) for stat in DeviceStat.objects.filter(count__gt=0))
+
+    def test_incremental_counts_match_a_rebuild(self):
+        with self.committed():
+            devices = [self.create_device(i, os='android' if i % 2 else 'ios') for i in range(5)]
+        with self.committed():
+            devices[0].is_authorized = True
+            devices[0].os = 'android'
+            devices[0].save()
+            devices[1].delete()
+        incremental = self.device_stats()
+        self.assertEqual(incremental[('total', '')], 4)
+        rebuild_device_stats()
+        self.assertEqual(self.device_stats(), incremental)
+
+    def test_deltas_wait_for_the_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.create_device(1)
+            self.create_device(2)
+        self.assertEqual(self.device_stats(), {})
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.device_stats()[('total', '')], 2)
+
+    def test_rolled_back_writes_are_not_counted(self):
+        with self.committed():
+            with transaction.atomic():
+                self.create_device(1)
+                with self.assertRaises(ZeroDivisionError), transaction.atomic():
+                    self.create_device(2)
+                    1 / 0
+        self.assertEqual(self.device_stats()[('total', '')], 1)
+
+    def test_reconcile_applies_lost_deltas(self):
+        with self.committed():
+            self.create_device(1, os='ios')
+        with self.captureOnCommitCallbacks():
+            # committed, the process died before the flush
+            self.create_device(2, os='android')
+        self.assertEqual(reconcile_stats(settle=0), 4)
+        self.assertEqual(self.device_stats(), {('total', ''): 2, ('is_authorized', 'false'): 2,
+                                               ('os', 'ios'): 1, ('os', 'android'): 1, ('type', ''): 2})
+        self.assertEqual(reconcile_stats(settle=0), 0)
+
+    def test_reconcile_leaves_flushes_in_flight_alone(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.create_device(1)
+
+        def flush(seconds):
+            for callback in callbacks:
+                callback()
+
+        with mock.patch('stats.services.time.sleep', side_effect=flush):
+            self.assertEqual(reconcile_stats(settle=1), 0)
+        self.assertEqual(self.device_stats()[('total', '')], 1)
+
+
+class PaymentStatsTests(StatsTestCase):
+    def setUp(self):
+        super().setUp()
+        with self.committed():
+            self.device = self.create_device(1)
+            self.payments = [Payment.objects.create(user=self.user, device=self.device, amount=Decimal('15.00'))
+                             for _ in range(4)]
+
+    def payment_stats(self):
+        return (sorted(PaymentStat.objects.values_list('day', 'status', 'count', 'amount')),
+                sorted(PaymentStatusStat.objects.values_list('status', 'count', 'amount')))
+
+    def test_transitions_match_a_rebuild(self):
+        with self.committed():
+            transition_payment(self.payments[0], Payment.STATUS_SUCCESS)
+            transition_payment(self.payments[1], Payment.STATUS_FAILED)
+            transition_payment(self.payments[1], Payment.STATUS_SUCCESS)
+            transition_payment(self.payments[2], Payment.STATUS_EXPIRED)
+            self.payments[3].delete()
+        incremental = self.payment_stats()
+        self.assertEqual(PaymentStatusStat.objects.get(status=Payment.STATUS_SUCCESS).amount, Decimal('30.00'))
+        rebuild_payment_stats()
+        # the rebuild leaves out statuses that dropped to zero
+        self.assertEqual(self.payment_stats(), tuple([row for row in rows if row[-2]] for rows in incremental))
+
+    def test_stats_view(self):
+        with self.committed():
+            transition_payment(self.payments[0], Payment.STATUS_SUCCESS)
+            staff = User.objects.create_user('staff@example.com', 'secret123', is_staff=True)
+        self.client.force_authenticate(staff)
+        response = self.client.get('/api/v1/stats/payments/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['by_status'], [
+            {'status': 'pending', 'count': 3, 'amount': '45.00'},
+            {'status': 'success', 'count': 1, 'amount': '15.00'},
+        ])
+        self.assertEqual(sum(row['count'] for row in response.data['by_day']), 4)
+
+    def test_reconcile_applies_lost_deltas(self):
+        with self.captureOnCommitCallbacks():
+            transition_payment(self.payments[0], Payment.STATUS_SUCCESS)
+            Payment.objects.create(user=self.user, device=self.device, amount=Decimal('5.00'))
+        reconcile_stats(settle=0)
+        reconciled = self.payment_stats()
+        rebuild_payment_stats()
+        self.assertEqual(self.payment_stats(), tuple([row for row in rows if row[-2]] for rows in reconciled))
+        self.assertEqual(PaymentStatusStat.objects.get(status=Payment.STATUS_PENDING).amount, Decimal('50.00'))
+
+    def test_invalid_dates_are_400(self):
+        self.client.force_authenticate(User.objects.create_user('staff@example.com', 'secret123', is_staff=True))
+        for query in ('until=2024-02-31', 'since=2024-13-01', 'since=yesterday', 'since=2024-02-02&until=2024-02-01'):
+            self.assertEqual(self.client.get(f'/api/v1/stats/payments/?{query}').status_code, 400, query)
+        response = self.client.get('/api/v1/stats/payments/?since=2024-02-01&until=2024-02-29')
+        self.assertEqual((response.status_code, str(response.data['until'])), (200, '2024-02-29'))
+
+    def test_stats_need_staff(self):
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get('/api/v1/stats/payments/').status_code, 403)
@@ -0,0 +1,7 @@
+from django.urls import path
+from .views import DeviceStatsView, PaymentStatsView
+
+urlpatterns = [
+    path('devices/', DeviceStatsView.as_view(), name='stats-devices'),
+    path('payments/', PaymentStatsView.as_view(), name='stats-payments'),
+]
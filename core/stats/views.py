@@ -0,0 +1,84 @@
+import datetime
+from decimal import Decimal
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from core.permissions import IsAdmin, IsStaff
+from .models import DeviceStat, PaymentStat, PaymentStatusStat
+
+DEFAULT_DAYS = 30
+
+
+def _date(value):
+    """
+    None when not given, ValueError for malformed (2024-1-x) and impossible (2024-02-31) dates
+    """
+    if not value:
+        return None
+    day = parse_date(value)
+    if day is None:
+        raise ValueError(value)
+    return day
+
+
+def _amount(value):
+    return str(Decimal(value or 0).quantize(Decimal('0.01')))
+
+
+class DeviceStatsView(APIView):
+    """
+    admin and staff only
+    device counts by authorization status, os and type, read from the summary table
+    """
+    permission_classes = [IsAuthenticated, (IsAdmin | IsStaff)]
+
+    def get(self, request):
+        data = {'total': 0, 'is_authorized': {'true': 0, 'false': 0}, 'os': [], 'type': []}
+        for stat in DeviceStat.objects.filter(count__gt=0).order_by('dimension', '-count', 'value'):
+            if stat.dimension == DeviceStat.DIMENSION_TOTAL:
+                data['total'] = stat.count
+            elif stat.dimension == DeviceStat.DIMENSION_AUTHORIZED:
+                data['is_authorized'][stat.value] = stat.count
+            else:
+                data[stat.dimension].append({stat.dimension: stat.value or None, 'count': stat.count})
+        return Response(data, status=status.HTTP_200_OK)
+
+
+class PaymentStatsView(APIView):
+    """
+    admin and staff only
+    payment counts and amounts by status (all time) and per day and status
+    for ?since=YYYY-MM-DD&until=YYYY-MM-DD (default: the last 30 days)
+    """
+    permission_classes = [IsAuthenticated, (IsAdmin | IsStaff)]
+
+    def get(self, request):
+        try:
+            until = _date(request.query_params.get('until')) or timezone.localdate()
+            since = _date(request.query_params.get('since')) or until - datetime.timedelta(days=DEFAULT_DAYS - 1)
+        except ValueError:
+            return Response({"detail": "since and until must be valid dates (YYYY-MM-DD)."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if since > until:
+            return Response({"detail": "since must not be after until."}, status=status.HTTP_400_BAD_REQUEST)
+
+        by_status = PaymentStatusStat.objects.filter(count__gt=0).order_by('status').values('status', 'count', 'amount')
+        by_day = (PaymentStat.objects.filter(day__range=(since, until), count__gt=0)
+                  .order_by('day', 'status').values('day', 'status', 'count', 'amount'))
+        return Response({
+            'by_status': [
+                {'status': row['status'], 'count': row['count'], 'amount': _amount(row['amount'])}
+                for row in by_status
+            ],
+            'since': since,
+            'until': until,
+            'by_day': [
+                {'day': row['day'], 'status': row['status'], 'count': row['count'], 'amount': _amount(row['amount'])}
+                for row in by_day
+            ],
+        }, status=status.HTTP_200_OK)